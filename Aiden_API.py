@@ -1,27 +1,793 @@
 import sys
 import re
 import json
+import gzip
+import hashlib
+import zlib
 import sqlite3
 import threading
-import tkinter as tk
+import queue
+import itertools
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from collections import OrderedDict, deque, Counter
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from email.message import EmailMessage
-import smtplib
-import ctypes
 import time
-import requests
+import random
+from urllib.parse import urlsplit
 
-BASE_DIR = Path(r"C:\AIAgent")
-MEMORY_DIR = BASE_DIR / "memory"
-SCRIPT_DIR = BASE_DIR / "scripts"
-LOG_DIR = BASE_DIR / "logs"
+BASE_DIR = Path(r"C:\AIAgent")  # Default agent directory; override on the command line
+
+# --- Provider HTTP client ---
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+class ProviderClient:
+    """
+    Shared HTTP client for the LLM providers.
+    Keeps one pooled keep-alive session per endpoint (scheme + host) and pool size so
+    repeated calls reuse TCP/TLS connections instead of handshaking on every turn.
+    Models sharing a host but configuring different 'pool_size' values each get their own pool.
+    """
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url: str, pool_size: int = None) -> "requests.Session":
+        # requests (with urllib3 and certifi) is most of the import time; load it on the first call
+        import requests
+        from requests.adapters import HTTPAdapter
+        parts = urlsplit(url)
+        size = pool_size or self.pool_size
+        key = (parts.scheme, parts.netloc, size)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                session.mount(f"{parts.scheme}://", HTTPAdapter(pool_connections=1, pool_maxsize=size))
+                self._sessions[key] = session
+            return session
+
+    def post(self, model_info: dict, url: str, headers: dict, payload: dict, stream: bool = False):
+        """
+        POST a JSON payload using the model's pool, timeouts and compression settings.
+        model_info keys: 'connect_timeout', 'read_timeout', 'pool_size', 'gzip'
+        """
+        timeout = (
+            model_info.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+            model_info.get("read_timeout", DEFAULT_READ_TIMEOUT),
+        )
+        headers = dict(headers)
+        body = json.dumps(payload).encode("utf-8")
+        if model_info.get("gzip"):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+            headers["Accept-Encoding"] = "gzip"
+        session = self.session_for(url, model_info.get("pool_size"))
+        return session.post(url, headers=headers, data=body, timeout=timeout, stream=stream)
+
+    def get(self, model_info: dict, url: str, headers: dict):
+        """GET with the model's pool and timeouts (metadata probes)."""
+        timeout = (
+            model_info.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+            model_info.get("read_timeout", DEFAULT_READ_TIMEOUT),
+        )
+        session = self.session_for(url, model_info.get("pool_size"))
+        return session.get(url, headers=headers, timeout=timeout)
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+# Shared by every hemisphere so connections are pooled process-wide
+provider_client = ProviderClient()
+
+# --- Streaming completions ---
+COMMAND_PATTERN = re.compile(r"\{\{?#(.+?)(?:#|\})\}\s*(.*?)(?:\{|\[)END_CMD(?:\}|\])")
+COMMAND_TERMINATOR = "END_CMD"
+
+class CommandStreamParser:
+    """
+    Incremental command parser for streamed completions.
+    The command regex is only re-run when a new END_CMD terminator (plus its closing
+    bracket) has arrived, so feeding a long generation stays linear.
+    stop_at_command: drop anything after the first command (False keeps the text of a batch)
+    """
+    def __init__(self, stop_at_command: bool = True):
+        self.stop_at_command = stop_at_command
+        self.text = ""
+        self.match = None
+        self._scan_from = 0
+
+    def feed(self, chunk: str) -> bool:
+        """Append a chunk; returns True once a complete command has arrived."""
+        if self.match and self.stop_at_command:
+            return True
+        self.text += chunk
+        if self.match:
+            return True
+        while True:
+            idx = self.text.find(COMMAND_TERMINATOR, self._scan_from)
+            if idx == -1:
+                self._scan_from = max(self._scan_from, len(self.text) - len(COMMAND_TERMINATOR))
+                return False
+            if idx + len(COMMAND_TERMINATOR) >= len(self.text):
+                self._scan_from = idx  # Closing bracket not here yet
+                return False
+            match = COMMAND_PATTERN.search(self.text)
+            if match:
+                self.match = match
+                if self.stop_at_command:
+                    self.text = self.text[:match.end()]
+                return True
+            self._scan_from = idx + 1
+
+SSE_READ_SIZE = 8192
+
+def iter_body_chunks(response):
+    """
+    Yield a streamed body's bytes as they arrive. iter_lines() reads fixed-size blocks, which on a body
+    without chunked encoding only return once the block is full, i.e. often not before the generation ends.
+    """
+    raw = response.raw
+    if getattr(raw, "chunked", False):
+        yield from response.iter_content(chunk_size=None)  # One piece per HTTP chunk
+    elif hasattr(raw, "read1"):
+        while True:
+            data = raw.read1(SSE_READ_SIZE, decode_content=True)
+            if not data:
+                return
+            yield data
+    else:
+        yield from response.iter_content(chunk_size=1)  # urllib3 1.x has no read1
+
+def iter_sse_data(response):
+    """Yield the data payload of each server-sent event until [DONE]."""
+    pending = b""
+    for chunk in iter_body_chunks(response):
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r").decode("utf-8", errors="replace")
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            yield data
+
+class StreamCancelled(Exception):
+    """A streamed response was abandoned through its cancel event; the partial text is not a reply."""
+
+def stream_completion(model_info, url, headers, payload, chunk_text, on_chunk=None, cancel=None, usage=None):
+    """
+    Stream a completion over SSE through a CommandStreamParser.
+    chunk_text: function extracting the new text from one decoded event
+    on_chunk: optional callback receiving each piece of text as it arrives
+    cancel: optional threading.Event; once set the stream is abandoned
+    usage: optional dict that receives the token counts if the stream reports them
+    Unless model_info['stop_on_command'] is false, the connection is closed as soon
+    as a full command has arrived, which cancels the rest of the generation.
+    Returns: str (text received, ending at the command terminator if one arrived)
+    Raises: StreamCancelled if cancel was set before the reply was complete
+    """
+    # A batching model sends several commands, so it is only cut off on request
+    stop_on_command = model_info.get("stop_on_command", model_info.get("max_batch", 1) <= 1)
+    parser = CommandStreamParser(stop_on_command)
+    response = provider_client.post(model_info, url, headers, payload, stream=True)
+    try:
+        response.raise_for_status()
+        for data in iter_sse_data(response):
+            event = json.loads(data)
+            read_usage(event, usage)
+            text = chunk_text(event)
+            if not text:
+                continue
+            received = len(parser.text)
+            done = parser.feed(text)
+            if on_chunk:
+                on_chunk(parser.text[received:])
+            if done and stop_on_command:
+                break
+            if cancel is not None and cancel.is_set():
+                raise StreamCancelled(f"stream cancelled after {len(parser.text)} chars")
+    finally:
+        response.close()
+    return parser.text
+
+def read_usage(data, usage: dict):
+    """Copy token counts from an OpenRouter 'usage' block or a TGI 'details' block into usage."""
+    if usage is None or not isinstance(data, dict):
+        return
+    block = data.get("usage")
+    if block:
+        usage["prompt_tokens"] = block.get("prompt_tokens", 0)
+        usage["completion_tokens"] = block.get("completion_tokens", 0)
+    details = data.get("details")
+    if details and "generated_tokens" in details:
+        usage["completion_tokens"] = details["generated_tokens"]
+
+def hf_chunk_text(event: dict) -> str:
+    token = event.get("token") or {}
+    if token.get("special"):
+        return ""
+    return token.get("text") or ""
+
+def openrouter_chunk_text(event: dict) -> str:
+    choices = event.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+# --- Response cache ---
+DEFAULT_CACHE_ENTRIES = 1000
+DEFAULT_CACHE_DB_ENTRIES = 10000
+DEFAULT_CACHE_TTL = 3600
+CACHE_KEY_FIELDS = ("provider", "model", "api_url", "parameters", "options")
+
+class ResponseCache:
+    """
+    Content-addressed cache of LLM responses, keyed by each endpoint's model, provider and parameters, and the prompt.
+    An in-memory LRU tier sits in front of an optional SQLite tier that survives restarts.
+    Entries expire after their TTL and each tier is bounded in size.
+    """
+    PRUNE_EVERY = 100  # SQLite tier size is enforced every N writes
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES, ttl: float = DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires, response)
+        self._lock = threading.Lock()
+        self.conn = None
+        self.db_max_entries = DEFAULT_CACHE_DB_ENTRIES
+        self._writes = 0
+
+    def open_db(self, db_path: Path, max_entries: int = DEFAULT_CACHE_DB_ENTRIES):
+        with self._lock:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.db_max_entries = max_entries
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT,
+                    expires REAL,
+                    last_used REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+            self.conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+            self.conn.commit()
+
+    @staticmethod
+    def make_key(model_info: dict, prompt) -> str:
+        # Every endpoint the router may pick, so entries that define their models under 'endpoints' never share replies
+        endpoints = [{name: endpoint.get(name) for name in CACHE_KEY_FIELDS} for endpoint in endpoints_for(model_info)]
+        fields = {"endpoints": endpoints, "prompt": prompt}
+        return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            if self.conn:
+                row = self.conn.execute(
+                    "SELECT response, expires FROM responses WHERE key = ? AND expires > ?", (key, now)
+                ).fetchone()
+                if row:
+                    self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self.conn.commit()
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: str, ttl: float = None):
+        now = time.time()
+        expires = now + (ttl or self.ttl)
+        with self._lock:
+            self._remember(key, expires, response)
+            if self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires, last_used) VALUES (?, ?, ?, ?)",
+                    (key, response, expires, now),
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self.conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+                    self.conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.db_max_entries,),
+                    )
+                self.conn.commit()
+
+    def _remember(self, key, expires, response):
+        self._entries[key] = (expires, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+def cache_enabled(model_info: dict) -> bool:
+    """Caching is opt-in per model ('cache': true), or automatic when temperature is 0."""
+    if "cache" in model_info:
+        return bool(model_info["cache"])
+    return (model_info.get("parameters") or {}).get("temperature") == 0
+
+# Shared by every hemisphere; main() attaches the SQLite tier when a model asks for it
+response_cache = ResponseCache()
+
+# --- LLM call scheduling ---
+class TokenBucket:
+    """Rate limiter: 'rate' calls per second with bursts of up to 'burst'."""
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class _Ticket:
+    __slots__ = ("provider", "granted")
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.granted = False
+
+class LLMScheduler:
+    """
+    Admission control for LLM calls, shared by every agent session in the process.
+    Enforces a global concurrency limit plus per-provider concurrency and rate limits.
+    Waiting calls are granted round-robin across sessions, so a busy session
+    (e.g. a wide parallel verification) can't starve the others.
+    provider_limits: {"openrouter": {"max_concurrency": 8, "rate": 5, "burst": 10}, ...}
+    """
+    def __init__(self, max_concurrency: int = None, provider_limits: dict = None):
+        self.max_concurrency = max_concurrency
+        self.provider_limits = provider_limits or {}
+        self.limited = bool(max_concurrency or self.provider_limits)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._active_by_provider = Counter()
+        self._waiting = OrderedDict()  # session -> deque of tickets, in round-robin order
+        self._buckets = {
+            provider: TokenBucket(limits["rate"], limits.get("burst"))
+            for provider, limits in self.provider_limits.items() if limits.get("rate")
+        }
+
+    @contextmanager
+    def slot(self, session, provider: str):
+        """Hold one call slot for 'session' against 'provider' for the duration of the block."""
+        if not self.limited:
+            yield
+            return
+        self._acquire(session, provider)
+        try:
+            yield
+        finally:
+            self._release(provider)
+
+    def _acquire(self, session, provider):
+        ticket = _Ticket(provider)
+        with self._cond:
+            self._waiting.setdefault(session, deque()).append(ticket)
+            while True:
+                retry_in = self._dispatch()
+                if ticket.granted:
+                    return
+                self._cond.wait(timeout=retry_in)
+
+    def _release(self, provider):
+        with self._cond:
+            self._active -= 1
+            self._active_by_provider[provider] -= 1
+            if self._dispatch() is not None:
+                # A call is now only rate-limited; wake waiters so they sleep on its timeout
+                self._cond.notify_all()
+
+    def _has_capacity(self, provider) -> bool:
+        if self.max_concurrency and self._active >= self.max_concurrency:
+            return False
+        limit = self.provider_limits.get(provider, {}).get("max_concurrency")
+        return not limit or self._active_by_provider[provider] < limit
+
+    def _dispatch(self):
+        """
+        Grant free slots, one session at a time in round-robin order.
+        Returns: seconds until a rate-limited call could go, or None
+        """
+        retry_in = None
+        granted = False
+        progress = True
+        while progress:
+            progress = False
+            for session in list(self._waiting):
+                tickets = self._waiting[session]
+                ticket = tickets[0]
+                if not self._has_capacity(ticket.provider):
+                    continue
+                bucket = self._buckets.get(ticket.provider)
+                wait = bucket.take() if bucket else 0.0
+                if wait:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                tickets.popleft()
+                ticket.granted = True
+                self._active += 1
+                self._active_by_provider[ticket.provider] += 1
+                if tickets:
+                    self._waiting.move_to_end(session)
+                else:
+                    del self._waiting[session]
+                granted = progress = True
+        if granted:
+            self._cond.notify_all()
+        return retry_in
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._active,
+                "active_by_provider": dict(self._active_by_provider),
+                "waiting": sum(len(tickets) for tickets in self._waiting.values()),
+            }
+
+# Unlimited unless a session manager configures one with limits
+llm_scheduler = LLMScheduler()
+
+# --- Metrics ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROUND_BUCKETS = (1, 2, 3, 4, 5, 6, 10)
+
+class Metrics:
+    """
+    In-process counters and histograms, shared by every agent session.
+    Exposed as Prometheus text (render_prometheus) and as a JSON snapshot (snapshot).
+    Series are keyed by metric name plus a sorted tuple of label pairs.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (kind, help, buckets)
+        self._series = {}  # name -> {labels: value, or [bucket counts, sum, count]}
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: tuple = None):
+        self._meta[name] = (kind, help_text, tuple(buckets or ()))
+        self._series.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[name][key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self._meta[name][2]
+        with self._lock:
+            series = self._series[name]
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self) -> dict:
+        """Returns: {name: {"type", "help", "series": [{"labels", "value"} or {"labels", "count", "sum", "buckets"}]}}"""
+        with self._lock:
+            result = {}
+            for name, (kind, help_text, buckets) in self._meta.items():
+                series = []
+                for key, value in self._series[name].items():
+                    if kind == "histogram":
+                        counts, total, count = value
+                        series.append({"labels": dict(key), "count": count, "sum": total,
+                                       "buckets": {str(b): c for b, c in zip(buckets, counts)}})
+                    else:
+                        series.append({"labels": dict(key), "value": value})
+                result[name] = {"type": kind, "help": help_text, "series": series}
+        return result
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, data in self.snapshot().items():
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            for series in data["series"]:
+                labels = series["labels"]
+                if data["type"] == "histogram":
+                    for bound, count in series["buckets"].items():
+                        lines.append(f"{name}_bucket{prometheus_labels(labels, le=bound)} {count}")
+                    lines.append(f"{name}_bucket{prometheus_labels(labels, le='+Inf')} {series['count']}")
+                    lines.append(f"{name}_sum{prometheus_labels(labels)} {series['sum']}")
+                    lines.append(f"{name}_count{prometheus_labels(labels)} {series['count']}")
+                else:
+                    lines.append(f"{name}{prometheus_labels(labels)} {series['value']}")
+        return "\n".join(lines) + "\n"
+
+def prometheus_labels(labels: dict, **extra) -> str:
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+# Process-wide registry; sessions hosted together report into the same series
+metrics = Metrics()
+metrics.describe("aiden_llm_request_seconds", "histogram", "Provider call latency by hemisphere and model.", LATENCY_BUCKETS)
+metrics.describe("aiden_llm_errors_total", "counter", "Provider calls that raised an error.")
+metrics.describe("aiden_llm_cache_hits_total", "counter", "LLM calls answered from the response cache.")
+metrics.describe("aiden_llm_prompt_tokens_total", "counter", "Prompt tokens reported by the provider.")
+metrics.describe("aiden_llm_completion_tokens_total", "counter", "Completion tokens reported by the provider.")
+metrics.describe("aiden_llm_retries_total", "counter", "Provider calls retried after a 429, 5xx or connection error.")
+metrics.describe("aiden_llm_hedges_total", "counter", "Hedged provider calls by winning request.")
+metrics.describe("aiden_endpoint_ewma_seconds", "gauge", "Smoothed latency of each endpoint.")
+metrics.describe("aiden_endpoint_circuit_open", "gauge", "1 while an endpoint's circuit breaker is open.")
+metrics.describe("aiden_agreement_rounds", "histogram", "Left LLM responses needed to settle one command.", ROUND_BUCKETS)
+metrics.describe("aiden_agreement_retries_total", "counter", "Left LLM retries after a disagreement.")
+metrics.describe("aiden_command_seconds", "histogram", "run_command execution time by verb.", LATENCY_BUCKETS)
+metrics.describe("aiden_speculation_total", "counter", "Read-only commands run during verification, by result (committed, discarded).")
+metrics.describe("aiden_batch_size", "histogram", "Commands in one batched right LLM response.", ROUND_BUCKETS)
+metrics.describe("aiden_mail_messages_total", "counter", "Outbound mail attempts by result (sent, retry, failed).")
+metrics.describe("aiden_smtp_connects_total", "counter", "SMTP connections opened (connect, STARTTLS, login).")
+metrics.describe("aiden_turns_total", "counter", "Agent turns by outcome (executed, no_agreement, bad_command, llm_unavailable).")
+metrics.describe("aiden_turn_phase_seconds", "histogram", "Time spent in each phase of a turn.", LATENCY_BUCKETS)
+metrics.describe("aiden_log_dropped_total", "counter", "Log records dropped because the log queue was full.")
+
+class MetricsExporter:
+    """
+    Publishes a Metrics registry: Prometheus text on http://host:port/metrics (JSON on
+    /metrics.json) and/or a JSON snapshot rewritten every 'snapshot_interval' seconds.
+    Configured from the "metrics" section of hemisphere.json or the sessions manifest.
+    """
+    def __init__(self, registry: Metrics, port: int = None, host: str = "127.0.0.1",
+                 snapshot_path: Path = None, snapshot_interval: float = 60):
+        self.registry = registry
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.snapshot_interval = snapshot_interval
+        self.stopped = threading.Event()
+        self.httpd = None
+        if port is not None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.startswith("/metrics.json"):
+                        body, content_type = json.dumps(registry.snapshot()), "application/json"
+                    elif self.path.startswith("/metrics"):
+                        body, content_type = registry.render_prometheus(), "text/plain; version=0.0.4"
+                    else:
+                        self.send_error(404)
+                        return
+                    body = body.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+            self.httpd.daemon_threads = True
+            threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        if self.snapshot_path:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    @classmethod
+    def from_config(cls, registry: Metrics, config: dict, base_dir: Path):
+        """config: {"port", "host", "snapshot_path" (relative to base_dir), "snapshot_interval"}; None if empty."""
+        if not config or (config.get("port") is None and not config.get("snapshot_path")):
+            return None
+        snapshot_path = config.get("snapshot_path")
+        return cls(registry, config.get("port"), config.get("host", "127.0.0.1"),
+                   Path(base_dir) / snapshot_path if snapshot_path else None,
+                   config.get("snapshot_interval", 60))
+
+    def write_snapshot(self):
+        data = {"timestamp": datetime.now().isoformat(), "metrics": self.registry.snapshot()}
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        tmp_path.replace(self.snapshot_path)  # Readers never see a half-written file
+
+    def close(self):
+        self.stopped.set()
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self.snapshot_path:
+            self.write_snapshot()
+
+    def _run(self):
+        while not self.stopped.wait(self.snapshot_interval):
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                print(f"Metrics snapshot failed: {e}", file=sys.stderr)
+
+# --- Conversation context ---
+CHARS_PER_TOKEN = 4  # Starting estimate; calibrated from provider-reported prompt tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+CONTEXT_PRIORITY_LOW = 0  # Corrections: bad-command prompts, disagreement feedback
+CONTEXT_PRIORITY_NORMAL = 1
+DEFAULT_CONTEXT_KEEP_RECENT = 2
+CONTEXT_LOW_WATER = 0.75  # Evict down to this share of the budget so the prefix stays put for a while
+CONTEXT_SUMMARY_CATEGORY = "conversation"
+CONTEXT_START_PROMPT = "Begin with your first command."
+CONTEXT_MEMORY_NOTE = ("\n\nOlder turns of this conversation are summarized in the memory DB "
+                       "(searchmemory ALL|<text>|conversation).")
+
+def trim_text(text: str, max_chars: int) -> str:
+    """Keep the head and tail of text within max_chars."""
+    if len(text) <= max_chars:
+        return text
+    half = max(0, max_chars // 2 - 20)
+    return f"{text[:half]}\n... [{len(text) - 2 * half} chars trimmed] ...\n{text[len(text) - half:]}"
+
+def one_line(text: str, max_chars: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+def summarize_exchanges(exchanges: list) -> str:
+    """Extractive summary of evicted exchanges: what was asked and what came back, one line each."""
+    lines = [f"{len(exchanges)} earlier turns:"]
+    lines += [f"- {one_line(ex['prompt'], 160)} => {one_line(ex['response'], 160)}" for ex in exchanges]
+    return "\n".join(lines)
+
+def render_messages(messages: list) -> str:
+    """Flatten chat messages into one prompt for plain text-generation endpoints."""
+    parts = [f"{m['role'].capitalize()}: {m['content']}" for m in messages]
+    return "\n\n".join(parts) + "\n\nAssistant:"
+
+class ConversationContext:
+    """
+    Rolling message history for one hemisphere under a token budget.
+    Messages go out as [system, oldest exchange ... newest exchange, new prompt], so the
+    prefix is identical from one turn to the next and provider-side prompt caching can hit.
+    Over budget, old exchanges are dropped in one batch down to CONTEXT_LOW_WATER (lowest
+    priority first, then oldest) and handed to on_evict; the system prompt and the last
+    'keep_recent' exchanges are kept, trimmed to head and tail if they alone do not fit.
+    """
+    def __init__(self, system_prompt: str, max_tokens: int, keep_recent: int = DEFAULT_CONTEXT_KEEP_RECENT,
+                 on_evict=None):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.on_evict = on_evict
+        self.chars_per_token = CHARS_PER_TOKEN
+        self.exchanges = []  # {"prompt", "response", "priority", "tokens"}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, system_prompt: str, model_info: dict, on_evict=None):
+        """Context for a model entry with 'context_tokens' (and optional 'context_keep_recent'), else None."""
+        if not model_info.get("context_tokens"):
+            return None
+        return cls(system_prompt, model_info["context_tokens"],
+                   model_info.get("context_keep_recent", DEFAULT_CONTEXT_KEEP_RECENT), on_evict)
+
+    def estimate_tokens(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, prompt: str) -> list:
+        """Returns: chat messages for sending prompt with the history that fits the budget."""
+        with self._lock:
+            budget = self.max_tokens - self.estimate_tokens(self.system_prompt)
+            prompt_tokens = self.estimate_tokens(prompt)
+            evicted = []
+            if self.history_tokens() + prompt_tokens > budget:
+                evicted = self._evict(budget * CONTEXT_LOW_WATER - prompt_tokens)
+                self._shrink(budget - prompt_tokens)
+            room = max(0, budget - self.history_tokens())
+            if prompt_tokens > room:
+                prompt = trim_text(prompt, int(max(0, room - MESSAGE_OVERHEAD_TOKENS) * self.chars_per_token))
+            messages = [{"role": "system", "content": self.system_prompt}]
+            for ex in self.exchanges:
+                messages.append({"role": "user", "content": ex["prompt"]})
+                messages.append({"role": "assistant", "content": ex["response"]})
+            messages.append({"role": "user", "content": prompt})
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+        return messages
+
+    def record(self, prompt: str, response: str, priority: int = CONTEXT_PRIORITY_NORMAL):
+        with self._lock:
+            self.exchanges.append({"prompt": prompt, "response": response, "priority": priority,
+                                   "tokens": self.estimate_tokens(prompt) + self.estimate_tokens(response)})
+
+    def calibrate(self, prompt_chars: int, prompt_tokens: int):
+        """Move the chars-per-token estimate towards what the provider actually counted."""
+        if prompt_tokens > 0 and prompt_chars > 0:
+            with self._lock:
+                ratio = min(max(prompt_chars / prompt_tokens, 1.0), 8.0)  # Ignore nonsense counts
+                self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * ratio
+
+    def history_tokens(self) -> int:
+        return sum(ex["tokens"] for ex in self.exchanges)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"chars_per_token": self.chars_per_token, "exchanges": list(self.exchanges)}
+
+    def restore(self, snapshot: dict):
+        with self._lock:
+            self.chars_per_token = snapshot.get("chars_per_token", CHARS_PER_TOKEN)
+            self.exchanges = list(snapshot.get("exchanges", []))
+
+    def _evict(self, target: float) -> list:
+        candidates = len(self.exchanges) - self.keep_recent
+        order = sorted(range(max(0, candidates)), key=lambda i: (self.exchanges[i]["priority"], i))
+        total = self.history_tokens()
+        drop = set()
+        for i in order:
+            if total <= target:
+                break
+            drop.add(i)
+            total -= self.exchanges[i]["tokens"]
+        evicted = [ex for i, ex in enumerate(self.exchanges) if i in drop]
+        self.exchanges = [ex for i, ex in enumerate(self.exchanges) if i not in drop]
+        return evicted
+
+    def _shrink(self, budget: float):
+        """Halve the largest kept message until the history fits the budget."""
+        while self.exchanges and self.history_tokens() > budget:
+            ex, key = max(((ex, key) for ex in self.exchanges for key in ("prompt", "response")),
+                          key=lambda item: len(item[0][item[1]]))
+            if len(ex[key]) < 200:
+                break
+            ex[key] = trim_text(ex[key], len(ex[key]) // 2)
+            ex["tokens"] = self.estimate_tokens(ex["prompt"]) + self.estimate_tokens(ex["response"])
 
 # --- Hugging Face API interaction ---
-def hf_infer(model_info, prompt):
+def hf_infer(model_info, prompt, on_chunk=None, cancel=None, usage=None):
     """
-    model_info: dict with keys 'model', 'api_url', 'api_token'
-    prompt: str
+    model_info: dict with keys 'model', 'api_url', 'api_token' (optional 'stream')
+    prompt: str, or a list of chat messages from a ConversationContext
+    on_chunk: optional callback for streamed text
+    cancel: optional threading.Event that abandons a streamed response
+    usage: optional dict that receives 'prompt_tokens' / 'completion_tokens' when reported
     Returns: str (model response)
     """
     headers = {
@@ -29,25 +795,33 @@ def hf_infer(model_info, prompt):
         "Content-Type": "application/json"
     }
     payload = {
-        "inputs": prompt,
+        "inputs": render_messages(prompt) if isinstance(prompt, list) else prompt,
         "parameters": model_info.get("parameters", {}),
         "options": model_info.get("options", {})
     }
-    response = requests.post(model_info["api_url"], headers=headers, json=payload, timeout=60)
+    if model_info.get("stream"):
+        # Text Generation Inference style token streaming
+        payload["stream"] = True
+        return stream_completion(model_info, model_info["api_url"], headers, payload, hf_chunk_text, on_chunk, cancel, usage)
+    response = provider_client.post(model_info, model_info["api_url"], headers, payload)
     response.raise_for_status()
     data = response.json()
     # Hugging Face text-generation endpoints return a list of dicts with 'generated_text'
     if isinstance(data, list) and "generated_text" in data[0]:
+        read_usage(data[0], usage)
         return data[0]["generated_text"]
     # Some endpoints return just 'data' or 'text'
     if isinstance(data, dict):
         return data.get("generated_text") or data.get("text") or str(data)
     return str(data)
 
-def openrouter_infer(model_info, prompt):
+def openrouter_infer(model_info, prompt, on_chunk=None, cancel=None, usage=None):
     """
-    model_info: dict with keys 'model', 'api_url', 'api_token'
-    prompt: str
+    model_info: dict with keys 'model', 'api_url', 'api_token' (optional 'stream')
+    prompt: str, or a list of chat messages from a ConversationContext
+    on_chunk: optional callback for streamed text
+    cancel: optional threading.Event that abandons a streamed response
+    usage: optional dict that receives 'prompt_tokens' / 'completion_tokens' when reported
     Returns: str (model response)
     """
     url = f"{model_info['api_url']}/chat/completions"
@@ -57,53 +831,832 @@ def openrouter_infer(model_info, prompt):
     }
     payload = {
         "model": model_info["model"],
-        "messages": [
+        "messages": prompt if isinstance(prompt, list) else [
             {"role": "user", "content": prompt}
         ]
     }
-    response = requests.post(url, headers=headers, json=payload, timeout=60)
+    if model_info.get("stream"):
+        payload["stream"] = True
+        payload["usage"] = {"include": True}  # Token counts arrive in the final event
+        return stream_completion(model_info, url, headers, payload, openrouter_chunk_text, on_chunk, cancel, usage)
+    response = provider_client.post(model_info, url, headers, payload)
     response.raise_for_status()
     data = response.json()
     # OpenRouter returns OpenAI-compatible response
+    read_usage(data, usage)
     return data["choices"][0]["message"]["content"]
 
-def check_llm_connections(api_config, ui=None):
-    results = {}
-    for llm_name, model_info in api_config.items():
+# --- Endpoint routing ---
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5  # Seconds before the first retry of the same endpoint; doubles per retry
+DEFAULT_BACKOFF_MAX = 8
+DEFAULT_RETRY_AFTER_MAX = 120  # Longest Retry-After honoured; backoff_max only caps the computed backoff
+DEFAULT_BREAKER_FAILURES = 5  # Consecutive failures that open an endpoint's circuit
+DEFAULT_BREAKER_COOLDOWN = 30  # Seconds an open circuit stays out of rotation
+EWMA_ALPHA = 0.3
+
+def endpoints_for(model_info: dict) -> list:
+    """
+    Endpoints of a hemisphere entry: its 'endpoints' list, each inheriting the entry's
+    other keys (token, timeouts, stream, ...), or just the entry itself.
+    """
+    endpoints = model_info.get("endpoints")
+    if not endpoints:
+        return [model_info]
+    base = {k: v for k, v in model_info.items() if k != "endpoints"}
+    return [dict(base, **endpoint) for endpoint in endpoints]
+
+def endpoint_name(model_info: dict) -> str:
+    return f"{model_info.get('model', '')}@{urlsplit(model_info.get('api_url', '')).netloc}"
+
+def retryable(error: Exception) -> bool:
+    """429 / 5xx responses and connection-level failures are worth another attempt."""
+    import requests
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+def retry_after(error: Exception) -> float:
+    """Seconds from a Retry-After header, if the provider sent one."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class EndpointHealth:
+    """
+    EWMA latency and circuit breaker for one endpoint.
+    closed -> (breaker_failures in a row) -> open for breaker_cooldown seconds -> half-open:
+    one trial request; success closes the circuit, failure opens it again.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.ewma = None  # Seconds; None until the first success
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def available(self, now: float) -> bool:
+        with self._lock:
+            return self.open_until == 0.0 or (now >= self.open_until and not self.trial)
+
+    def begin(self, now: float):
+        with self._lock:
+            self.requests += 1
+            if self.open_until and now >= self.open_until:
+                self.trial = True  # Half-open: this request decides
+
+    def success(self, seconds: float) -> bool:
+        """Returns: True if this closed an open circuit."""
+        with self._lock:
+            self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+            closed = bool(self.open_until)
+            self.failures = 0
+            self.open_until = 0.0
+            self.trial = False
+            return closed
+
+    def failure(self, max_failures: int, cooldown: float, counts: bool = True) -> bool:
+        """counts: False for errors that say nothing about health (bad request). Returns: True if the circuit opened."""
+        with self._lock:
+            trial, self.trial = self.trial, False
+            if not counts:
+                return False
+            self.errors += 1
+            self.failures += 1
+            if trial or (self.failures >= max_failures and not self.open_until):
+                self.open_until = time.time() + cooldown
+                return True
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+                    "failures": self.failures, "open": bool(self.open_until), "requests": self.requests,
+                    "errors": self.errors}
+
+class EndpointRouter:
+    """
+    Sends a hemisphere's calls to the best of its endpoints: healthy ones by fewest recent failures,
+    then lowest EWMA latency (untried first), open circuits last. Retryable failures (429, 5xx, connection errors) fail
+    over to the next untried endpoint at once, or back off with jitter (honouring Retry-After)
+    before trying one again. With 'hedge_after' set, a second endpoint is raced once the first
+    has taken that long, and the slower request is abandoned.
+    Hemisphere entry keys: 'endpoints', 'retries', 'backoff', 'backoff_max', 'breaker_failures',
+    'breaker_cooldown', 'hedge_after'. Health is shared process-wide, across sessions.
+    """
+    def __init__(self):
+        self._health = {}  # endpoint name -> EndpointHealth
+        self._lock = threading.Lock()
+
+    def health(self, model_info: dict) -> EndpointHealth:
+        name = endpoint_name(model_info)
+        with self._lock:
+            if name not in self._health:
+                self._health[name] = EndpointHealth(name)
+            return self._health[name]
+
+    def rank(self, endpoints: list) -> list:
+        now = time.time()
+        healthy = [e for e in endpoints if self.health(e).available(now)]
+        # Recent failures first, then latency; stable sort, so config order breaks ties
+        healthy.sort(key=lambda e: (self.health(e).failures, self.health(e).ewma or 0.0))
+        tripped = sorted((e for e in endpoints if not self.health(e).available(now)),
+                         key=lambda e: self.health(e).open_until)
+        return healthy + tripped
+
+    def call(self, hemisphere: str, model_info: dict, prompt, on_chunk=None, cancel=None, usage=None, log=None,
+             slot=None) -> str:
+        """slot: optional function(provider) -> context manager held around each request (the scheduler slot)"""
+        log = log or (lambda message, level="INFO": None)
+        endpoints = endpoints_for(model_info)
+        retries = model_info.get("retries", DEFAULT_RETRIES)
+        backoff = model_info.get("backoff", DEFAULT_BACKOFF)
+        tried = set()
+        last_error = None
+        for attempt in range(retries + 1):
+            ranked = self.rank(endpoints)
+            fresh = [e for e in ranked if endpoint_name(e) not in tried]
+            if attempt and not fresh:
+                # Every endpoint has failed once: back off before going round again
+                # The server's Retry-After has its own, longer cap than the computed backoff
+                requested = retry_after(last_error)
+                if requested:
+                    delay = min(requested, model_info.get("retry_after_max", DEFAULT_RETRY_AFTER_MAX))
+                else:
+                    delay = min(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5),
+                                model_info.get("backoff_max", DEFAULT_BACKOFF_MAX))
+                log(f"Retrying {hemisphere} LLM in {delay:.2f}s (attempt {attempt + 1}/{retries + 1})", "WARNING")
+                if (cancel or threading.Event()).wait(delay):
+                    raise StreamCancelled(f"{hemisphere} LLM call cancelled")
+            candidates = fresh or ranked
+            primary = candidates[0]
+            tried.add(endpoint_name(primary))
+            if len(endpoints) > 1:
+                log(f"Routing {hemisphere} LLM to {endpoint_name(primary)} ({self.health(primary).stats()})", "DEBUG")
+            try:
+                hedge_after = model_info.get("hedge_after")
+                if hedge_after and len(candidates) > 1:
+                    return self.hedged(hemisphere, primary, candidates[1], hedge_after, prompt, on_chunk, cancel, usage,
+                                       log, slot)
+                return self.attempt(hemisphere, primary, prompt, on_chunk, cancel, usage, log, slot)
+            except Exception as e:
+                if not retryable(e):
+                    raise
+                last_error = e
+                if attempt < retries:
+                    metrics.inc("aiden_llm_retries_total", hemisphere=hemisphere)
+                log(f"{hemisphere} LLM endpoint {endpoint_name(primary)} failed: {e}", "WARNING")
+        raise last_error
+
+    def attempt(self, hemisphere: str, model_info: dict, prompt, on_chunk, cancel, usage, log, slot=None) -> str:
+        """
+        One request to one endpoint, feeding its health, EWMA and metrics.
+        The slot is taken for this endpoint's provider, so limits are charged to the provider actually called.
+        """
+        health = self.health(model_info)
+        labels = {"hemisphere": hemisphere, "model": model_info.get("model", "")}
+        endpoint = {"endpoint": health.name}
         provider = model_info.get("provider", "huggingface").lower()
+        attempt_usage = {}
+        with slot(provider) if slot else nullcontext():
+            if cancel is not None and cancel.is_set():
+                # Decided while this call waited for its slot: never send it
+                raise StreamCancelled("cancelled before the request was sent")
+            health.begin(time.time())
+            start = time.perf_counter()
+            try:
+                if provider == "openrouter":
+                    response = openrouter_infer(model_info, prompt, on_chunk, cancel, attempt_usage)
+                else:
+                    response = hf_infer(model_info, prompt, on_chunk, cancel, attempt_usage)
+            except StreamCancelled:
+                raise  # Abandoned by the caller; says nothing about the endpoint's health
+            except Exception as e:
+                metrics.observe("aiden_llm_request_seconds", time.perf_counter() - start, **labels)
+                metrics.inc("aiden_llm_errors_total", **labels)
+                if health.failure(model_info.get("breaker_failures", DEFAULT_BREAKER_FAILURES),
+                                  model_info.get("breaker_cooldown", DEFAULT_BREAKER_COOLDOWN), retryable(e)):
+                    metrics.set("aiden_endpoint_circuit_open", 1, **endpoint)
+                    log(f"Circuit opened for {health.name} after {health.failures} failures", "WARNING")
+                raise
+            seconds = time.perf_counter() - start
+        metrics.observe("aiden_llm_request_seconds", seconds, **labels)
+        if health.success(seconds):
+            metrics.set("aiden_endpoint_circuit_open", 0, **endpoint)
+            log(f"Circuit closed for {health.name}")
+        metrics.set("aiden_endpoint_ewma_seconds", health.ewma, **endpoint)
+        if attempt_usage:
+            metrics.inc("aiden_llm_prompt_tokens_total", attempt_usage.get("prompt_tokens", 0), **labels)
+            metrics.inc("aiden_llm_completion_tokens_total", attempt_usage.get("completion_tokens", 0), **labels)
+            if usage is not None:
+                usage.update(attempt_usage)
+        return response
+
+    def hedged(self, hemisphere: str, primary: dict, backup: dict, hedge_after: float, prompt, on_chunk, cancel,
+               usage, log, slot=None) -> str:
+        """Race backup against primary once primary has run hedge_after seconds; the first success wins."""
+        results = queue.Queue()
+        cancels = [threading.Event(), threading.Event()]
+
+        def run(i, model_info, chunk_callback):
+            local_usage = {}
+            try:
+                response = self.attempt(hemisphere, model_info, prompt, chunk_callback, cancels[i], local_usage, log, slot)
+                results.put((i, response, None, local_usage))
+            except Exception as e:
+                results.put((i, None, e, local_usage))
+
+        def next_result(timeout: float):
+            """Wait up to timeout for an attempt to finish, passing the caller's cancel on to both attempts."""
+            deadline = time.monotonic() + timeout
+            while True:
+                if cancel is not None and cancel.is_set():
+                    for event in cancels:
+                        event.set()
+                    raise StreamCancelled(f"{hemisphere} LLM call cancelled")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                try:
+                    return results.get(timeout=min(0.1, remaining))
+                except queue.Empty:
+                    pass
+
+        threading.Thread(target=run, args=(0, primary, on_chunk), daemon=True).start()
+        started = 1
+        first = next_result(hedge_after)
+        if first is None:
+            log(f"Hedging {hemisphere} LLM: {endpoint_name(primary)} slower than {hedge_after}s, "
+                f"racing {endpoint_name(backup)}")
+            threading.Thread(target=run, args=(1, backup, None), daemon=True).start()  # Only the primary streams to the UI
+            started = 2
+        outcomes = [first] if first else []
+        error = None
+        while True:
+            if not outcomes:
+                outcome = next_result(0.1)
+                if outcome is None:
+                    continue
+                outcomes.append(outcome)
+            i, response, error, local_usage = outcomes.pop()
+            if error is None:
+                for j, event in enumerate(cancels):
+                    if j != i:
+                        event.set()
+                if started == 2:
+                    metrics.inc("aiden_llm_hedges_total", hemisphere=hemisphere, winner="backup" if i else "primary")
+                if usage is not None:
+                    usage.update(local_usage)
+                return response
+            started -= 1
+            if not started:
+                break
+        for event in cancels:
+            event.set()
+        raise error
+
+    def stats(self) -> dict:
+        with self._lock:
+            health = list(self._health.values())
+        return {h.name: h.stats() for h in health}
+
+# Shared so every session sees the same endpoint health
+endpoint_router = EndpointRouter()
+
+# --- Health checks ---
+DEFAULT_HEALTH_TIMEOUT = 5  # Seconds; a startup check should fail fast, not wait out read_timeout
+DEFAULT_HEALTH_TTL = 600  # Seconds a passed check is trusted from the on-disk cache
+HEALTH_CHECK_MODES = ("probe", "ping", "off")
+MAX_HEALTH_WORKERS = 16
+
+class HealthCache:
+    """
+    Passed endpoint checks on disk as {endpoint key: time of the check}, so a restart
+    within an entry's 'health_ttl' skips the network. Failures are never cached.
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
         try:
-            if provider == "openrouter":
-                response = openrouter_infer(model_info, "ping")
-            else:
-                response = hf_infer(model_info, "ping")
-            results[llm_name] = None
-            if ui:
-                ui.log(f"LLM '{llm_name}' ({provider}) connection OK.")
-        except Exception as e:
-            msg = f"LLM '{llm_name}' ({provider}) connection failed: {str(e)}"
-            results[llm_name] = msg
-            if ui:
-                ui.log(msg)
+            with open(self.path) as f:
+                self.passed = json.load(f)
+        except (OSError, ValueError):
+            self.passed = {}
+
+    @staticmethod
+    def key(endpoint: dict) -> str:
+        # The token is part of the key so a new token is checked again
+        identity = [endpoint.get(k, "") for k in ("provider", "model", "api_url", "api_token")]
+        return hashlib.sha256(json.dumps(identity).encode("utf-8")).hexdigest()[:24]
+
+    def fresh(self, endpoint: dict) -> bool:
+        ttl = endpoint.get("health_ttl", DEFAULT_HEALTH_TTL)
+        with self._lock:
+            checked = self.passed.get(self.key(endpoint))
+        return checked is not None and 0 <= time.time() - checked < ttl
+
+    def record(self, endpoint: dict):
+        with self._lock:
+            self.passed[self.key(endpoint)] = time.time()
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.passed)
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_text(data, encoding="utf-8")
+            tmp.replace(self.path)
+        except OSError:
+            pass  # The cache only saves time; a read-only directory just means checking every start
+
+def with_health_timeout(endpoint: dict, timeout: float) -> dict:
+    """The endpoint with both connect and read timeouts capped at the check's timeout."""
+    return dict(endpoint, read_timeout=timeout,
+                connect_timeout=min(endpoint.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT), timeout))
+
+def probe_endpoint(endpoint: dict, timeout: float):
+    """
+    Cheap reachability + auth check without a generation: GET OpenRouter's key info (which
+    rejects a bad key, unlike the public models list), or GET the Hugging Face model URL.
+    An OpenAI-compatible server without /key is probed with its (authenticated) models list.
+    Any answer but an auth error, 404 or 5xx passes.
+    """
+    provider = endpoint.get("provider", "huggingface").lower()
+    endpoint = with_health_timeout(endpoint, timeout)
+    headers = {"Authorization": f"Bearer {endpoint['api_token']}"}
+    urls = [f"{endpoint['api_url']}/key", f"{endpoint['api_url']}/models"] if provider == "openrouter" else [endpoint["api_url"]]
+    for url in urls:
+        response = provider_client.get(endpoint, url, headers)
+        response.close()
+        if response.status_code != 404:
+            break
+    if response.status_code in (401, 403, 404) or response.status_code >= 500:
+        response.raise_for_status()
+
+def check_endpoint(endpoint: dict):
+    """Raises if the endpoint fails its 'health_check' ('probe' by default, or a 'ping' generation)."""
+    mode = endpoint.get("health_check", "probe")
+    if mode not in HEALTH_CHECK_MODES:
+        raise ValueError(f"health_check must be one of {', '.join(HEALTH_CHECK_MODES)}, not {mode!r}")
+    timeout = endpoint.get("health_timeout", DEFAULT_HEALTH_TIMEOUT)
+    if mode == "probe":
+        probe_endpoint(endpoint, timeout)
+    elif mode == "ping":
+        ping = dict(with_health_timeout(endpoint, timeout), stream=False)
+        if endpoint.get("provider", "huggingface").lower() == "openrouter":
+            openrouter_infer(ping, "ping")
+        else:
+            hf_infer(ping, "ping")
+
+def check_llm_connections(api_config, agent=None, cache: HealthCache = None, max_workers: int = MAX_HEALTH_WORKERS):
+    """
+    Check every endpoint of every entry at once, each with its own short 'health_timeout'.
+    An entry with several endpoints passes if any of them answers. Endpoints that passed
+    within their 'health_ttl' according to cache are not checked again.
+    Returns: {entry name: None, or the joined error messages}
+    """
+    def log(message, level="INFO"):
+        if agent:
+            agent.log(message, level)
+
+    checks = {}
+    for llm_name, model_info in api_config.items():
+        for endpoint in endpoints_for(model_info):
+            label = f"LLM '{llm_name}' ({endpoint.get('provider', 'huggingface').lower()} {endpoint_name(endpoint)})"
+            if endpoint.get("health_check") == "off":
+                log(f"{label} connection check skipped.")
+                continue
+            if cache and cache.fresh(endpoint):
+                log(f"{label} connection OK (cached).")
+                continue
+            checks[(llm_name, label)] = endpoint
+
+    failures = {}
+    if checks:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(checks))) as pool:
+            futures = {pool.submit(check_endpoint, endpoint): key for key, endpoint in checks.items()}
+            for future in as_completed(futures):
+                llm_name, label = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.setdefault(llm_name, []).append(f"{label} connection failed: {str(e)}")
+                    continue
+                log(f"{label} connection OK.")
+                if cache:
+                    cache.record(checks[futures[future]])
+        if cache:
+            cache.save()
+
+    results = {}
+    for llm_name, model_info in api_config.items():
+        errors = failures.get(llm_name, [])
+        failed = len(errors) == len(endpoints_for(model_info))
+        for message in errors:
+            log(message, "ERROR" if failed else "WARNING")
+        results[llm_name] = "; ".join(errors) if failed else None
     return results
 
-class AgentUI:
-    def __init__(self, config: dict, api_config: dict):
+# --- Logging ---
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+DEFAULT_LOG_QUEUE_SIZE = 10000
+LOG_SCREEN_LINES = 1000  # Lines kept in the on-screen log
+
+class AgentLogger:
+    """
+    Non-blocking log pipeline.
+    log() only filters and enqueues; a background thread writes records in batches to
+    agent.log (rotated by size and age) and, optionally, a structured agent.jsonl sink.
+    The queue holds at most queue_size records: while the disk stalls, new records are
+    dropped and counted rather than blocking the caller, and the count is logged once it drains.
+    Configured from the "logging" section of hemisphere.json (see CONFIG_KEYS).
+    """
+    def __init__(self, log_dir: Path, level: str = "INFO", max_payload: int = 500,
+                 max_bytes: int = 5 * 1024 * 1024, backup_count: int = 5, rotate_seconds: float = 86400,
+                 json_lines: bool = False, flush_interval: float = 0.5, batch_size: int = 200,
+                 queue_size: int = DEFAULT_LOG_QUEUE_SIZE):
+        self.log_dir = Path(log_dir)
+        self.level = LOG_LEVELS.get(level.upper(), LOG_LEVELS["INFO"])
+        self.max_payload = max_payload  # None keeps full payloads, 0 drops them
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_seconds = rotate_seconds
+        self.json_lines = json_lines
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0  # Records dropped since the last one written
+        self._dropped_lock = threading.Lock()
+        self._files = {}  # name -> (file, opened_at)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    CONFIG_KEYS = ("level", "max_payload", "max_bytes", "backup_count", "rotate_seconds",
+                   "json_lines", "flush_interval", "batch_size", "queue_size")
+
+    @classmethod
+    def from_config(cls, log_dir: Path, config: dict):
+        return cls(log_dir, **{k: v for k, v in (config or {}).items() if k in cls.CONFIG_KEYS})
+
+    def enabled(self, level: str) -> bool:
+        return LOG_LEVELS.get(level, LOG_LEVELS["INFO"]) >= self.level
+
+    def format_payload(self, payload: str) -> str:
+        """Trim a prompt/response for the log according to max_payload (full at DEBUG level)."""
+        payload = str(payload)
+        if self.max_payload is None or self.level <= LOG_LEVELS["DEBUG"]:
+            return payload
+        if self.max_payload <= 0:
+            return f"<{len(payload)} chars>"
+        if len(payload) > self.max_payload:
+            return payload[:self.max_payload] + f"... <{len(payload) - self.max_payload} more chars>"
+        return payload
+
+    def log(self, message: str, level: str = "INFO", timestamp: float = None):
+        if self.enabled(level):
+            try:
+                self.queue.put_nowait((timestamp or time.time(), level, message))
+            except queue.Full:
+                with self._dropped_lock:
+                    self.dropped += 1
+                metrics.inc("aiden_log_dropped_total")
+
+    def close(self):
+        try:
+            self.queue.put(None, timeout=5)
+        except queue.Full:
+            return  # The writer is stuck; it is a daemon thread, so it will not hold up exit
+        self.thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            # Collect a batch, bounded by size and by the flush interval
+            while record is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(record)
+            records = [r for r in batch if r is not None]
+            closing = len(records) != len(batch)
+            with self._dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                records.append((time.time(), "WARNING", f"{dropped} log records dropped: log queue full"))
+            try:
+                self._write(records)
+            except OSError:
+                pass  # Never let a full disk take the agent down
+            if closing:
+                for f, _ in self._files.values():
+                    f.close()
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        lines = []
+        for ts, level, message in records:
+            stamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+            prefix = "" if level == "INFO" else f"{level}: "
+            lines.append(f"[{stamp}] {prefix}{message}\n")
+        self._append("agent.log", "".join(lines))
+        if self.json_lines:
+            self._append("agent.jsonl", "".join(
+                json.dumps({"ts": ts, "level": level, "message": message}) + "\n" for ts, level, message in records
+            ))
+
+    def _append(self, name: str, text: str):
+        f, opened_at = self._files.get(name, (None, 0))
+        if f is None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            f, opened_at = open(self.log_dir / name, "a", encoding="utf-8"), time.time()
+        elif f.tell() >= self.max_bytes or time.time() - opened_at >= self.rotate_seconds:
+            f.close()
+            self._rotate(self.log_dir / name)
+            f, opened_at = open(self.log_dir / name, "a", encoding="utf-8"), time.time()
+        f.write(text)
+        f.flush()
+        self._files[name] = (f, opened_at)
+
+    def _rotate(self, path: Path):
+        # agent.log -> agent.log.1 -> ... -> agent.log.<backup_count> (oldest dropped)
+        for i in range(self.backup_count - 1, 0, -1):
+            older = path.with_name(f"{path.name}.{i}")
+            if older.exists():
+                older.replace(path.with_name(f"{path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            path.replace(path.with_name(f"{path.name}.1"))
+        else:
+            path.unlink()
+
+# --- Front ends ---
+class Frontend:
+    """
+    Rendering hooks the agent core calls as it works, from whichever thread is working.
+    request identifies one LLM call, so calls running side by side (parallel verification)
+    can be told apart. The base class renders nothing, which is all a headless agent needs.
+    """
+    def log_line(self, line: str):
+        pass
+
+    def show_request(self, hemisphere: str, text: str, request: int = 0):
+        pass
+
+    def show_response(self, hemisphere: str, text: str, request: int = 0):
+        pass
+
+    def append_response(self, hemisphere: str, chunk: str, request: int = 0):
+        pass
+
+    def show_command(self, command, args):
+        pass
+
+    def show_paused(self, paused: bool):
+        pass
+
+# --- Agent core ---
+class Agent:
+    """
+    Agent core: paths, config, memory DB, email settings and the agreement loop.
+    It has no GUI dependency; a Frontend attached to it only renders what happens.
+    """
+    def __init__(self, base_dir: Path, config: dict, api_config: dict, frontend: Frontend = None,
+                 scheduler: LLMScheduler = None, session_id: str = None):
+        self.base_dir = Path(base_dir)
+        self.session_id = session_id or str(self.base_dir)
+        self.scheduler = scheduler or llm_scheduler
+        self.memory_dir = self.base_dir / "memory"
+        self.script_dir = self.base_dir / "scripts"
+        self.log_dir = self.base_dir / "logs"
         self.config = config
         self.api_config = api_config
+        self.frontend = frontend or Frontend()
+        self.logger = AgentLogger.from_config(self.log_dir, config.get("logging"))
+        self.log_lines = deque(maxlen=LOG_SCREEN_LINES)  # Ring buffer behind the on-screen log
         self.paused = True  # Start in paused state
+        self.user_inputs = queue.Queue()  # Sent in order by one worker (see post_user_input)
+        self._input_thread = None
+        self._input_lock = threading.Lock()
         self.timeout_event = threading.Event()
         self.timeout_event.clear()
-        self.awaiting_command = False
 
-        # Detect screen size (Windows)
-        user32 = ctypes.windll.user32
-        self.screen_width = user32.GetSystemMetrics(0)
-        self.screen_height = user32.GetSystemMetrics(1)
+        with open(self.memory_dir / "agent_init.txt", encoding="utf-8") as f:
+            self.init_prompt = f.read()
+        with open(self.memory_dir / "agent2.txt", encoding="utf-8") as f:
+            self.agent2_prompt = f.read()
+        # Commands the right LLM may send per response ('max_batch' on the right entry)
+        self.max_batch = max(1, int(api_config.get("right", {}).get("max_batch", 1)))
+        self.bad_command_prompt = BAD_COMMAND_PROMPT
+        if self.max_batch > 1:
+            self.init_prompt += BATCH_PROMPT_NOTE.format(max_batch=self.max_batch)
+            self.bad_command_prompt = BATCH_BAD_COMMAND_PROMPT % self.max_batch
 
-        # Set the GUI as a horizontal strip near the top
+        # DB and email
+        # Used from the agent loop thread as well as the front end
+        self.conn = sqlite3.connect(self.memory_dir / "memory.db", check_same_thread=False)
+        # WAL: a checkpoint commit per loop transition is one sequential append, and readers never block it
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: under WAL, NORMAL can lose the last commits on power loss, and a lost "started" mark re-runs a command
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.db_lock = threading.RLock()  # Batched commands may touch the DB from several threads
+        self.init_db()
+        self.checkpoints = CheckpointStore(self.conn, self.db_lock)
+        # Rolling history per hemisphere, for model entries with 'context_tokens'
+        self.contexts = {}
+        for hemisphere, system_prompt in (("right", self.init_prompt + CONTEXT_MEMORY_NOTE),
+                                          ("left", self.agent2_prompt)):
+            context = ConversationContext.from_config(
+                system_prompt, api_config.get(hemisphere, {}),
+                on_evict=lambda exchanges, hemisphere=hemisphere: self.summarize_turns(hemisphere, exchanges))
+            if context:
+                self.contexts[hemisphere] = context
+        self.email_user = ""
+        self.email_password = ""
+        self.outbox = None
+        try:
+            with open(self.memory_dir / "EmailCred.txt", "r") as f:
+                lines = f.readlines()
+                if len(lines) >= 4:
+                    self.email_user = lines[0].strip()
+                    self.email_password = lines[1].strip()
+                    self.smtp_host = lines[2].strip()
+                    self.smtp_port = int(lines[3].strip())
+                    self.outbox = MailOutbox.from_config(
+                        self.base_dir / "outbox.db", self.smtp_host, self.smtp_port,
+                        self.email_user, self.email_password, config.get("email"), log=self.log)
+                else:
+                    self.log("Error: EmailCred.txt must have 4 lines (user, password, SMTP host, SMTP port)", "ERROR")
+        except FileNotFoundError:
+            self.log(f"Error: EmailCred.txt not found in {self.memory_dir}", "ERROR")
+        self.executor = CommandExecutor.from_config(config.get("commands"))
+        self.last_command_time = None  # Do not start timer yet
+        self.initial_prompt_sent = False  # Track if initial prompt has been sent
+        self.loop = AgentLoop(self)
+        # Pick up where the last run stopped instead of sending agent_init.txt again
+        if self.loop.restore():
+            self.initial_prompt_sent = True
+
+    def log(self, message: str, level: str = "INFO", payload: str = None):
+        """
+        Log a message; payload (a prompt or response) is appended trimmed to the
+        logger's max_payload. File writes happen on the logger's background thread.
+        """
+        if not self.logger.enabled(level):
+            return
+        if payload is not None:
+            message = f"{message}: {self.logger.format_payload(payload)}"
+        now = time.time()
+        self.logger.log(message, level, now)
+        line = f"[{datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')}] {message}\n"
+        self.log_lines.append(line)
+        self.frontend.log_line(line)
+
+    def show_command(self, command, args):
+        self.frontend.show_command(command, args)
+
+    def set_paused(self, paused: bool):
+        self.paused = paused
+        if not self.paused:
+            self.timeout_event.set()
+            self.last_command_time = datetime.now()
+            self.loop.resume()
+            if not self.initial_prompt_sent:
+                self.send_initial_prompt()
+        else:
+            self.timeout_event.clear()
+            self.loop.pause()
+            self.executor.cancel_all()  # Running scripts are killed, not left to finish
+        self.frontend.show_paused(self.paused)
+
+    def send_initial_prompt(self):
+        # The loop thread sends it to the right LLM and handles the reply.
+        # With a context the init prompt is already the system message.
+        self.loop.post_prompt(CONTEXT_START_PROMPT if "right" in self.contexts else self.init_prompt)
+        self.initial_prompt_sent = True
+
+    def send_user_input(self, user_input: str):
+        # Only allowed in pause mode
+        if not self.paused or not user_input.strip():
+            return None
+        response = interact_with_llm(self, "right", user_input)
+        if not isinstance(response, LLMError):
+            self.loop.post_response(response)
+        return response
+
+    def post_user_input(self, user_input: str):
+        """
+        Queue user input for a single worker thread, so a slow or unreachable endpoint never blocks
+        the caller (the Tk main thread) and inputs reach the right LLM one at a time, in the order
+        sent. Each reply is posted to the loop like any other response.
+        """
+        if not self.paused or not user_input.strip():
+            return
+        with self._input_lock:
+            if self._input_thread is None:
+                self._input_thread = threading.Thread(target=self._send_user_inputs, daemon=True)
+                self._input_thread.start()
+        self.user_inputs.put(user_input)
+
+    def _send_user_inputs(self):
+        for user_input in iter(self.user_inputs.get, None):
+            self.send_user_input(user_input)
+
+    def add_memory(self, category: str, content: str) -> str:
+        """Insert a memory DB entry (and its semantic vector). Returns: entry id"""
+        timestamp = datetime.now().isoformat()
+        id_ = f"{timestamp}-{hash(content) % 1000}"
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute("INSERT INTO memories (id, category, content, timestamp) VALUES (?, ?, ?, ?)",
+                           (id_, category, content, timestamp))
+            self.conn.commit()
+            if self.semantic_index:
+                self.semantic_index.add(id_, content)
+        return id_
+
+    def summarize_turns(self, hemisphere: str, exchanges: list):
+        """ConversationContext eviction hook: keep a summary of the dropped turns in the memory DB."""
+        id_ = self.add_memory(CONTEXT_SUMMARY_CATEGORY, f"[{hemisphere}] {summarize_exchanges(exchanges)}")
+        self.log(f"Summarized {len(exchanges)} old {hemisphere} turns into memory entry {id_}")
+
+    def init_db(self):
+        cursor = self.conn.cursor()
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS memories ({MEMORIES_COLUMNS})")
+        migrated = pin_memory_rowids(self.conn)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_memories_category ON memories(category, timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_memories_timestamp ON memories(timestamp)")
+        self.fts_enabled = init_memory_fts(self.conn, rebuild=migrated)
+        if not self.fts_enabled:
+            self.log("SQLite FTS5 not available, searchmemory falls back to LIKE scans", "WARNING")
+        self.conn.commit()
+        # The vector matrix is derived data: keep it out of memory/, where the LLM can list, read and overwrite files
+        try:
+            self.semantic_index = SemanticIndex(self.conn, self.base_dir / "memory_vectors.f32")
+        except ImportError:
+            self.semantic_index = None
+            self.log("numpy not installed, recallmemory is disabled", "WARNING")
+
+    def start(self):
+        self.loop.start()
+        return self
+
+    def close(self, timeout: float = 10):
+        self.loop.stop()
+        self.user_inputs.put(None)
+        self.executor.cancel_all()
+        # Let an in-flight turn finish before the DB goes away under it
+        if self.loop.thread and self.loop.thread.is_alive():
+            self.loop.thread.join(timeout)
+        self.executor.close()
+        if self.outbox:
+            self.outbox.close()
+        self.logger.close()
+        if not (self.loop.thread and self.loop.thread.is_alive()):
+            self.conn.close()
+
+UI_POLL_MS = 50  # How often the Tk main thread renders queued front end updates
+
+class AgentUI(Frontend):
+    """
+    Tkinter front end for one Agent.
+    Tk widgets may only be touched from the main thread, so every hook queues its update and
+    the main thread renders the queue every UI_POLL_MS. Each request/response pane shows one
+    LLM call at a time: the latest request sent to it, whose chunks are never mixed with others'.
+    """
+    def __init__(self, agent: Agent):
+        import tkinter as tk
+        self.agent = agent
+        self.updates = queue.Queue()  # (render method, args), filled from any thread
+        self.pane_requests = {}  # "left"/"right" -> request the pane is showing
+        agent.frontend = self
+
+        # Detect screen size (Windows API, else ask Tk)
         gui_height = 400
         gui_y = 40
         self.root = tk.Tk()
+        if sys.platform == "win32":
+            import ctypes
+            user32 = ctypes.windll.user32
+            self.screen_width = user32.GetSystemMetrics(0)
+            self.screen_height = user32.GetSystemMetrics(1)
+        else:
+            self.screen_width = self.root.winfo_screenwidth()
+            self.screen_height = self.root.winfo_screenheight()
+
+        # Set the GUI as a horizontal strip near the top
         self.root.geometry(f"{self.screen_width}x{gui_height}+0+{gui_y}")
         self.root.title("Aiden Agent")
 
@@ -192,319 +1745,2061 @@ class AgentUI:
         self.command_text.pack(side=tk.LEFT, fill=tk.X, expand=True)
         command_scroll.config(command=self.command_text.yview)
 
-        # DB and email
-        self.conn = sqlite3.connect(MEMORY_DIR / "memory.db")
-        self.init_db()
-        self.email_user = ""
-        self.email_password = ""
-        try:
-            with open(MEMORY_DIR / "EmailCred.txt", "r") as f:
-                lines = f.readlines()
-                if len(lines) >= 2:
-                    self.email_user = lines[0].strip()
-                    self.email_password = lines[1].strip()
-                    self.smtp_host = lines[2].strip()
-                    self.smtp_port = int(lines[3].strip())
-                else:
-                    self.log("Error: EmailCred.txt must have at least 2 lines (user, password)")
-        except FileNotFoundError:
-            self.log(r"Error: EmailCred.txt not found in C:\AIAgent\memory")
-        self.last_command_time = None  # Do not start timer yet
-        self.initial_prompt_sent = False  # Track if initial prompt has been sent
+        # Show what the agent logged before the window existed
+        for line in agent.log_lines:
+            self.render_log_line(line)
+        self.root.after(UI_POLL_MS, self.drain)
 
-    def log(self, message: str):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
-        with open(LOG_DIR / "agent.log", "a") as f:
-            f.write(f"[{timestamp}] {message}\n")
+    def drain(self):
+        # Only what is queued now, so a fast stream cannot keep the main thread here
+        for _ in range(self.updates.qsize()):
+            render, args = self.updates.get_nowait()
+            render(*args)
+        self.root.after(UI_POLL_MS, self.drain)
 
-    def toggle_pause(self):
-        self.paused = not self.paused
-        self.status_label.config(text=f"Aiden: {'Paused' if self.paused else 'Running'}")
-        self.pause_button.config(text="Resume" if self.paused else "Pause")
-        if not self.paused:
-            self.timeout_event.set()
-            self.last_command_time = datetime.now()
-            if not self.initial_prompt_sent:
-                threading.Thread(target=self.send_initial_prompt, daemon=True).start()
-            self.user_input_entry.config(state=tk.DISABLED)
-            self.send_user_input_btn.config(state=tk.DISABLED)
-        else:
-            self.timeout_event.clear()
-            self.user_input_entry.config(state=tk.NORMAL)
-            self.send_user_input_btn.config(state=tk.NORMAL)
+    def log_line(self, line: str):
+        self.updates.put((self.render_log_line, (line,)))
 
-    def send_initial_prompt(self):
-        global right_response, command, args
-        self.awaiting_command = True
-        right_response = interact_with_llm(self, "right", self.init_prompt)
-        self.right_request_text.delete(1.0, tk.END)
-        self.right_request_text.insert(tk.END, self.init_prompt)
-        self.right_response_text.delete(1.0, tk.END)
-        self.right_response_text.insert(tk.END, right_response)
-        self.initial_prompt_sent = True  # Set here, after sending
+    def show_request(self, hemisphere: str, text: str, request: int = 0):
+        self.updates.put((self.render_request, (hemisphere, text, request)))
 
-    def send_user_input(self):
-        # Only allowed in pause mode
-        if not self.paused:
-            return
-        user_input = self.user_input_entry.get()
-        if not user_input.strip():
-            return
-        self.right_request_text.delete(1.0, tk.END)
-        self.right_request_text.insert(tk.END, user_input)
-        response = interact_with_llm(self, "right", user_input)
-        self.right_response_text.delete(1.0, tk.END)
-        self.right_response_text.insert(tk.END, response)
-        global right_response
-        right_response = response
+    def show_response(self, hemisphere: str, text: str, request: int = 0):
+        self.updates.put((self.render_response, (hemisphere, text, request)))
 
-    def init_db(self):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS memories (
-                id TEXT PRIMARY KEY,
-                category TEXT,
-                content TEXT,
-                timestamp TEXT
-            )
-        """)
-        self.conn.commit()
+    def append_response(self, hemisphere: str, chunk: str, request: int = 0):
+        self.updates.put((self.render_chunk, (hemisphere, chunk, request)))
 
     def show_command(self, command, args):
+        self.updates.put((self.render_command, (command, args)))
+
+    def show_paused(self, paused: bool):
+        self.updates.put((self.render_paused, (paused,)))
+
+    def render_log_line(self, line: str):
+        import tkinter as tk
+        self.log_text.insert(tk.END, line)
+        # Keep the widget to the ring buffer's size
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_SCREEN_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.see(tk.END)
+
+    @staticmethod
+    def pane(hemisphere: str) -> str:
+        return "left" if hemisphere.startswith("left") else "right"
+
+    def panes(self, hemisphere: str) -> tuple:
+        if self.pane(hemisphere) == "left":
+            return self.left_request_text, self.left_response_text
+        return self.right_request_text, self.right_response_text
+
+    def render_request(self, hemisphere: str, text: str, request: int):
+        import tkinter as tk
+        self.pane_requests[self.pane(hemisphere)] = request
+        request_text, response_text = self.panes(hemisphere)
+        request_text.delete(1.0, tk.END)
+        request_text.insert(tk.END, text)
+        response_text.delete(1.0, tk.END)
+
+    def render_response(self, hemisphere: str, text: str, request: int):
+        import tkinter as tk
+        if self.pane_requests.get(self.pane(hemisphere)) != request:
+            return  # A parallel vote that no longer owns the pane
+        response_text = self.panes(hemisphere)[1]
+        response_text.delete(1.0, tk.END)
+        response_text.insert(tk.END, text)
+
+    def render_chunk(self, hemisphere: str, chunk: str, request: int):
+        # Streamed text shows up in the response pane as it arrives
+        import tkinter as tk
+        if self.pane_requests.get(self.pane(hemisphere)) != request:
+            return
+        response_text = self.panes(hemisphere)[1]
+        response_text.insert(tk.END, chunk)
+        response_text.see(tk.END)
+
+    def render_command(self, command, args):
+        import tkinter as tk
         self.command_text.delete(1.0, tk.END)
         self.command_text.insert(tk.END, f"Last Command:\n{command or ''}\nArgs:\n{args or ''}")
 
-def read_flat_file(filename: Path) -> str:
-    try:
-        return filename.read_text()
-    except FileNotFoundError:
-        return f"Error: File {filename} not found"
+    def render_paused(self, paused: bool):
+        import tkinter as tk
+        self.status_label.config(text=f"Aiden: {'Paused' if paused else 'Running'}")
+        self.pause_button.config(text="Resume" if paused else "Pause")
+        # User input is only enabled while paused
+        state = tk.NORMAL if paused else tk.DISABLED
+        self.user_input_entry.config(state=state)
+        self.send_user_input_btn.config(state=state)
+
+    def toggle_pause(self):
+        self.agent.set_paused(not self.agent.paused)
+
+    def send_user_input(self):
+        self.agent.post_user_input(self.user_input_entry.get())
 
 def write_flat_file(filename: Path, content: str, append: bool):
     mode = "a" if append else "w"
     with open(filename, mode) as f:
         f.write(content + "\n")
 
-def run_command(ui: AgentUI, command: str, args: str) -> str:
+# --- Memory file reads ---
+MAX_FILE_READ_BYTES = 16384  # Whole-file getfilecontent beyond this returns the head plus paging hints
+MAX_LINE_MATCHES = 20
+DEFAULT_MATCH_CONTEXT = 1
+LINE_INDEX_CACHE_FILES = 32
+
+class LineIndex:
+    """Byte offset of every line start in a file, built in one mmap pass."""
+    def __init__(self, path: Path):
+        import os
+        import mmap
+        from array import array
+        self.offsets = array("Q", [0])
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    pos = mm.find(b"\n")
+                    while pos != -1:
+                        self.offsets.append(pos + 1)
+                        pos = mm.find(b"\n", pos + 1)
+        if self.offsets[-1] == self.size and self.size:
+            self.offsets.pop()  # Trailing newline does not start another line
+        self.line_count = len(self.offsets) if self.size else 0
+
+    def span(self, start_line: int, end_line: int) -> tuple:
+        """Byte range of lines start_line..end_line (1-based, inclusive, clamped). Returns: (start, end)"""
+        start_line = min(max(1, start_line), max(1, self.line_count))
+        end_line = min(max(start_line, end_line), self.line_count)
+        start = self.offsets[start_line - 1] if self.line_count else 0
+        end = self.offsets[end_line] if end_line < self.line_count else self.size
+        return start, end
+
+    def line_of(self, offset: int) -> int:
+        """1-based line number containing a byte offset."""
+        from bisect import bisect_right
+        return bisect_right(self.offsets, offset)
+
+class LineIndexCache:
+    """LineIndex per file, reused until the file's mtime or size changes (LRU over a few files)."""
+    def __init__(self, max_files: int = LINE_INDEX_CACHE_FILES):
+        self.max_files = max_files
+        self._entries = OrderedDict()  # path -> (stat key, LineIndex)
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> LineIndex:
+        stat = path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == key:
+                self._entries.move_to_end(path)
+                return entry[1]
+        index = LineIndex(path)
+        with self._lock:
+            self._entries[path] = (key, index)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+        return index
+
+line_index_cache = LineIndexCache()
+
+def read_bytes(path: Path, offset: int, length: int) -> str:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length).decode("utf-8", errors="replace")
+
+def read_memory_file(path: Path, spec: str = "") -> str:
+    """
+    getfilecontent: spec is "" (whole file, up to MAX_FILE_READ_BYTES), "lines|start[-end]"
+    (1-based, inclusive) or "bytes|offset[|length]". Ranged reads seek straight to the window.
+    """
+    if not path.is_file():
+        return f"Error: File {path} not found"
+    mode, _, window = spec.partition("|")
+    mode = mode.strip().lower()
+    try:
+        if mode == "lines":
+            first, _, last = window.partition("-")
+            start = int(first)
+            end = int(last) if last.strip() else start
+            index = line_index_cache.get(path)
+            if not index.line_count:
+                return f"[{path.name} is empty]"
+            if start > index.line_count:
+                return f"Error: line {start} is out of range ({path.name} has {index.line_count} lines)"
+            begin, finish = index.span(start, end)
+            if finish - begin > MAX_FILE_READ_BYTES:
+                finish = begin + MAX_FILE_READ_BYTES
+            end = index.line_of(max(begin, finish - 1))
+            header = f"[{path.name} lines {min(max(1, start), index.line_count)}-{end} of {index.line_count}]"
+            return f"{header}\n{read_bytes(path, begin, finish - begin)}"
+        if mode == "bytes":
+            offset, _, length = window.partition("|")
+            offset = int(offset)
+            length = int(length) if length.strip() else MAX_FILE_READ_BYTES
+            if offset < 0 or length <= 0:
+                raise ValueError("negative offset or empty window")
+            length = min(length, MAX_FILE_READ_BYTES)
+            size = path.stat().st_size
+            header = f"[{path.name} bytes {offset}-{max(offset, min(offset + length, size))} of {size}]"
+            return f"{header}\n{read_bytes(path, offset, length)}"
+    except ValueError:
+        return "Error: use filename|lines|start[-end] or filename|bytes|offset[|length]"
+    if mode:
+        return f"Error: unknown read mode '{mode}' (use lines or bytes)"
+    size = path.stat().st_size
+    if size <= MAX_FILE_READ_BYTES:
+        return read_bytes(path, 0, size)
+    index = line_index_cache.get(path)
+    shown = index.line_of(MAX_FILE_READ_BYTES) - 1  # Whole lines only
+    end = index.offsets[shown] if shown else MAX_FILE_READ_BYTES
+    return (read_bytes(path, 0, end) +
+            f"[... truncated: showing lines 1-{shown} of {index.line_count} ({size} bytes); "
+            f"read more with {path.name}|lines|start-end or {path.name}|bytes|offset|length]")
+
+def search_file(path: Path, search: str, context: int = DEFAULT_MATCH_CONTEXT, limit: int = MAX_LINE_MATCHES) -> str:
+    """
+    searchmemory on one file: mmap scan for search (case-sensitive), returning only the
+    matching lines with 'context' lines around them, plus line numbers and byte offsets.
+    """
+    import mmap
+    if not path.is_file():
+        return f"Error: File {path} not found"
+    needle = search.encode("utf-8")
+    if not needle or not path.stat().st_size:
+        return "No matches found"
+    index = line_index_cache.get(path)
+    matches = []  # (line, byte offset of first hit on it)
+    more = False
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = mm.find(needle)
+        while pos != -1:
+            if len(matches) >= limit:
+                more = True
+                break
+            line = index.line_of(pos)
+            matches.append((line, pos))
+            next_line = index.offsets[line] if line < index.line_count else index.size
+            pos = mm.find(needle, max(next_line, pos + 1))
+        if not matches:
+            return "No matches found"
+        # Merge overlapping context windows into blocks
+        blocks = []
+        for line, pos in matches:
+            first, last = max(1, line - context), min(index.line_count, line + context)
+            if blocks and first <= blocks[-1][1] + 1:
+                blocks[-1][1] = last
+                blocks[-1][2].append((line, pos))
+            else:
+                blocks.append([first, last, [(line, pos)]])
+        out = []
+        for first, last, hits in blocks:
+            hit_lines = {line for line, _ in hits}
+            offsets = ", ".join(str(pos) for _, pos in hits)
+            out.append(f"lines {first}-{last}, {'matches at bytes' if len(hits) > 1 else 'match at byte'} {offsets}:")
+            for number in range(first, last + 1):
+                begin, end = index.span(number, number)
+                text = mm[begin:end].decode("utf-8", errors="replace").rstrip("\r\n")
+                out.append(f"{number}{'>' if number in hit_lines else ' '} {text}")
+    if more:
+        out.append(f"[more than {limit} matching lines; narrow the search]")
+    return bound_result("\n".join(out))
+
+# --- Memory search ---
+MAX_SEARCH_RESULTS = 10
+MAX_RESULT_CHARS = 4000  # Keeps search results from bloating the next right LLM prompt
+MAX_LIKE_SCAN_ROWS = 2000  # Newest rows checked by the substring fallback when FTS finds nothing
+# seq pins each row's rowid, which the full-text index is keyed on; VACUUM may renumber implicit rowids
+MEMORIES_COLUMNS = "id TEXT UNIQUE NOT NULL, category TEXT, content TEXT, timestamp TEXT, seq INTEGER PRIMARY KEY"
+
+def pin_memory_rowids(conn) -> bool:
+    """
+    Rebuild a memories table from before the explicit seq key, keeping every rowid.
+    Returns: True if the table was migrated (its full-text index should be rebuilt)
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(memories)")]
+    if "seq" in columns:
+        return False
+    with conn:
+        conn.execute(f"CREATE TABLE memories_new ({MEMORIES_COLUMNS})")
+        conn.execute("INSERT INTO memories_new (seq, id, category, content, timestamp) "
+                     "SELECT rowid, id, category, content, timestamp FROM memories")
+        conn.execute("DROP TABLE memories")
+        conn.execute("ALTER TABLE memories_new RENAME TO memories")
+    return True
+
+def init_memory_fts(conn, rebuild: bool = False) -> bool:
+    """
+    Create the memories_fts full-text index and the triggers that keep it in sync with
+    memories. Databases created before the index existed are backfilled once, and
+    rebuild=True re-indexes every row (e.g. after pin_memory_rowids).
+    Returns False if this SQLite build has no FTS5.
+    """
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'memories_fts'").fetchone()
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts "
+            "USING fts5(content, content='memories', content_rowid='rowid')"
+        )
+    except sqlite3.OperationalError:
+        return False
+    conn.executescript("""
+        CREATE TRIGGER IF NOT EXISTS memories_fts_insert AFTER INSERT ON memories BEGIN
+            INSERT INTO memories_fts(rowid, content) VALUES (new.rowid, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_fts_delete AFTER DELETE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_fts_update AFTER UPDATE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            INSERT INTO memories_fts(rowid, content) VALUES (new.rowid, new.content);
+        END;
+    """)
+    if rebuild or not existed:
+        conn.execute("INSERT INTO memories_fts(memories_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+def fts_query(search: str) -> str:
+    # Quote every term so text from the LLM can't inject FTS5 query syntax; each term
+    # is a prefix, so "friend" still finds "friendship" as the old LIKE search did
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in search.split())
+
+def search_memories(conn, search: str, category: str = None, limit: int = MAX_SEARCH_RESULTS, fts: bool = True) -> list:
+    """
+    Top-k memory search. With FTS5, rows are ranked by BM25 and returned as snippets;
+    when no word starts with the search terms (e.g. a match mid-word) the newest
+    MAX_LIKE_SCAN_ROWS rows are checked with LIKE. Without FTS5 every row is scanned.
+    Returns: list of "id [category]: text" strings
+    """
+    if fts:
+        query = fts_query(search)
+        if not query:
+            return []
+        sql = (
+            "SELECT m.id, m.category, snippet(memories_fts, 0, '[', ']', '...', 16) "
+            "FROM memories_fts JOIN memories m ON m.rowid = memories_fts.rowid "
+            "WHERE memories_fts MATCH ?"
+        )
+        params = [query]
+        if category:
+            sql += " AND m.category = ?"
+            params.append(category)
+        sql += " ORDER BY bm25(memories_fts) LIMIT ?"
+        params.append(limit)
+        rows = conn.execute(sql, params).fetchall()
+        if rows:
+            return [f"{row[0]} [{row[1]}]: {row[2]}" for row in rows]
+    where, params = ("WHERE category = ?", [category]) if category else ("", [])
+    if fts:
+        # Bounded: a search that matches nothing must not turn back into a full-table scan
+        source = f"(SELECT * FROM memories {where} ORDER BY timestamp DESC LIMIT ?)"
+        params.append(MAX_LIKE_SCAN_ROWS)
+    else:
+        source = f"(SELECT * FROM memories {where})"
+    sql = f"SELECT id, category, content FROM {source} WHERE content LIKE ? ORDER BY timestamp DESC LIMIT ?"
+    params += [f"%{search}%", limit]
+    return [f"{row[0]} [{row[1]}]: {row[2]}" for row in conn.execute(sql, params).fetchall()]
+
+def bound_result(result: str, max_chars: int = MAX_RESULT_CHARS) -> str:
+    if len(result) <= max_chars:
+        return result
+    return result[:max_chars] + f"\n... [truncated {len(result) - max_chars} chars]"
+
+# --- Semantic recall ---
+SEMANTIC_DIM = 256
+MAX_RECALL_RESULTS = 5
+RECALL_SNIPPET_CHARS = 400
+
+def embed_text(text: str, dim: int = SEMANTIC_DIM):
+    """
+    Offline text embedding: signed feature hashing of words and character trigrams,
+    L2-normalised so a dot product is the cosine similarity.
+    """
+    import numpy as np
+    words = re.findall(r"\w+", text.lower())
+    padded = f" {' '.join(words)} "
+    features = words + [padded[i:i + 3] for i in range(len(padded) - 2)]
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class SemanticIndex:
+    """
+    Vector index over memories.content for network-free semantic recall.
+    Each vector is stored as a BLOB in memory_vectors and appended to a flat float32
+    matrix file; queries memory-map that file and run a vectorised cosine top-k.
+    Inserts append one row, so the index never has to be rebuilt as it grows.
+    """
+    def __init__(self, conn, matrix_path: Path, dim: int = SEMANTIC_DIM):
+        import numpy  # noqa: F401  (fail early if numpy is missing)
+        self.conn = conn
+        self.matrix_path = Path(matrix_path)
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._matrix = None
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_vectors (
+                row INTEGER PRIMARY KEY,
+                memory_id TEXT UNIQUE,
+                vector BLOB
+            )
+        """)
+        self.conn.commit()
+        self.sync()
+
+    def sync(self):
+        """Repair the matrix file from the stored BLOBs if needed, then index any unindexed memories."""
+        with self._lock:
+            # Only the ids stay in memory; the BLOBs are streamed, and only when the file needs repair
+            self._ids = [row[0] for row in self.conn.execute("SELECT memory_id FROM memory_vectors ORDER BY row")]
+            expected_size = len(self._ids) * self.dim * 4
+            if not self.matrix_path.exists() or self.matrix_path.stat().st_size != expected_size:
+                with open(self.matrix_path, "wb") as f:
+                    for (vector,) in self.conn.execute("SELECT vector FROM memory_vectors ORDER BY row"):
+                        f.write(vector)
+            self._matrix = None
+        missing = self.conn.execute(
+            "SELECT id, content FROM memories WHERE id NOT IN (SELECT memory_id FROM memory_vectors) ORDER BY rowid"
+        ).fetchall()
+        for memory_id, content in missing:
+            self.add(memory_id, content or "")
+
+    def add(self, memory_id: str, content: str):
+        vector = embed_text(content, self.dim).tobytes()
+        with self._lock:
+            row = len(self._ids)
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO memory_vectors (row, memory_id, vector) VALUES (?, ?, ?)",
+                (row, memory_id, vector),
+            )
+            if not cursor.rowcount:
+                return
+            self.conn.commit()
+            with open(self.matrix_path, "ab") as f:
+                f.write(vector)
+            self._ids.append(memory_id)
+            self._matrix = None  # Re-map with the new shape on the next query
+
+    def search(self, query: str, k: int = MAX_RECALL_RESULTS) -> list:
+        """Returns: list of (memory_id, cosine score), best first"""
+        import numpy as np
+        with self._lock:
+            count = len(self._ids)
+            if not count:
+                return []
+            if self._matrix is None:
+                self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+            matrix, ids = self._matrix, self._ids
+        scores = matrix @ embed_text(query, self.dim)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top]
+
+def recall_memories(conn, index: SemanticIndex, query: str, k: int = MAX_RECALL_RESULTS) -> list:
+    """Returns: list of "id [category] (score): text" strings for the closest memories"""
+    hits = index.search(query, k)
+    if not hits:
+        return []
+    placeholders = ",".join("?" * len(hits))
+    rows = {
+        row[0]: row[1:]
+        for row in conn.execute(
+            f"SELECT id, category, content FROM memories WHERE id IN ({placeholders})", [h[0] for h in hits]
+        )
+    }
+    results = []
+    for memory_id, score in hits:
+        if memory_id in rows:
+            category, content = rows[memory_id]
+            results.append(f"{memory_id} [{category}] ({score:.2f}): {(content or '')[:RECALL_SNIPPET_CHARS]}")
+    return results
+
+# --- Command executor ---
+DEFAULT_COMMAND_WORKERS = 2
+DEFAULT_COMMAND_TIMEOUT = 60  # Wall-clock seconds
+DEFAULT_COMMAND_CPU_SECONDS = 30
+DEFAULT_OUTPUT_HEAD = 2000  # Bytes of output kept from the start ...
+DEFAULT_OUTPUT_TAIL = 2000  # ... and from the end
+
+class OutputCapture:
+    """Keeps the first head_bytes and last tail_bytes of a stream, counting what is dropped in between."""
+    def __init__(self, head_bytes: int = DEFAULT_OUTPUT_HEAD, tail_bytes: int = DEFAULT_OUTPUT_TAIL):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[:len(self.tail) - self.tail_bytes]
+
+    def text(self) -> str:
+        dropped = self.total - len(self.head) - len(self.tail)
+        middle = f"\n... [{dropped} bytes truncated] ...\n".encode() if dropped else b""
+        return bytes(self.head + middle + self.tail).decode("utf-8", errors="replace")
+
+class CommandResult:
+    """Outcome of one executed process. 'stopped' is None, "timeout", "cpu_limit" or "cancelled"."""
+    def __init__(self, argv, returncode, stdout: str, stderr: str, wall_seconds: float,
+                 rusage=None, stopped: str = None, error: str = None):
+        self.argv = argv
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.wall_seconds = wall_seconds
+        self.rusage = rusage  # resource.struct_rusage on POSIX, None elsewhere
+        self.stopped = stopped
+        self.error = error
+
+    def summary(self) -> str:
+        """Result text for the LLM: status line, then stdout and stderr."""
+        if self.error:
+            return f"Command error: {self.error}"
+        status = {
+            "timeout": "killed: wall-clock timeout",
+            "cpu_limit": "killed: CPU time limit",
+            "cancelled": "cancelled: agent paused",
+        }.get(self.stopped, f"exit code {self.returncode}")
+        status += f"; wall {self.wall_seconds:.2f}s"
+        if self.rusage is not None:
+            max_rss_kb = self.rusage.ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+            status += f"; cpu {self.rusage.ru_utime + self.rusage.ru_stime:.2f}s; max rss {max_rss_kb} KB"
+        parts = [f"[{status}]"]
+        if self.stdout:
+            parts.append(self.stdout)
+        if self.stderr:
+            parts.append(f"stderr:\n{self.stderr}")
+        return "\n".join(parts)
+
+class CommandExecutor:
+    """
+    Runs subprocesses on a bounded worker pool so a hung or noisy script cannot stall the agent.
+    Each process gets a wall-clock timeout, a CPU-time limit (RLIMIT_CPU via prlimit, where the
+    platform has it), and stdout/stderr capped to head + tail. Processes run in their own
+    process group; cancel_all() kills every one of them, e.g. when the agent is paused.
+    submit() returns a Future of CommandResult, so long-running tool verbs can share it.
+    Configured from the "commands" section of hemisphere.json (see CONFIG_KEYS).
+    """
+    def __init__(self, max_workers: int = DEFAULT_COMMAND_WORKERS, timeout: float = DEFAULT_COMMAND_TIMEOUT,
+                 cpu_seconds: int = DEFAULT_COMMAND_CPU_SECONDS, output_head: int = DEFAULT_OUTPUT_HEAD,
+                 output_tail: int = DEFAULT_OUTPUT_TAIL):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.output_head = output_head
+        self.output_tail = output_tail
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="command")
+        self._cancels = set()  # cancel Events of queued and running jobs
+        self._lock = threading.Lock()
+
+    CONFIG_KEYS = ("max_workers", "timeout", "cpu_seconds", "output_head", "output_tail")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(**{k: v for k, v in (config or {}).items() if k in cls.CONFIG_KEYS})
+
+    def submit(self, argv: list, cwd: Path = None, timeout: float = None, cpu_seconds: int = None):
+        cancel = threading.Event()
+        with self._lock:
+            self._cancels.add(cancel)
+        future = self.pool.submit(self._run, [str(a) for a in argv], cwd,
+                                  timeout or self.timeout, cpu_seconds or self.cpu_seconds, cancel)
+        future.add_done_callback(lambda _: self._forget(cancel))
+        return future
+
+    def run(self, argv: list, cwd: Path = None, timeout: float = None, cpu_seconds: int = None) -> CommandResult:
+        return self.submit(argv, cwd, timeout, cpu_seconds).result()
+
+    def cancel_all(self):
+        with self._lock:
+            cancels = list(self._cancels)
+        for cancel in cancels:
+            cancel.set()
+
+    def close(self):
+        self.cancel_all()  # Queued jobs see their cancel event and return without starting a process
+        self.pool.shutdown(wait=True)
+
+    def _forget(self, cancel):
+        with self._lock:
+            self._cancels.discard(cancel)
+
+    def _run(self, argv, cwd, timeout, cpu_seconds, cancel) -> CommandResult:
+        import os
+        import signal
+        import subprocess
+        start = time.perf_counter()
+        if cancel.is_set():
+            return CommandResult(argv, None, "", "", 0.0, stopped="cancelled")
+        try:
+            proc = subprocess.Popen(argv, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, bufsize=0, start_new_session=(os.name == "posix"))
+        except OSError as e:
+            return CommandResult(argv, None, "", "", time.perf_counter() - start, error=str(e))
+        limit_cpu(proc.pid, cpu_seconds)
+
+        captures = [OutputCapture(self.output_head, self.output_tail) for _ in range(2)]
+        readers = [threading.Thread(target=drain_pipe, args=(pipe, capture), daemon=True)
+                   for pipe, capture in zip((proc.stdout, proc.stderr), captures)]
+        for reader in readers:
+            reader.start()
+
+        exited = threading.Event()
+        status = {}
+        def wait_child():
+            try:
+                if hasattr(os, "wait4"):
+                    _, raw_status, status["rusage"] = os.wait4(proc.pid, 0)
+                    proc.returncode = (-os.WTERMSIG(raw_status) if os.WIFSIGNALED(raw_status)
+                                       else os.WEXITSTATUS(raw_status))
+                else:
+                    proc.wait()
+            finally:
+                exited.set()  # Never leave _run waiting on a child it cannot reap
+        threading.Thread(target=wait_child, daemon=True).start()
+
+        deadline = start + timeout
+        stopped = None
+        while not exited.wait(min(0.1, max(0.0, deadline - time.perf_counter()))):
+            if cancel.is_set():
+                stopped = "cancelled"
+            elif time.perf_counter() >= deadline:
+                stopped = "timeout"
+            else:
+                continue
+            kill_process_group(proc)
+            exited.wait()
+            break
+        for reader in readers:
+            reader.join(1)  # Background grandchildren may hold the pipes open
+        wall_seconds = time.perf_counter() - start
+        rusage = status.get("rusage")
+        if stopped is None and cpu_seconds and rusage is not None \
+                and proc.returncode in (-signal.SIGXCPU, -signal.SIGKILL) \
+                and rusage.ru_utime + rusage.ru_stime >= cpu_seconds * 0.95:
+            stopped = "cpu_limit"  # SIGXCPU at the soft limit, SIGKILL at the hard one
+        return CommandResult(argv, proc.returncode, captures[0].text(), captures[1].text(),
+                             wall_seconds, rusage, stopped)
+
+def drain_pipe(pipe, capture: OutputCapture):
+    import os
+    try:
+        while True:
+            data = os.read(pipe.fileno(), 65536)
+            if not data:
+                break
+            capture.write(data)
+    except (OSError, ValueError):
+        pass
+    finally:
+        pipe.close()
+
+def limit_cpu(pid: int, cpu_seconds: int):
+    """Set RLIMIT_CPU on a child where the platform supports prlimit (Linux); no-op elsewhere."""
+    if not cpu_seconds:
+        return
+    try:
+        import resource
+        resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    except (ImportError, AttributeError, OSError, ValueError):
+        pass
+
+def kill_process_group(proc):
+    import os
+    import signal
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+# --- Outbound mail ---
+DEFAULT_MAIL_BATCH = 20
+DEFAULT_MAIL_ATTEMPTS = 8
+DEFAULT_MAIL_RETRY = 30  # Seconds before the first retry; doubles per attempt
+DEFAULT_SMTP_IDLE = 60  # Seconds an idle connection is kept before it is closed and re-opened
+SMTP_NOOP_AFTER = 10  # Seconds idle after which a connection is checked with NOOP before reuse
+
+class SMTPConnection:
+    """
+    One reusable, authenticated SMTP connection.
+    Connects (STARTTLS + login) on first use and keeps the session for later messages;
+    a connection idle longer than idle_timeout is re-opened, a shorter idle is checked with
+    NOOP, and a send that finds the connection dropped reconnects once and resends.
+    """
+    def __init__(self, host: str, port: int, user: str = "", password: str = "", starttls: bool = True,
+                 idle_timeout: float = DEFAULT_SMTP_IDLE, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.server = None
+        self.last_used = 0.0
+
+    def send(self, msg: "EmailMessage") -> dict:
+        """Returns: refused recipients {address: (code, message)}, as smtplib reports them."""
+        import smtplib
+        for attempt in range(2):
+            server = self._connection()
+            try:
+                refused = server.send_message(msg)
+                self.last_used = time.monotonic()
+                return refused
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close_if_idle(self):
+        if self.server and time.monotonic() - self.last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        import smtplib
+        server, self.server = self.server, None
+        if server:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+    def _connection(self) -> "smtplib.SMTP":
+        import smtplib
+        idle = time.monotonic() - self.last_used
+        if self.server and idle > self.idle_timeout:
+            self.close()
+        elif self.server and idle > SMTP_NOOP_AFTER:
+            try:
+                if self.server.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self.server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                server.ehlo()
+                if self.starttls:
+                    server.starttls()
+                    server.ehlo()
+                if self.user:
+                    server.login(self.user, self.password)
+            except Exception:
+                server.close()
+                raise
+            metrics.inc("aiden_smtp_connects_total")
+            self.server = server
+            self.last_used = time.monotonic()
+        return self.server
+
+def permanent_mail_error(error: Exception) -> bool:
+    """Errors a retry cannot fix: refused sender/recipients and other 5xx replies (bad logins excepted)."""
+    import smtplib
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)):
+        return True
+    return (isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+            and not isinstance(error, smtplib.SMTPAuthenticationError))
+
+class MailOutbox:
+    """
+    Durable outbound mail queue.
+    enqueue() stores the message in SQLite and returns at once; a background worker sends due
+    messages in batches over one SMTPConnection. Temporary failures are retried with exponential
+    backoff (the schedule survives restarts); permanent ones and messages out of attempts are
+    marked failed. Delivery is at-least-once: a crash mid-send can resend a message.
+    Configured from the "email" section of hemisphere.json (see CONFIG_KEYS).
+    """
+    def __init__(self, db_path: Path, smtp: SMTPConnection, batch_size: int = DEFAULT_MAIL_BATCH,
+                 max_attempts: int = DEFAULT_MAIL_ATTEMPTS, retry_base: float = DEFAULT_MAIL_RETRY,
+                 poll_interval: float = 30, log=None):
+        self.smtp = smtp
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.log = log or (lambda message, level="INFO": None)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    from_addr TEXT, to_addr TEXT, subject TEXT, body TEXT,
+                    status TEXT,
+                    attempts INTEGER,
+                    next_attempt REAL,
+                    last_error TEXT,
+                    created REAL,
+                    sent REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt)")
+            self.conn.commit()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    CONFIG_KEYS = ("batch_size", "max_attempts", "retry_base", "poll_interval")
+    SMTP_KEYS = ("starttls", "idle_timeout", "timeout")
+
+    @classmethod
+    def from_config(cls, db_path: Path, host: str, port: int, user: str, password: str, config: dict, log=None):
+        config = config or {}
+        smtp = SMTPConnection(host, port, user, password, **{k: v for k, v in config.items() if k in cls.SMTP_KEYS})
+        return cls(db_path, smtp, log=log, **{k: v for k, v in config.items() if k in cls.CONFIG_KEYS})
+
+    def enqueue(self, from_addr: str, to_addr: str, subject: str, body: str) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO outbox (from_addr, to_addr, subject, body, status, attempts, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, 'queued', 0, ?, ?)", (from_addr, to_addr, subject, body, now, now))
+            self.conn.commit()
+        self.wake.set()
+        return cursor.lastrowid
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def close(self):
+        self.stopped.set()
+        self.wake.set()
+        self.thread.join(timeout=10)
+        self.smtp.close()
+        with self._lock:
+            self.conn.close()
+
+    def _due(self) -> list:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, from_addr, to_addr, subject, body, attempts FROM outbox "
+                "WHERE status = 'queued' AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (time.time(), self.batch_size)).fetchall()
+
+    def _next_wait(self) -> float:
+        with self._lock:
+            row = self.conn.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'queued'").fetchone()
+        if row[0] is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.0, row[0] - time.time()))
+
+    def _run(self):
+        while not self.stopped.is_set():
+            batch = self._due()
+            if not batch:
+                self.smtp.close_if_idle()
+                self.wake.wait(self._next_wait())
+                self.wake.clear()
+                continue
+            for row in batch:
+                if self.stopped.is_set():
+                    break
+                self._send(*row)
+
+    def _send(self, id_, from_addr, to_addr, subject, body, attempts):
+        from email.message import EmailMessage
+        msg = EmailMessage()
+        msg.set_content(body)
+        msg["Subject"] = subject
+        msg["From"] = from_addr
+        msg["To"] = to_addr
+        try:
+            refused = self.smtp.send(msg)
+        except Exception as e:
+            attempts += 1
+            if permanent_mail_error(e) or attempts >= self.max_attempts:
+                status, next_attempt = "failed", None
+                metrics.inc("aiden_mail_messages_total", result="failed")
+                self.log(f"Email {id_} to {to_addr} failed after {attempts} attempts: {e}", "ERROR")
+            else:
+                status = "queued"
+                next_attempt = time.time() + self.retry_base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+                metrics.inc("aiden_mail_messages_total", result="retry")
+                self.log(f"Email {id_} to {to_addr} not sent (attempt {attempts}), retrying: {e}", "WARNING")
+            with self._lock:
+                self.conn.execute("UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? "
+                                  "WHERE id = ?", (status, attempts, next_attempt, str(e), id_))
+                self.conn.commit()
+            return
+        with self._lock:
+            self.conn.execute("UPDATE outbox SET status = 'sent', attempts = ?, sent = ?, last_error = ? WHERE id = ?",
+                              (attempts + 1, time.time(), str(refused) if refused else None, id_))
+            self.conn.commit()
+        metrics.inc("aiden_mail_messages_total", result="sent")
+        self.log(f"Email {id_} sent to {to_addr}" + (f" (refused: {refused})" if refused else ""))
+
+COMMAND_VERBS = ("filewrite", "creatememoryentry", "writeflatfile", "getfilecontent", "listmemoryfiles",
+                 "searchmemory", "recallmemory", "sendemail", "runcommand", "browseweb")
+
+def command_label(command: str) -> str:
+    """Metric label for a verb; anything the LLM invents is folded into "unknown"."""
+    return command if command in COMMAND_VERBS else "unknown"
+
+def run_command(agent: Agent, command: str, args: str) -> str:
     if command == "filewrite":
         type_, filename, content = args.split("|")
         if type_ == "script":
-            path = SCRIPT_DIR / filename
+            path = agent.script_dir / filename
         elif type_ == "memory":
-            path = MEMORY_DIR / filename
+            path = agent.memory_dir / filename
         else:
             return "Error: Invalid file type"
         write_flat_file(path, content, False)
         return f"Wrote to {path}"
     elif command == "creatememoryentry":
         category, content = args.split("|", 1)
-        timestamp = datetime.now().isoformat()
-        id_ = f"{timestamp}-{hash(content) % 1000}"
-        cursor = ui.conn.cursor()
-        cursor.execute("INSERT INTO memories (id, category, content, timestamp) VALUES (?, ?, ?, ?)",
-                       (id_, category, content, timestamp))
-        ui.conn.commit()
+        id_ = agent.add_memory(category, content)
         return f"Memory entry created: {id_}"
     elif command == "writeflatfile":
         filename, content, append = args.split("|")
         append = append.lower() == "true"
-        path = MEMORY_DIR / filename
+        path = agent.memory_dir / filename
         write_flat_file(path, content, append)
         return f"Wrote to {path}"
     elif command == "getfilecontent":
-        filename = args
-        path = MEMORY_DIR / filename
-        return read_flat_file(path)
+        # filename, filename|lines|start[-end] or filename|bytes|offset[|length]
+        filename, _, spec = args.partition("|")
+        return read_memory_file(agent.memory_dir / filename, spec)
     elif command == "listmemoryfiles":
-        files = [f.name for f in MEMORY_DIR.iterdir() if f.is_file()]
+        files = [f.name for f in agent.memory_dir.iterdir() if f.is_file()]
         return "\n".join(files)
     elif command == "searchmemory":
-        filename, search = args.split("|")
+        # filename|search[|context[|limit]], or ALL|search[|category[|limit]] for the memory DB
+        filename, search, *options = args.split("|")
         if filename == "ALL":
-            cursor = ui.conn.cursor()
-            cursor.execute("SELECT id, content FROM memories WHERE content LIKE ?", (f"%{search}%",))
-            results = [f"{row[0]}: {row[1]}" for row in cursor.fetchall()]
-            return "\n".join(results) or "No matches found"
+            category = options[0] if options and options[0] else None
+            limit = int(options[1]) if len(options) > 1 and options[1].isdigit() else MAX_SEARCH_RESULTS
+            with agent.db_lock:
+                results = search_memories(agent.conn, search, category, min(limit, MAX_SEARCH_RESULTS * 5), agent.fts_enabled)
+            return bound_result("\n".join(results)) or "No matches found"
         else:
-            path = MEMORY_DIR / filename
-            content = read_flat_file(path)
-            if search in content:
-                return content
-            return "No matches found"
+            context = int(options[0]) if options and options[0].isdigit() else DEFAULT_MATCH_CONTEXT
+            limit = int(options[1]) if len(options) > 1 and options[1].isdigit() else MAX_LINE_MATCHES
+            return search_file(agent.memory_dir / filename, search, min(context, 10), min(limit, MAX_LINE_MATCHES * 5))
+    elif command == "recallmemory":
+        # query[|k]: semantic nearest-neighbour search over the memory DB
+        query, _, k = args.partition("|")
+        if not agent.semantic_index:
+            return "Error: recallmemory needs numpy installed"
+        k = int(k) if k.isdigit() else MAX_RECALL_RESULTS
+        with agent.db_lock:
+            results = recall_memories(agent.conn, agent.semantic_index, query, min(k, MAX_RECALL_RESULTS * 4))
+        return bound_result("\n".join(results)) or "No matches found"
     elif command == "sendemail":
         from_addr, to_addr, subject, body = args.split("|")
-        msg = EmailMessage()
-        msg.set_content(body)
-        msg["Subject"] = subject
-        msg["From"] = from_addr
-        msg["To"] = to_addr
-        try:
-            with smtplib.SMTP(ui.smtp_host, ui.smtp_port) as server:
-                server.starttls()
-                server.login(ui.email_user, ui.email_password)
-                server.send_message(msg)
-            return "Email sent successfully"
-        except Exception as e:
-            return f"Email error: {str(e)}"
+        if not agent.outbox:
+            return "Email error: email is not configured (memory/EmailCred.txt)"
+        # Sent by the outbox worker; the agent does not wait for SMTP
+        id_ = agent.outbox.enqueue(from_addr, to_addr, subject, body)
+        return f"Email queued for delivery (outbox id {id_})"
     elif command == "runcommand":
         path, cmd, cmd_args = args.split("|")
         if path == ".":
-            path = BASE_DIR
+            path = agent.base_dir
         elif path == "scripts":
-            path = SCRIPT_DIR
+            path = agent.script_dir
         elif path == "tools":
-            path = BASE_DIR / "tools"
+            path = agent.base_dir / "tools"
         else:
             return "Error: Invalid path"
-        import subprocess
-        try:
-            result = subprocess.run([path / cmd] + cmd_args.split(), capture_output=True, text=True)
-            return result.stdout or result.stderr
-        except Exception as e:
-            return f"Command error: {str(e)}"
+        # Absolute, since a relative argv[0] would be looked up again from inside cwd
+        result = agent.executor.run([(path / cmd).resolve()] + cmd_args.split(), cwd=path)
+        agent.log(f"runcommand {cmd}: exit {result.returncode}, stopped={result.stopped}, {result.wall_seconds:.2f}s")
+        return result.summary()
     elif command == "browseweb":
         url = args
         return f"Browse web not supported in API mode. (URL: {url})"
     return "Unknown command"
 
-def process_response(ui: AgentUI, response: str) -> tuple:
+def process_response(agent: Agent, response: str) -> tuple:
     if not isinstance(response, str) or not response:
-        ui.log("process_response: Received empty or non-string response")
+        agent.log("process_response: Received empty or non-string response", "WARNING")
         return None, None
-    match = re.search(r"\{\{?#(.+?)(?:#|\})\}\s*(.*?)(?:\{|\[)END_CMD(?:\}|\])", response)
+    match = COMMAND_PATTERN.search(response)
     if not match:
         return None, None
     command, args = match.groups()
     return command, args
 
-def interact_with_llm(ui: AgentUI, hemisphere: str, user_input: str):
+def process_commands(agent: Agent, response: str, limit: int) -> list:
+    """All commands in a response, in order, in one regex pass. Returns: [(command, args)] (at most limit)"""
+    if not isinstance(response, str) or not response:
+        return []
+    commands = []
+    for match in COMMAND_PATTERN.finditer(response):
+        commands.append(match.groups())
+        if len(commands) >= limit:
+            break
+    return commands
+
+# Side-effect-free verbs: safe to run before the left LLM agrees and to throw the result away
+PURE_VERBS = frozenset({"getfilecontent", "listmemoryfiles", "searchmemory", "recallmemory"})
+
+def speculable(resources: list) -> list:
+    """
+    Commands that may run before agreement: pure verbs that read nothing an earlier
+    command in the batch writes, so running them first gives the same result.
+    resources: [(command, reads, writes)] in command order
+    Returns: indexes of the speculable commands
+    """
+    indexes = []
+    written = set()
+    for i, (command, reads, writes) in enumerate(resources):
+        if command in PURE_VERBS and "*" not in written and not reads & written:
+            indexes.append(i)
+        written |= writes
+    return indexes
+
+def command_resources(agent: Agent, command: str, args: str) -> tuple:
+    """
+    What a command reads and writes, for ordering batched commands.
+    Returns: (reads, writes) as sets of resource names; "*" in writes means it must run alone.
+    """
+    parts = args.split("|")
+    memory_file = lambda name: f"file:{agent.memory_dir / name}"
+    if command == "filewrite" and len(parts) >= 2:
+        folder = agent.script_dir if parts[0] == "script" else agent.memory_dir
+        return set(), {f"file:{folder / parts[1]}", "listing"}
+    if command == "writeflatfile":
+        return set(), {memory_file(parts[0]), "listing"}
+    if command == "getfilecontent":
+        return {memory_file(parts[0])}, set()
+    if command == "listmemoryfiles":
+        return {"listing"}, set()
+    if command == "searchmemory":
+        return ({"db"} if parts[0] == "ALL" else {memory_file(parts[0])}), set()
+    if command == "recallmemory":
+        return {"db"}, set()
+    if command == "creatememoryentry":
+        return set(), {"db"}
+    if command == "sendemail":
+        return set(), {"smtp"}
+    return set(), {"*"}  # runcommand and anything unknown: side effects are unknowable
+
+def plan_waves(resources: list) -> list:
+    """
+    Group commands into waves: a command goes one wave after the last earlier command it
+    conflicts with (shared resource, at least one writer), so order-dependent commands keep
+    their order and independent ones share a wave.
+    resources: [(reads, writes)] in command order
+    Returns: [[command index, ...], ...]
+    """
+    waves = []
+    placed = []  # wave index per command
+    for i, (reads, writes) in enumerate(resources):
+        wave = 0
+        for j in range(i):
+            other_reads, other_writes = resources[j]
+            if "*" in writes or "*" in other_writes or writes & (other_reads | other_writes) or reads & other_writes:
+                wave = max(wave, placed[j] + 1)
+        placed.append(wave)
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(i)
+    return waves
+
+class LLMError(str):
+    """
+    interact_with_llm's "Error: ..." result once every endpoint has failed.
+    It is still a string for callers that show it; the agent loop recognises it and, instead of
+    handing the error text to the other hemisphere, re-queues 'retry' (an inbox message) later.
+    """
+    def __new__(cls, text: str, hemisphere: str = None, prompt: str = None):
+        error = super().__new__(cls, text)
+        error.hemisphere = hemisphere
+        error.retry = ("prompt", prompt) if hemisphere == "right" else None
+        return error
+
+llm_request_ids = itertools.count(1)  # Tags each LLM call for the front end
+
+def interact_with_llm(agent: Agent, hemisphere: str, user_input: str, cancel=None,
+                      priority: int = CONTEXT_PRIORITY_NORMAL, use_context: bool = True, stop_on_command: bool = None,
+                      use_cache: bool = True):
     """
     hemisphere: "left" or "right" or any node name
     user_input: prompt string
+    cancel: optional threading.Event used to abandon a streamed response
+    priority: how long the exchange is worth keeping in the hemisphere's context
+    use_context: False sends user_input on its own even if the hemisphere keeps a context
+    stop_on_command: overrides the model's 'stop_on_command' for this call (False for replies with several commands)
+    use_cache: False always asks the LLM; correction and retry prompts repeat verbatim after a rejected reply
     """
-    model_info = ui.api_config[hemisphere]
-    provider = model_info.get("provider", "huggingface").lower()
+    model_info = agent.api_config[hemisphere]
+    if stop_on_command is not None:
+        model_info = dict(model_info, stop_on_command=stop_on_command)
+    provider = endpoints_for(model_info)[0].get("provider", "huggingface").lower()
+    frontend = agent.frontend
+    request = next(llm_request_ids)
+
+    def on_chunk(chunk):
+        frontend.append_response(hemisphere, chunk, request)
+
+    context = agent.contexts.get(hemisphere) if use_context else None
     try:
-        ui.log(f"Sending to {hemisphere} ({provider}) LLM: {user_input}")
-        if hemisphere == "left":
-            ui.left_request_text.delete(1.0, tk.END)
-            ui.left_request_text.insert(tk.END, user_input)
-        else:
-            ui.right_request_text.delete(1.0, tk.END)
-            ui.right_request_text.insert(tk.END, user_input)
-        if provider == "openrouter":
-            response = openrouter_infer(model_info, user_input)
-        else:
-            response = hf_infer(model_info, user_input)
-        if hemisphere == "left":
-            ui.left_response_text.delete(1.0, tk.END)
-            ui.left_response_text.insert(tk.END, response)
+        prompt = context.build(user_input) if context else user_input
+        history = f" with {len(prompt) - 2} context messages" if context else ""
+        agent.log(f"Sending to {hemisphere} ({provider}) LLM{history}", payload=user_input)
+        frontend.show_request(hemisphere, user_input, request)
+        cache_key = ResponseCache.make_key(model_info, prompt) if use_cache and cache_enabled(model_info) else None
+        response = response_cache.get(cache_key) if cache_key else None
+        labels = {"hemisphere": hemisphere, "model": model_info.get("model", "")}
+        if response is not None:
+            stats = response_cache.stats()
+            metrics.inc("aiden_llm_cache_hits_total", **labels)
+            agent.log(f"Cache hit for {hemisphere} ({provider}) LLM (hits={stats['hits']}, misses={stats['misses']})")
         else:
-            ui.right_response_text.delete(1.0, tk.END)
-            ui.right_response_text.insert(tk.END, response)
-        ui.log(f"Received from {hemisphere} ({provider}) LLM: {response}")
+            usage = {}
+            response = endpoint_router.call(hemisphere, model_info, prompt, on_chunk, cancel, usage, agent.log,
+                                            lambda provider: agent.scheduler.slot(agent.session_id, provider))
+            if usage and context:
+                context.calibrate(sum(len(m["content"]) for m in prompt), usage.get("prompt_tokens", 0))
+            # A reply that raced a cancel may be cut short; never let it answer later calls
+            if cache_key and not (cancel is not None and cancel.is_set()):
+                response_cache.put(cache_key, response, model_info.get("cache_ttl"))
+        if context:
+            context.record(user_input, response, priority)
+        frontend.show_response(hemisphere, response, request)
+        agent.log(f"Received from {hemisphere} ({provider}) LLM", payload=response)
         return response
+    except StreamCancelled as e:
+        agent.log(f"Abandoned {hemisphere} ({provider}) LLM response: {str(e)}")
+        return LLMError(f"Error: {str(e)}", hemisphere, user_input)
     except Exception as e:
-        ui.log(f"Error interacting with {hemisphere} ({provider}) LLM: {str(e)}")
-        return f"Error: {str(e)}"
-
-def agent_loop(ui, get_right_response, get_command, get_args, agent2_prompt):
-    global right_response, command, args
-    while True:
-        if ui.paused or not ui.initial_prompt_sent or not ui.awaiting_command:
-            time.sleep(0.01)
-            continue
+        agent.log(f"Error interacting with {hemisphere} ({provider}) LLM: {str(e)}", "ERROR")
+        return LLMError(f"Error: {str(e)}", hemisphere, user_input)
 
-        if right_response is None:
-            time.sleep(0.01)
-            continue
+UNAVAILABLE_BACKOFF_MAX = 120  # Seconds between retries of a step while an LLM is unreachable
 
-        command, args = process_response(ui, right_response)
-        ui.show_command(command, args)
-        if not command:
-            llm_message = (
-                "Bad command received. Please reply with ONLY a single valid command in the following format, and nothing else:\n"
-                "{{#command#}args[END_CMD]\n"
-                "For example: {{#filewrite#}script|myscript.py|print('hello')[END_CMD]"
-            )
-            right_response = interact_with_llm(ui, "right", llm_message)
-            ui.log("Sent bad command prompt to right LLM")
-            continue
+BATCH_PROMPT_NOTE = (
+    "\n\nBatch mode: you may send up to {max_batch} commands in one response, each terminated with [END_CMD]. "
+    "They are verified together and run in the order given (independent ones in parallel); "
+    "all results come back in one message."
+)
+MAX_BATCH_WORKERS = 4
 
-        ui.awaiting_command = False
+BAD_COMMAND_PROMPT = (
+    "Bad command received. Please reply with ONLY a single valid command in the following format, and nothing else:\n"
+    "{{#command#}args[END_CMD]\n"
+    "For example: {{#filewrite#}script|myscript.py|print('hello')[END_CMD]"
+)
+BATCH_BAD_COMMAND_PROMPT = (
+    "Bad command received. Please reply with ONLY valid commands (up to %d), each in the following format, "
+    "and nothing else:\n"
+    "{{#command#}args[END_CMD]\n"
+    "For example: {{#filewrite#}script|myscript.py|print('hello')[END_CMD]"
+)
 
-        if not command or not args:
-            ui.log("No valid command/args to send to left LLM.")
-            llm_message = (
-                "Bad command received. Please reply with ONLY a single valid command in the following format, and nothing else:\n"
-                "{{#command#}args[END_CMD]\n"
-                "For example: {{#filewrite#}script|myscript.py|print('hello')[END_CMD]"
-            )
-            right_response = interact_with_llm(ui, "right", llm_message)
-            ui.awaiting_command = True
-            continue
+# --- Checkpoints ---
+CHECKPOINT_PHASES = ("awaiting_right", "verifying", "executing", "reporting")
+INTERRUPTED_RESULT = ("Interrupted by an agent restart before its result was saved; it may or may not "
+                      "have completed. Check before running it again.")
+
+class CheckpointStore:
+    """
+    Last durable state of the agent loop, one row in memory.db (WAL mode).
+    Phases and their state:
+      awaiting_right  {"prompt"}: prompt sent to the right LLM, no reply yet
+      verifying       {"response"}: right reply in hand, left agreement pending
+      executing       {"response", "commands", "batch", "rejected", "unverified", "left_response", "started", "done"}
+      reporting       {"prompt"}: results to send to the right LLM
+    Each checkpoint also carries the hemisphere contexts, so a resumed agent keeps its history.
+    """
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+        with self.lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoint (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    phase TEXT,
+                    state TEXT,
+                    contexts TEXT,
+                    updated REAL
+                )
+            """)
+            self.conn.commit()
+
+    def save(self, phase: str, state: dict, contexts: dict):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO checkpoint (id, phase, state, contexts, updated) "
+                              "VALUES (1, ?, ?, ?, ?)", (phase, json.dumps(state), json.dumps(contexts), time.time()))
+            self.conn.commit()
+
+    def load(self) -> dict:
+        """Returns: {"phase", "state", "contexts", "updated"}, or None if nothing was saved."""
+        with self.lock:
+            row = self.conn.execute("SELECT phase, state, contexts, updated FROM checkpoint WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        return {"phase": row[0], "state": json.loads(row[1]), "contexts": json.loads(row[2]), "updated": row[3]}
+
+def report_message(state: dict, results: list) -> str:
+    """Message to the right LLM with the results of an 'executing' checkpoint's commands."""
+    commands = state["commands"]
+    if not state["batch"]:
+        command, args = commands[0]
+        return f"Command executed: {{#{command}#}}{args}{{END_CMD}}. Result: {results[0]}"
+    unverified = state.get("unverified", [])
+    total = len(commands) + len(state["rejected"]) + len(unverified)
+    lines = [f"Commands executed ({len(commands)} of {total}):"]
+    for i, ((command, args), result) in enumerate(zip(commands, results), 1):
+        lines.append(f"{i}. {{#{command}#}}{args}{{END_CMD}}\nResult: {bound_result(str(result))}")
+    if state["rejected"]:
+        lines.append("Not agreed by left LLM, not run: " + " ".join(
+            f"{{#{command}#}}{args}{{END_CMD}}" for command, args in state["rejected"]))
+        lines.append(f"Left response: {state['left_response']}")
+    if unverified:
+        lines.append("Left LLM unreachable, not verified or run: " + " ".join(
+            f"{{#{command}#}}{args}{{END_CMD}}" for command, args in unverified))
+    return "\n".join(lines)
+
+class AgentLoop:
+    """
+    Event-driven agreement loop for one agent.
+    Prompts and right LLM responses are posted to an inbox; the worker thread blocks
+    on the inbox and on the resume event, so it uses no CPU while idle or paused.
+    All loop state lives on the instance, so many loops can run in one process.
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self.agent2_prompt = agent.agent2_prompt
+        self.inbox = queue.Queue()
+        self.resumed = threading.Event()  # Set while running, cleared while paused
+        self.stopped = threading.Event()
+        self.thread = None
+        # Per-turn timing: listeners get {"outcome", "total", "phases": {phase: seconds}, "commands"}
+        self.turn_listeners = []
+        self.last_turn = None
+        self._phases = {}
+        self._outcome = None
+        self._executed = 0
+        self._unavailable = 0  # Consecutive steps that failed because an LLM was unreachable
+        # Runs pure commands while the left LLM deliberates ('speculate' on the left entry, default on)
+        self.speculation_pool = ThreadPoolExecutor(max_workers=MAX_BATCH_WORKERS, thread_name_prefix="speculate")
+        self._speculation = {}  # The current turn's speculative futures (one turn runs at a time)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def post_prompt(self, prompt: str):
+        """Queue a prompt for the right LLM; its reply starts the next turn."""
+        self.checkpoint("awaiting_right", {"prompt": prompt})
+        self.inbox.put(("prompt", prompt))
+
+    def post_response(self, response: str):
+        """Queue a right LLM response to be handled as the next turn."""
+        self.checkpoint("verifying", {"response": response})
+        self.inbox.put(("response", response))
+
+    def checkpoint(self, phase: str, state: dict):
+        """Make the loop's current phase durable (see CheckpointStore)."""
+        contexts = {hemisphere: context.snapshot() for hemisphere, context in self.agent.contexts.items()}
+        self.agent.checkpoints.save(phase, state, contexts)
+
+    def restore(self) -> bool:
+        """
+        Queue the step the last run was in when it stopped, and restore the hemisphere contexts.
+        Finished LLM replies and command results are reused, not requested or run again.
+        Returns: True if there was a checkpoint
+        """
+        saved = self.agent.checkpoints.load()
+        if saved is None:
+            return False
+        for hemisphere, snapshot in saved["contexts"].items():
+            if hemisphere in self.agent.contexts:
+                self.agent.contexts[hemisphere].restore(snapshot)
+        phase, state = saved["phase"], saved["state"]
+        if phase in ("awaiting_right", "reporting"):
+            self.inbox.put(("prompt", state["prompt"]))
+        elif phase == "verifying":
+            self.inbox.put(("response", state["response"]))
+        elif phase == "executing":
+            self.inbox.put(("execute", state))
+        saved_at = datetime.fromtimestamp(saved["updated"]).strftime("%Y-%m-%d %H:%M:%S")
+        self.agent.log(f"Resuming from checkpoint '{phase}' saved {saved_at}")
+        return True
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.resumed.set()
+        self.inbox.put(None)
+        for future in list(self._speculation.values()):
+            future.cancel()  # Unstarted speculations never run
+        self.speculation_pool.shutdown(wait=False)
+
+    def next_message(self):
+        message = self.inbox.get()
+        self.resumed.wait()
+        # Anything posted while paused supersedes what was queued before it
+        while message is not None:
+            try:
+                message = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+        return message
+
+    def run(self):
+        while not self.stopped.is_set():
+            message = self.next_message()
+            if message is None or self.stopped.is_set():
+                break
+            kind, text = message
+            if kind == "prompt":
+                text = interact_with_llm(self.agent, "right", text)
+                if isinstance(text, LLMError):
+                    self.retry_later(message)
+                    continue
+                self.checkpoint("verifying", {"response": text})
+            if kind == "execute":
+                next_response = self.turn(text["response"], executing=text)
+            else:
+                next_response = self.turn(text)
+            if isinstance(next_response, LLMError):
+                self.retry_later(next_response.retry)
+            elif next_response is not None:
+                self._unavailable = 0
+                self.post_response(next_response)
+
+    def retry_later(self, message):
+        """An LLM stayed unreachable after the router's retries: redo the step after a growing pause."""
+        self._unavailable += 1
+        delay = min(UNAVAILABLE_BACKOFF_MAX, DEFAULT_BACKOFF * 2 ** self._unavailable) * random.uniform(0.5, 1.5)
+        self.agent.log(f"LLM unavailable, retrying the step in {delay:.1f}s", "WARNING")
+        if message is not None and not self.stopped.wait(delay):
+            self.inbox.put(message)
+
+    def verify(self, command: str, args: str) -> tuple:
+        """
+        Get the left hemisphere to agree on (command, args).
+        The left model's 'verify_mode' picks "sequential" (default) or "parallel".
+        Returns: (agreed, last left response)
+        """
+        left_info = self.agent.api_config["left"]
+        mode = left_info.get("verify_mode", "sequential").lower()
+        start = time.perf_counter()
+        if mode == "parallel":
+            agreed, left_response = self.verify_parallel(command, args, left_info)
+        else:
+            agreed, left_response = self.verify_sequential(command, args)
+        self.agent.log(f"Agreement latency ({mode}): {time.perf_counter() - start:.3f}s, agreed={agreed}")
+        return agreed, left_response
+
+    def left_prompt(self, label: str, command: str, args: str, use_context: bool = True) -> str:
+        """Verification prompt; agent2.txt is left out when the left context already has it as system prompt."""
+        text = f"{label}: {{#{command}#}}{args}{{END_CMD}}"
+        if use_context and "left" in self.agent.contexts:
+            return text
+        return f"{self.agent2_prompt}\n{text}"
+
+    def left_batch_prompt(self, label: str, commands: list) -> str:
+        lines = "\n".join(f"{i}. {{#{command}#}}{args}{{END_CMD}}" for i, (command, args) in enumerate(commands, 1))
+        text = f"{label} (repeat each command you agree with, exactly as given):\n{lines}"
+        if "left" in self.agent.contexts:
+            return text
+        return f"{self.agent2_prompt}\n{text}"
+
+    def verify_batch(self, commands: list) -> tuple:
+        """
+        Get the left hemisphere to agree on several commands in one call per round.
+        Commands the left LLM echoes back are agreed; the rest are re-sent, up to 5 rounds.
+        Returns: (agreed flag per command, last left response)
+        """
+        agent = self.agent
+        start = time.perf_counter()
+        agreed = [False] * len(commands)
+        pending = list(range(len(commands)))
+        label = "Commands from right LLM"
+        rounds = 0
+        max_loops = 5
+        left_response = ""
+        while pending and rounds < max_loops:
+            left_input = self.left_batch_prompt(label, [commands[i] for i in pending])
+            agent.log(f"Sending {len(pending)} commands to left LLM for agreement", payload=left_input)
+            # The left LLM echoes every command it agrees with, so its stream must not stop at the first
+            left_response = interact_with_llm(agent, "left", left_input, stop_on_command=False, use_cache=rounds == 0)
+            if isinstance(left_response, LLMError):
+                break
+            echoed = set(process_commands(agent, left_response, len(commands) * 2))
+            for i in pending:
+                agreed[i] = commands[i] in echoed
+            pending = [i for i in pending if not agreed[i]]
+            rounds += 1
+            if pending:
+                metrics.inc("aiden_agreement_retries_total")
+                agent.log(f"No agreement on {len(pending)} commands, loop {rounds}/{max_loops}", "WARNING")
+                label = "Retry commands"
+        metrics.observe("aiden_agreement_rounds", rounds, mode="batch")
+        agent.log(f"Agreement latency (batch): {time.perf_counter() - start:.3f}s, "
+                  f"agreed={sum(agreed)}/{len(commands)}")
+        return agreed, left_response
+
+    def run_timed(self, command: str, args: str) -> tuple:
+        """run_command; a failing command becomes an error result instead of ending the turn. Returns: (result, seconds)"""
+        start = time.perf_counter()
+        try:
+            result = run_command(self.agent, command, args)
+        except Exception as e:
+            result = f"Error: {str(e)}"
+        return result, time.perf_counter() - start
+
+    def execute(self, command: str, args: str, speculated=None) -> str:
+        """
+        run_command with timing and logging.
+        speculated: Future of run_timed started during verification; its result is committed instead of running again.
+        If stop() cancelled it before it started, the command runs here instead.
+        """
+        if speculated is not None:
+            try:
+                result, seconds = speculated.result()
+            except CancelledError:
+                speculated = None
+        if speculated is None:
+            result, seconds = self.run_timed(command, args)
+        else:
+            metrics.inc("aiden_speculation_total", result="committed")
+            self.agent.log(f"Using speculative result for {command} ({seconds * 1000:.1f} ms off the critical path)")
+        metrics.observe("aiden_command_seconds", seconds, verb=command_label(command))
+        self.agent.log(f"Command result ({command})", payload=result)
+        self._executed += 1
+        return result
+
+    def speculate(self, commands: list) -> dict:
+        """
+        Start the pure commands (see speculable) while the left LLM verifies them.
+        Returns: {command index: Future of run_timed}; commit with execute, drop with discard
+        """
+        if not commands or not self.agent.api_config.get("left", {}).get("speculate", True):
+            return {}
+        resources = [(command, *command_resources(self.agent, command, args)) for command, args in commands]
+        try:
+            self._speculation = {i: self.speculation_pool.submit(self.run_timed, *commands[i])
+                                 for i in speculable(resources)}
+        except RuntimeError:
+            self._speculation = {}  # Pool shut down: the loop is stopping
+        return self._speculation
+
+    def discard(self, speculation: dict):
+        """Drop speculative results of commands that were not agreed; unstarted ones never run."""
+        for future in speculation.values():
+            future.cancel()
+            metrics.inc("aiden_speculation_total", result="discarded")
+
+    def execute_step(self, state: dict, i: int, speculated: dict = None) -> str:
+        """
+        Run command i of an 'executing' checkpoint at most once: it is marked started before
+        it runs and its result is saved after. A command started by an earlier run that never
+        saved a result is not run again.
+        """
+        key = str(i)
+        with self.agent.db_lock:
+            if key in state["done"]:
+                return state["done"][key]
+            interrupted = key in state["started"]
+            if not interrupted:
+                state["started"].append(key)
+                self.checkpoint("executing", state)
+        if interrupted:
+            self.agent.log(f"Not re-running interrupted command: {state['commands'][i][0]}", "WARNING")
+            result = INTERRUPTED_RESULT
+        else:
+            result = self.execute(*state["commands"][i], speculated=(speculated or {}).get(i))
+        with self.agent.db_lock:
+            state["done"][key] = result
+            self.checkpoint("executing", state)
+        return result
+
+    def execute_batch(self, state: dict, speculated: dict = None) -> list:
+        """Run an 'executing' checkpoint's commands in conflict-free waves (see plan_waves). Returns: results in command order"""
+        agent = self.agent
+        commands = state["commands"]
+        waves = plan_waves([command_resources(agent, command, args) for command, args in commands])
+        results = [None] * len(commands)
+        with ThreadPoolExecutor(max_workers=min(len(commands), MAX_BATCH_WORKERS)) as pool:
+            for wave in waves:
+                futures = {i: pool.submit(self.execute_step, state, i, speculated) for i in wave}
+                for i, future in futures.items():
+                    results[i] = future.result()
+        agent.log(f"Ran {len(commands)} commands in {len(waves)} waves")
+        return results
+
+    def run_agreed(self, state: dict, speculated: dict = None):
+        """
+        Execute the agreed commands of an 'executing' checkpoint and report the results to the right LLM.
+        speculated: {index in state["commands"]: Future} of results computed during verification
+        """
+        agent = self.agent
+        self._outcome = "executed"
+        with self.phase("execute"):
+            if state["batch"]:
+                results = self.execute_batch(state, speculated)
+            else:
+                results = [self.execute_step(state, 0, speculated)]
+        agent.last_command_time = datetime.now()
+        llm_message = report_message(state, results)
+        self.checkpoint("reporting", {"prompt": llm_message})
+        with self.phase("report"):
+            right_response = interact_with_llm(agent, "right", llm_message)
+        command, args = process_response(agent, right_response)
+        agent.show_command(command, args)
+        if command:
+            agent.last_command_time = datetime.now()
+        return right_response
+
+    def executing(self, right_response: str, commands: list, batch: bool = False,
+                  rejected: list = (), left_response: str = "", unverified: list = ()) -> dict:
+        """Checkpoint agreed commands before any of them runs. Returns: the 'executing' state"""
+        state = {"response": right_response, "commands": [list(c) for c in commands], "batch": batch,
+                 "rejected": [list(c) for c in rejected], "unverified": [list(c) for c in unverified],
+                 "left_response": left_response,
+                 "started": [], "done": {}}
+        self.checkpoint("executing", state)
+        return state
+
+    def unavailable(self, error, right_response: str):
+        """The left LLM could not be reached: the turn is redone later rather than reported as a disagreement."""
+        self._outcome = "llm_unavailable"
+        error.retry = ("response", right_response)
+        return error
+
+    def run_batch(self, commands: list, right_response: str):
+        """Batch turn: verify all commands in one left call, run the agreed ones, report all results at once."""
+        agent = self.agent
+        metrics.observe("aiden_batch_size", len(commands))
+        agent.show_command("batch", " ; ".join(f"{command}|{args}" for command, args in commands))
+        speculation = self.speculate(commands)
+        with self.phase("verify"):
+            agreed, left_response = self.verify_batch(commands)
+        self.discard({i: future for i, future in speculation.items() if not agreed[i]})
+        if not any(agreed) and isinstance(left_response, LLMError):
+            return self.unavailable(left_response, right_response)
+        if any(agreed):
+            kept = [i for i, ok in enumerate(agreed) if ok]
+            others = [c for c, ok in zip(commands, agreed) if not ok]
+            if isinstance(left_response, LLMError):
+                # The last round got no answer: the rest were never judged, and the error text stays here
+                rejected, unverified, left_response = [], others, ""
+            else:
+                rejected, unverified = others, []
+            return self.run_agreed(self.executing(
+                right_response, [commands[i] for i in kept], batch=True,
+                rejected=rejected, left_response=left_response, unverified=unverified),
+                {j: speculation[i] for j, i in enumerate(kept) if i in speculation})
+        self._outcome = "no_agreement"
+        agent.log("No agreement from left LLM on any batched command, sending left response to right LLM")
+        llm_message = f"No agreement from left LLM. Response: {left_response}. Refactor commands."
+        self.checkpoint("awaiting_right", {"prompt": llm_message})
+        with self.phase("correct"):
+            right_response = interact_with_llm(agent, "right", llm_message, priority=CONTEXT_PRIORITY_LOW,
+                                               use_cache=False)
+        command, args = process_response(agent, right_response)
+        agent.show_command(command, args)
+        if command:
+            agent.last_command_time = datetime.now()
+        return right_response
 
-        left_input = f"{agent2_prompt}\nCommand from right LLM: {{#{command}#}}{args}{{END_CMD}}"
-        ui.log(f"Sending to left LLM for agreement: {left_input}")
+    def verify_sequential(self, command: str, args: str) -> tuple:
+        agent = self.agent
+        left_input = self.left_prompt("Command from right LLM", command, args)
+        agent.log("Sending to left LLM for agreement", payload=left_input)
 
         agreement_count = 0
         max_loops = 5
-        agreed = False
         left_response = ""
 
         while agreement_count < max_loops:
-            left_response = interact_with_llm(ui, "left", left_input)
-            left_command, left_args = process_response(ui, left_response)
+            left_response = interact_with_llm(agent, "left", left_input, use_cache=agreement_count == 0)
+            if isinstance(left_response, LLMError):
+                return False, left_response  # Unreachable, not a disagreement
+            left_command, left_args = process_response(agent, left_response)
             if left_command == command and left_args == args:
-                ui.log(f"Agreement reached with left LLM on command: {command} | {args}")
-                agreed = True
-                break
+                agent.log(f"Agreement reached with left LLM on command: {command} | {args}")
+                metrics.observe("aiden_agreement_rounds", agreement_count + 1, mode="sequential")
+                return True, left_response
             agreement_count += 1
-            ui.log(f"No agreement, loop {agreement_count}/{max_loops}")
-            left_input = f"{agent2_prompt}\nRetry command: {{#{command}#}}{args}{{END_CMD}}"
+            metrics.inc("aiden_agreement_retries_total")
+            agent.log(f"No agreement, loop {agreement_count}/{max_loops}", "WARNING")
+            left_input = self.left_prompt("Retry command", command, args)
+        metrics.observe("aiden_agreement_rounds", agreement_count, mode="sequential")
+        return False, left_response
+
+    def verify_parallel(self, command: str, args: str, left_info: dict) -> tuple:
+        """
+        Fan out 'verify_fanout' left requests at once, round-robin over the api_config
+        entries in 'verify_nodes', and settle on 'verify_quorum' matches (1 = first match).
+        A request that errors casts no vote. Once the outcome is decided, requests still
+        queued are never sent and streamed ones are cut off; a non-streamed request already
+        sent runs to completion and its reply is ignored.
+        """
+        agent = self.agent
+        nodes = left_info.get("verify_nodes") or ["left"]
+        fanout = max(1, left_info.get("verify_fanout", max(len(nodes), 3)))
+        quorum = min(max(1, left_info.get("verify_quorum", 1)), fanout)
+        left_input = self.left_prompt("Command from right LLM", command, args, use_context=False)
+        agent.log(f"Sending to {fanout} left LLM requests for agreement (quorum {quorum})", payload=left_input)
+
+        cancel = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=fanout)
+        futures = [
+            # Every vote asks the LLM: one cached reply must not count as several independent votes
+            executor.submit(interact_with_llm, agent, nodes[i % len(nodes)], left_input, cancel, use_context=False,
+                            use_cache=False)
+            for i in range(fanout)
+        ]
+        agrees = disagrees = errors = 0
+        left_response = ""
+        error = None
+        try:
+            for future in as_completed(futures):
+                response = future.result()
+                if isinstance(response, LLMError):
+                    errors += 1
+                    error = response
+                else:
+                    left_command, left_args = process_response(agent, response)
+                    if left_command == command and left_args == args:
+                        agrees += 1
+                    else:
+                        disagrees += 1
+                        left_response = response
+                if agrees >= quorum:
+                    left_response = response
+                    break
+                if agrees + (fanout - agrees - disagrees - errors) < quorum:
+                    break  # Too few requests left to reach the quorum
+        finally:
+            # Drop the stragglers: unstarted requests never run, queued ones are not sent, streams are abandoned
+            cancel.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        if agrees < quorum and not disagrees and error is not None:
+            agent.log(f"Left quorum not reached: {agrees} agree, {errors} unreachable of {fanout}", "WARNING")
+            return False, error  # Unreachable, not a disagreement
+        agreed = agrees >= quorum
+        metrics.observe("aiden_agreement_rounds", agrees + disagrees, mode="parallel")
+        agent.log(f"Left quorum {'reached' if agreed else 'failed'}: {agrees} agree, {disagrees} disagree, "
+                  f"{errors} unreachable of {fanout}")
+        return agreed, left_response
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase of the current turn."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = self._phases.get(name, 0.0) + time.perf_counter() - start
 
+    def turn(self, right_response: str, executing: dict = None):
+        """
+        Handle one right LLM response: parse, get left agreement, run, report.
+        With executing (a restored 'executing' checkpoint) the turn picks up at the commands.
+        Returns the right LLM's next response.
+        """
+        self._phases = {}
+        self._outcome = None
+        self._executed = 0
+        start = time.perf_counter()
+        try:
+            if executing is not None:
+                return self.run_agreed(executing)
+            return self.run_turn(right_response)
+        finally:
+            self.last_turn = {"outcome": self._outcome, "total": time.perf_counter() - start,
+                              "phases": self._phases, "commands": self._executed}
+            metrics.inc("aiden_turns_total", outcome=self._outcome or "error")
+            for name, seconds in self._phases.items():
+                metrics.observe("aiden_turn_phase_seconds", seconds, phase=name)
+            for listener in self.turn_listeners:
+                listener(self.last_turn)
+
+    def run_turn(self, right_response: str):
+        agent = self.agent
+        with self.phase("parse"):
+            batch = process_commands(agent, right_response, agent.max_batch) if agent.max_batch > 1 else []
+            command, args = process_response(agent, right_response)
+        if len(batch) > 1:
+            return self.run_batch(batch, right_response)
+        agent.show_command(command, args)
+        if not command or not args:
+            self._outcome = "bad_command"
+            if command:
+                agent.log("No valid command/args to send to left LLM.")
+            self.checkpoint("awaiting_right", {"prompt": agent.bad_command_prompt})
+            with self.phase("correct"):
+                right_response = interact_with_llm(agent, "right", agent.bad_command_prompt,
+                                                   priority=CONTEXT_PRIORITY_LOW, use_cache=False)
+            if not command:
+                agent.log("Sent bad command prompt to right LLM")
+            return right_response
+
+        speculation = self.speculate([(command, args)])
+        with self.phase("verify"):
+            agreed, left_response = self.verify(command, args)
         if not agreed:
-            ui.log("No agreement after 5 loops, sending left response to right LLM")
+            self.discard(speculation)
+        if not agreed and isinstance(left_response, LLMError):
+            return self.unavailable(left_response, right_response)
+        if not agreed:
+            self._outcome = "no_agreement"
+            agent.log("No agreement from left LLM, sending left response to right LLM")
             llm_message = f"No agreement from left LLM. Response: {left_response}. Refactor command."
-            right_response = interact_with_llm(ui, "right", llm_message)
-            command, args = process_response(ui, right_response)
-            ui.show_command(command, args)
+            self.checkpoint("awaiting_right", {"prompt": llm_message})
+            with self.phase("correct"):
+                right_response = interact_with_llm(agent, "right", llm_message, priority=CONTEXT_PRIORITY_LOW,
+                                                   use_cache=False)
+            command, args = process_response(agent, right_response)
+            agent.show_command(command, args)
             if command:
-                ui.last_command_time = datetime.now()
+                agent.last_command_time = datetime.now()
+            return right_response
+
+        # Run agreed command (or commit its speculative result) and send the result back to right LLM
+        return self.run_agreed(self.executing(right_response, [(command, args)]), speculation)
+
+# --- Headless mode ---
+CONTROL_HELP = "commands: resume | pause | say <text> | status | tail [n] | metrics | quit"
+
+class HeadlessFrontend(Frontend):
+    """Front end for daemon use: log lines are echoed to a stream, nothing else is rendered."""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def log_line(self, line: str):
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+def handle_control(agent: Agent, line: str) -> tuple:
+    """
+    Run one control command for a headless agent.
+    Returns: (keep serving, reply dict)
+    """
+    verb, _, rest = line.strip().partition(" ")
+    verb = verb.lower()
+    if verb == "resume":
+        agent.set_paused(False)
+        return True, {"ok": True, "paused": False}
+    if verb == "pause":
+        agent.set_paused(True)
+        return True, {"ok": True, "paused": True}
+    if verb == "say":
+        if not agent.paused:
+            return True, {"ok": False, "error": "pause the agent before sending input"}
+        response = agent.send_user_input(rest)
+        if response is None:
+            return True, {"ok": False, "error": "empty input"}
+        return True, {"ok": True, "response": response}
+    if verb == "status":
+        return True, {
+            "ok": True,
+            "base_dir": str(agent.base_dir),
+            "paused": agent.paused,
+            "initial_prompt_sent": agent.initial_prompt_sent,
+            "last_command_time": agent.last_command_time.isoformat() if agent.last_command_time else None,
+            "endpoints": endpoint_router.stats(),
+            "outbox": agent.outbox.stats() if agent.outbox else None,
+            "checkpoint": (agent.checkpoints.load() or {}).get("phase"),
+        }
+    if verb == "tail":
+        n = int(rest) if rest.strip().isdigit() else 20
+        return True, {"ok": True, "log": list(agent.log_lines)[-n:]}
+    if verb == "metrics":
+        return True, {"ok": True, "metrics": metrics.snapshot()}
+    if verb == "quit":
+        return False, {"ok": True}
+    return True, {"ok": False, "error": CONTROL_HELP}
+
+def serve_control_stdin(handle):
+    """
+    handle: function(line) -> (keep serving, reply dict)
+    One command per line in, one JSON reply per line out.
+    """
+    for line in sys.stdin:
+        if not line.strip():
             continue
+        keep_serving, reply = handle(line)
+        print(json.dumps(reply), flush=True)
+        if not keep_serving:
+            break
 
-        # Run agreed command
-        result = run_command(ui, command, args)
-        ui.log(f"Command result: {result}")
-        ui.last_command_time = datetime.now()
+def serve_control_socket(handle, port: int, host: str = "127.0.0.1", log=print):
+    """Same line protocol as stdin, on a local TCP port; 'quit' from any client stops serving."""
+    import socketserver
 
-        # Send result back to right LLM
-        llm_message = f"Command executed: {{#{command}#}}{args}{{END_CMD}}. Result: {result}"
-        right_response = interact_with_llm(ui, "right", llm_message)
-        command, args = process_response(ui, right_response)
-        ui.show_command(command, args)
-        if command:
-            ui.last_command_time = datetime.now()
+    class ControlHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                line = raw.decode("utf-8", errors="replace")
+                if not line.strip():
+                    continue
+                keep_serving, reply = handle(line)
+                self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+                if not keep_serving:
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
 
-        right_response = None
-        ui.awaiting_command = True
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((host, port), ControlHandler) as server:
+        server.daemon_threads = True
+        log(f"Control socket listening on {host}:{port}")
+        server.serve_forever()
+
+def run_headless(base_dir: Path, config: dict, api_config: dict, port: int = None, resume: bool = False):
+    # Logs go to stderr so stdout carries only control replies
+    agent = Agent(base_dir, config, api_config, HeadlessFrontend(sys.stderr)).start()
+    agent.log("Agent initialized (headless)")
+    if resume:
+        agent.set_paused(False)
+    try:
+        handle = lambda line: handle_control(agent, line)
+        if port is None:
+            serve_control_stdin(handle)
+        else:
+            serve_control_socket(handle, port, log=agent.log)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.close()
 
-def main():
+def read_configs(base_dir: Path) -> tuple:
+    """
+    Returns: (config from hemisphere.json, api_config from hemisphere_api.json)
+    Raises FileNotFoundError / json.JSONDecodeError for a missing or bad hemisphere_api.json.
+    """
     # Load hemisphere_api.json for LLM API config
+    with open(base_dir / "hemisphere_api.json") as f:
+        api_config = json.load(f)
+    # Load hemisphere.json for general settings (optional)
     try:
-        with open(BASE_DIR / "hemisphere_api.json") as f:
-            api_config = json.load(f)
+        with open(base_dir / "hemisphere.json") as f:
+            config = json.load(f)
     except FileNotFoundError:
-        print(r"Error: hemisphere_api.json not found in C:\AIAgent")
-        sys.exit(1)
-    except json.JSONDecodeError:
-        print(r"Error: hemisphere_api.json has invalid JSON format")
+        config = {}
+    return config, api_config
+
+def load_configs(base_dir: Path) -> tuple:
+    """read_configs for the command line: prints the problem and exits on bad files."""
+    try:
+        return read_configs(base_dir)
+    except FileNotFoundError:
+        print(f"Error: hemisphere_api.json not found in {base_dir}")
+    except json.JSONDecodeError as e:
+        print(f"Error: invalid JSON format in {base_dir}: {e}")
+    sys.exit(1)
+
+# --- Multi-session hosting ---
+class SessionManager:
+    """
+    Hosts many independent agent sessions in one process.
+    Each session has its own directory (prompts, memory DB, logs, config); all of them
+    share the pooled provider client, the response cache and one LLMScheduler.
+    """
+    def __init__(self, scheduler: LLMScheduler):
+        self.scheduler = scheduler
+        self.sessions = {}  # name -> Agent
+        self._starting = set()  # Names reserved by an add() still starting its agent
+        self._lock = threading.Lock()
+
+    def add(self, name: str, base_dir: Path, resume: bool = False) -> Agent:
+        # Reserve the name first, so two adds racing for it cannot both start an agent
+        with self._lock:
+            if name in self.sessions or name in self._starting:
+                raise ValueError(f"session '{name}' already exists")
+            self._starting.add(name)
+        try:
+            config, api_config = read_configs(Path(base_dir))
+            # Sessions log to their own logs/ directory only; nothing is echoed
+            agent = Agent(base_dir, config, api_config, scheduler=self.scheduler, session_id=name).start()
+            agent.log(f"Session '{name}' initialized")
+            with self._lock:
+                self.sessions[name] = agent
+        finally:
+            with self._lock:
+                self._starting.discard(name)
+        if resume:
+            agent.set_paused(False)
+        return agent
+
+    def remove(self, name: str):
+        with self._lock:
+            agent = self.sessions.pop(name)
+        agent.close()
+
+    def close(self):
+        for name in list(self.sessions):
+            self.remove(name)
+
+    def handle_control(self, line: str) -> tuple:
+        """
+        Manager commands: sessions | add <name> <dir> [resume] | remove <name> | metrics | quit
+        Anything else is "<name> <agent command>", e.g. "book1 resume".
+        Returns: (keep serving, reply dict)
+        """
+        verb, _, rest = line.strip().partition(" ")
+        if verb == "sessions":
+            return True, {"ok": True, "sessions": {
+                name: {"paused": agent.paused, "base_dir": str(agent.base_dir)}
+                for name, agent in list(self.sessions.items())
+            }, "scheduler": self.scheduler.stats()}
+        if verb == "metrics":
+            return True, {"ok": True, "metrics": metrics.snapshot()}
+        if verb == "add":
+            parts = rest.split()
+            if len(parts) < 2:
+                return True, {"ok": False, "error": "usage: add <name> <dir> [resume]"}
+            try:
+                self.add(parts[0], Path(parts[1]), resume="resume" in parts[2:])
+            except (OSError, ValueError) as e:
+                return True, {"ok": False, "error": str(e)}
+            return True, {"ok": True, "session": parts[0]}
+        if verb == "remove":
+            if rest.strip() not in self.sessions:
+                return True, {"ok": False, "error": f"no session '{rest.strip()}'"}
+            self.remove(rest.strip())
+            return True, {"ok": True}
+        if verb == "quit":
+            return False, {"ok": True}
+        agent = self.sessions.get(verb)
+        if agent is None:
+            return True, {"ok": False, "error": f"no session '{verb}'"}
+        keep_serving, reply = handle_control(agent, rest)
+        if not keep_serving:
+            self.remove(verb)  # "quit" for a single session just ends that session
+        return True, reply
+
+def run_sessions(manifest_path: Path, port: int = None, metrics_port: int = None):
+    """
+    Run every session listed in a manifest like:
+    {
+      "max_concurrency": 32,
+      "providers": {"openrouter": {"max_concurrency": 16, "rate": 10, "burst": 20}},
+      "metrics": {"port": 9464, "snapshot_path": "metrics.json"},
+      "sessions": {"book1": {"dir": "/srv/agents/book1", "resume": true}, ...}
+    }
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    scheduler = LLMScheduler(manifest.get("max_concurrency"), manifest.get("providers"))
+    manager = SessionManager(scheduler)
+
+    # A session with a bad entry or config is skipped, not allowed to stop the others
+    sessions = {}
+    api_configs = []
+    for name, spec in manifest.get("sessions", {}).items():
+        try:
+            api_configs.append(read_configs(Path(spec["dir"]))[1])
+        except (KeyError, TypeError):
+            print(f"Skipping session '{name}': its manifest entry needs a \"dir\"", file=sys.stderr)
+            continue
+        except FileNotFoundError:
+            print(f"Skipping session '{name}': hemisphere_api.json not found in {spec['dir']}", file=sys.stderr)
+            continue
+        except (OSError, ValueError) as e:
+            print(f"Skipping session '{name}': bad config in {spec['dir']}: {e}", file=sys.stderr)
+            continue
+        sessions[name] = spec
+
+    # Health-check each distinct hemisphere entry once, not once per session
+    entries = {}
+    persist = False
+    for api_config in api_configs:
+        for model_info in api_config.values():
+            persist = persist or bool(model_info.get("cache_persist"))
+            names = " | ".join(endpoint_name(endpoint) for endpoint in endpoints_for(model_info))
+            entries.setdefault(names, model_info)
+    # The response cache is process-wide, so persisted responses share one DB next to the manifest
+    if persist:
+        response_cache.open_db(Path(manifest_path).parent / "llm_cache.db")
+
+    cache = HealthCache(Path(manifest_path).parent / "health_cache.json")
+    failures = {k: v for k, v in check_llm_connections(entries, cache=cache).items() if v}
+    if failures:
+        for name, error in failures.items():
+            print(f"  {name}: {error}")
         sys.exit(1)
 
-    # Check LLM connections before starting UI/agent loop
-    connection_results = check_llm_connections(api_config)
+    metrics_config = dict(manifest.get("metrics") or {})
+    if metrics_port is not None:
+        metrics_config["port"] = metrics_port
+    exporter = MetricsExporter.from_config(metrics, metrics_config, Path(manifest_path).parent)
+
+    for name, spec in sessions.items():
+        try:
+            manager.add(name, Path(spec["dir"]), spec.get("resume", False))
+        except (OSError, ValueError) as e:  # E.g. memory/agent_init.txt missing
+            print(f"Skipping session '{name}': {e}", file=sys.stderr)
+    print(f"Started {len(manager.sessions)} sessions", file=sys.stderr)
+    try:
+        if port is None:
+            serve_control_stdin(manager.handle_control)
+        else:
+            serve_control_socket(manager.handle_control, port, log=lambda m: print(m, file=sys.stderr))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+        if exporter:
+            exporter.close()
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Aiden dual-LLM agent")
+    parser.add_argument("base_dir", nargs="?", default=str(BASE_DIR),
+                        help=f"agent directory with memory/, scripts/, logs/ and the config files (default {BASE_DIR})")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without the GUI, controlled over stdin (or --port)")
+    parser.add_argument("--port", type=int,
+                        help="with --headless, take control commands on this local TCP port instead of stdin")
+    parser.add_argument("--resume", action="store_true",
+                        help="with --headless, start running instead of paused")
+    parser.add_argument("--sessions", metavar="MANIFEST",
+                        help="host every session in this JSON manifest in one process (implies headless)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on this local TCP port (overrides the config)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.sessions:
+        run_sessions(Path(options.sessions), options.port, options.metrics_port)
+        return
+    base_dir = Path(options.base_dir)
+    config, api_config = load_configs(base_dir)
+
+    # Check LLM connections (concurrently, skipping recent passes) before starting UI/agent loop
+    cache = HealthCache(base_dir / "health_cache.json")  # Derived state stays out of memory/, which the LLM can edit
+    connection_results = check_llm_connections(api_config, cache=cache)
     failed = [k for k, v in connection_results.items() if v]
     if failed:
         print("One or more LLM endpoints failed to connect:")
@@ -513,28 +3808,33 @@ def main():
         print("Please check your hemisphere_api.json and network connectivity.")
         sys.exit(1)
 
+    if any(model_info.get("cache_persist") for model_info in api_config.values()):
+        response_cache.open_db(base_dir / "llm_cache.db")
 
-    with open(MEMORY_DIR / "agent_init.txt", encoding="utf-8") as f:
-        init_prompt = f.read()
-    with open(MEMORY_DIR / "agent2.txt", encoding="utf-8") as f:
-        agent2_prompt = f.read()
-
-    # Initialize UI
-    ui = AgentUI(config, api_config)
-    ui.init_prompt = init_prompt  # Store for later use
-    ui.agent2_prompt = agent2_prompt
-
-    ui.log("Agent initialized")
+    metrics_config = dict(config.get("metrics") or {})
+    if options.metrics_port is not None:
+        metrics_config["port"] = options.metrics_port
+    exporter = MetricsExporter.from_config(metrics, metrics_config, base_dir)
+    try:
+        if options.headless:
+            run_headless(base_dir, config, api_config, options.port, options.resume)
+            return
 
-    # Do NOT send initial prompt here; wait for resume
+        # Initialize agent and UI
+        agent = Agent(base_dir, config, api_config)
+        ui = AgentUI(agent)
+        agent.log("Agent initialized")
 
-    # Start agent loop in a background thread
-    global right_response, command, args
-    right_response, command, args = None, None, None
-    threading.Thread(target=agent_loop, args=(ui, lambda: right_response, lambda: command, lambda: args, agent2_prompt), daemon=True).start()
+        # Do NOT send initial prompt here; wait for resume
+        # The agent loop runs in a background thread and idles until resumed
+        agent.start()
 
-    # Start the Tkinter event loop
-    ui.root.mainloop()
+        # Start the Tkinter event loop
+        ui.root.mainloop()
+        agent.close()
+    finally:
+        if exporter:
+            exporter.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""
+Benchmark: per-call latency of bare requests.post vs the pooled ProviderClient.
+
+Starts a local OpenRouter-shaped stub server and times N chat/completions calls
+each way. Run with:
+    python bench_provider_pool.py [calls]
+"""
+import sys
+import time
+
+import requests
+
+import Aiden_API
+from stub_llm_server import StubLLMServer
+
+
+def time_calls(call, n):
+    call()  # warm up
+    start = time.perf_counter()
+    for _ in range(n):
+        call()
+    return (time.perf_counter() - start) / n * 1000
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server = StubLLMServer().start()
+    model_info = server.api_config()["right"]
+    url = f"{model_info['api_url']}/chat/completions"
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "ping"}]}
+
+    bare_ms = time_calls(lambda: requests.post(url, json=payload, timeout=60).json(), calls)
+    pooled_ms = time_calls(lambda: Aiden_API.openrouter_infer(model_info, "ping"), calls)
+    server.stop()
+
+    print(f"calls per mode:     {calls}")
+    print(f"bare requests.post: {bare_ms:.3f} ms/call")
+    print(f"pooled client:      {pooled_ms:.3f} ms/call")
+    print(f"saved per call:     {bare_ms - pooled_ms:.3f} ms ({(1 - pooled_ms / bare_ms) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: agent startup cost before the UI or headless loop can begin.
+
+Measures two things:
+  import      `import Aiden_API` in a fresh interpreter (median of several runs), and which
+              heavy modules that pulls in
+  checks      check_llm_connections against the local stub LLM server, for the old serial
+              ping generation and the current concurrent probe, cold and from the disk cache
+
+Run with:
+    python bench_startup.py [--entries 4] [--latency 0.5] [--probe-latency 0.02]
+    python bench_startup.py --max-import-ms 80 --max-check-ms 200   # exit 1 on regression
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import Aiden_API
+from stub_llm_server import StubLLMServer
+
+HEAVY_MODULES = ("requests", "urllib3", "smtplib", "email.message", "tkinter", "ctypes", "numpy")
+
+IMPORT_SNIPPET = """
+import sys, time, json
+start = time.perf_counter()
+import Aiden_API
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+SCENARIOS = {
+    "serial_ping": {"health_check": "ping", "max_workers": 1},
+    "concurrent_ping": {"health_check": "ping"},
+    "concurrent_probe": {"health_check": "probe"},
+    "cached_probe": {"health_check": "probe", "cached": True},
+}
+
+
+def time_import(runs: int) -> dict:
+    samples, loaded = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True,
+                                check=True, cwd=Path(__file__).parent).stdout
+        result = json.loads(output)
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    samples.sort()
+    return {"median_ms": samples[len(samples) // 2] * 1000, "min_ms": samples[0] * 1000, "heavy_modules_loaded": loaded}
+
+
+def time_checks(name: str, spec: dict, entries: int, latency: float, probe_latency: float) -> dict:
+    server = StubLLMServer({"latency": latency, "probe_latency": probe_latency}).start()
+    base = server.api_config(health_check=spec["health_check"])["right"]
+    api_config = {f"entry{i}": dict(base, model=f"stub-{i}") for i in range(entries)}
+    root = Path(tempfile.mkdtemp(prefix="aiden-startup-"))
+    try:
+        cache = Aiden_API.HealthCache(root / "health_cache.json")
+        kwargs = {"cache": cache} if spec.get("cached") else {}
+        if spec.get("max_workers"):
+            kwargs["max_workers"] = spec["max_workers"]
+        if spec.get("cached"):
+            Aiden_API.check_llm_connections(api_config, **kwargs)  # Fill the cache
+            cache = Aiden_API.HealthCache(root / "health_cache.json")  # As read by the next start
+            kwargs["cache"] = cache
+        start = time.perf_counter()
+        results = Aiden_API.check_llm_connections(api_config, **kwargs)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+    return {"scenario": name, "entries": entries, "check_ms": elapsed * 1000,
+            "failed": sorted(k for k, v in results.items() if v)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent startup benchmark")
+    parser.add_argument("--entries", type=int, default=4, help="hemisphere entries to health-check")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub latency per generation (s)")
+    parser.add_argument("--probe-latency", type=float, default=0.02, help="stub latency per metadata GET (s)")
+    parser.add_argument("--import-runs", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import time exceeds this")
+    parser.add_argument("--max-check-ms", type=float, help="fail if the cold concurrent probe exceeds this")
+    options = parser.parse_args()
+
+    imported = time_import(options.import_runs)
+    checks = [time_checks(name, spec, options.entries, options.latency, options.probe_latency)
+              for name, spec in SCENARIOS.items()]
+    if options.json:
+        print(json.dumps({"import": imported, "checks": checks}, indent=2))
+    else:
+        print(f"import Aiden_API: median {imported['median_ms']:.1f} ms  min {imported['min_ms']:.1f} ms  "
+              f"heavy modules loaded: {', '.join(imported['heavy_modules_loaded']) or 'none'}")
+        for result in checks:
+            failed = f"  FAILED: {', '.join(result['failed'])}" if result["failed"] else ""
+            print(f"  {result['scenario']:<18} {result['entries']} entries  {result['check_ms']:8.1f} ms{failed}")
+
+    failures = []
+    if options.max_import_ms is not None and imported["median_ms"] > options.max_import_ms:
+        failures.append(f"import: {imported['median_ms']:.1f} ms > {options.max_import_ms} ms")
+    probe = next(r for r in checks if r["scenario"] == "concurrent_probe")
+    if options.max_check_ms is not None and probe["check_ms"] > options.max_check_ms:
+        failures.append(f"concurrent_probe: {probe['check_ms']:.1f} ms > {options.max_check_ms} ms")
+    failures += [f"{r['scenario']}: checks failed for {', '.join(r['failed'])}" for r in checks if r["failed"]]
+    if failures:
+        print("\nREGRESSION:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
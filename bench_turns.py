@@ -0,0 +1,168 @@
+"""
+Benchmark: full agent turns against the local stub LLM server.
+
+One turn is right response -> process_response -> left agreement -> run_command ->
+result back to the right LLM. Each scenario runs a headless Agent in a temporary
+directory and drives AgentLoop.turn directly, reporting turns/sec, p50/p99 turn
+latency and a per-phase breakdown.
+
+Run with:
+    python bench_turns.py [--turns 200] [--latency 0.005] [--scenario always_agree ...]
+    python bench_turns.py --max-p99-ms 80 --min-tps 20   # exit 1 on regression
+"""
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+import Aiden_API
+from stub_llm_server import StubLLMServer
+
+STREAM_CHATTER = "\nThat should do it. Next I plan to outline the chapter, then draft it scene by scene." * 4
+
+PURE_COMMANDS = [
+    "{{#getfilecontent#}chapters.txt|lines|90000-90040[END_CMD]",
+    "{{#searchmemory#}chapters.txt|lighthouse|2[END_CMD]",
+    "{{#listmemoryfiles#}all[END_CMD]",
+    "{{#searchmemory#}ALL|friendship[END_CMD]",
+]
+
+SCENARIOS = {
+    "always_agree": {"left_mode": "agree"},
+    "disagree_5_loops": {"left_mode": "disagree"},
+    "disagree_then_agree": {"left_mode": "disagree_n", "disagree_n": 2},
+    "malformed_commands": {"left_mode": "agree", "malformed_rate": 0.5},
+    "parallel_quorum": {"left_mode": "agree", "api": {"left": {"verify_mode": "parallel", "verify_fanout": 3, "verify_quorum": 2}}},
+    # The right LLM keeps talking after its command; streaming should cut it off at [END_CMD]
+    "streaming": {"left_mode": "agree", "chatter": STREAM_CHATTER, "stream_delay": 0.002,
+                  "api": {"left": {"stream": True}, "right": {"stream": True}}},
+    "right_context": {"left_mode": "agree", "api": {"right": {"context_tokens": 2000}}},
+    "batch_4": {"left_mode": "agree", "right_batch": 4, "api": {"right": {"max_batch": 4}}},
+    "batch_4_streaming": {"left_mode": "agree", "right_batch": 4,
+                          "api": {"left": {"stream": True}, "right": {"max_batch": 4, "stream": True}}},
+    "pure_reads": {"left_mode": "agree", "right_commands": PURE_COMMANDS},
+    "pure_reads_no_speculation": {"left_mode": "agree", "right_commands": PURE_COMMANDS, "api": {"left": {"speculate": False}}},
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))  # Nearest rank
+    return ordered[index]
+
+
+def make_agent_dir(root: Path, api_config: dict) -> Path:
+    base_dir = root / "agent"
+    for name in ("memory", "scripts", "logs"):
+        (base_dir / name).mkdir(parents=True, exist_ok=True)
+    (base_dir / "memory" / "agent_init.txt").write_text("Benchmark agent. Reply with one command.", encoding="utf-8")
+    (base_dir / "memory" / "agent2.txt").write_text("Echo the command if you agree.", encoding="utf-8")
+    (base_dir / "memory" / "notes.txt").write_text("friendship notes\n" * 50, encoding="utf-8")
+    # A large manuscript, so read-only commands cost something (pure_reads scenarios)
+    lines = (f"Chapter {i // 400 + 1}, line {i}: the fox and the owl walk on." for i in range(200000))
+    (base_dir / "memory" / "chapters.txt").write_text("\n".join(lines) + "\nThe lighthouse keeper waves.\n", encoding="utf-8")
+    (base_dir / "hemisphere_api.json").write_text(json.dumps(api_config), encoding="utf-8")
+    return base_dir
+
+
+def run_scenario(name: str, spec: dict, turns: int, latency: float, jitter: float, error_rate: float) -> dict:
+    behavior = {k: v for k, v in spec.items() if k != "api"}
+    behavior.update(latency=latency, jitter=jitter, error_rate=error_rate)
+    server = StubLLMServer(behavior, seed=1).start()
+    api_config = server.api_config()
+    for hemisphere, extra in spec.get("api", {}).items():
+        api_config[hemisphere].update(extra)
+
+    root = Path(tempfile.mkdtemp(prefix="aiden-bench-"))
+    agent = Aiden_API.Agent(make_agent_dir(root, api_config), {"logging": {"level": "ERROR"}}, api_config)
+    records = []
+    agent.loop.turn_listeners.append(records.append)
+    try:
+        response = Aiden_API.interact_with_llm(agent, "right", agent.init_prompt)
+        start = time.perf_counter()
+        for _ in range(turns):
+            response = agent.loop.turn(response)
+        elapsed = time.perf_counter() - start
+    finally:
+        agent.close()
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+    totals = [r["total"] for r in records]
+    commands = sum(r.get("commands", 0) for r in records)
+    phases = {}
+    for record in records:
+        for phase, seconds in record["phases"].items():
+            phases.setdefault(phase, []).append(seconds)
+    outcomes = {}
+    for record in records:
+        outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+    return {
+        "scenario": name,
+        "turns": len(records),
+        "turns_per_sec": len(records) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(totals, 50) * 1000,
+        "p99_ms": percentile(totals, 99) * 1000,
+        "llm_requests": server.requests,
+        "commands": commands,
+        "llm_requests_per_command": server.requests / commands if commands else None,
+        "outcomes": outcomes,
+        "phases_ms": {
+            phase: {"mean": sum(v) / len(v) * 1000, "p50": percentile(v, 50) * 1000, "p99": percentile(v, 99) * 1000}
+            for phase, v in phases.items()
+        },
+    }
+
+
+def print_report(result: dict):
+    print(f"\n== {result['scenario']} ==")
+    print(f"turns: {result['turns']}  turns/sec: {result['turns_per_sec']:.1f}  "
+          f"p50: {result['p50_ms']:.2f} ms  p99: {result['p99_ms']:.2f} ms  llm requests: {result['llm_requests']}")
+    per_command = result["llm_requests_per_command"]
+    print(f"outcomes: {result['outcomes']}  commands run: {result['commands']}  "
+          f"llm requests/command: {per_command:.2f}" if per_command else f"outcomes: {result['outcomes']}")
+    for phase, stats in sorted(result["phases_ms"].items()):
+        print(f"  {phase:<8} mean {stats['mean']:8.2f} ms   p50 {stats['p50']:8.2f} ms   p99 {stats['p99']:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent turn benchmark against a stub LLM server")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub latency per LLM call (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="default: all")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if any scenario's p99 turn latency exceeds this")
+    parser.add_argument("--min-tps", type=float, help="fail if any scenario runs fewer turns/sec than this")
+    options = parser.parse_args()
+
+    results = [
+        run_scenario(name, SCENARIOS[name], options.turns, options.latency, options.jitter, options.error_rate)
+        for name in (options.scenario or SCENARIOS)
+    ]
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print_report(result)
+
+    failures = []
+    for result in results:
+        if options.max_p99_ms is not None and result["p99_ms"] > options.max_p99_ms:
+            failures.append(f"{result['scenario']}: p99 {result['p99_ms']:.2f} ms > {options.max_p99_ms} ms")
+        if options.min_tps is not None and result["turns_per_sec"] < options.min_tps:
+            failures.append(f"{result['scenario']}: {result['turns_per_sec']:.1f} turns/sec < {options.min_tps}")
+    if failures:
+        print("\nREGRESSION:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Local stub LLM server for benchmarks and offline runs.
+
+Answers in the response shapes hf_infer / openrouter_infer parse:
+  POST .../chat/completions  -> OpenRouter (OpenAI-compatible) JSON, or SSE when "stream" is set
+  POST anything else         -> Hugging Face [{"generated_text": ...}], or TGI token SSE when "stream" is set
+
+Behaviour is scriptable (programmatically or from the command line):
+  latency, jitter       seconds added to every generation (uniform +/- jitter)
+  probe_latency         seconds added to every GET (models list / metadata probe)
+  error_rate            fraction of requests answered with HTTP 503
+  left_mode             "agree" (echo the command), "disagree" (always), "disagree_n" (disagree n times, then agree)
+  disagree_n            n for "disagree_n"
+  malformed_rate        fraction of right replies that contain no valid command
+  right_commands        commands the right hemisphere cycles through
+  right_batch           commands per right reply (for the agent's batch mode)
+  chatter               text the right hemisphere keeps generating after its commands
+  stream_delay          seconds between streamed pieces
+  chunked               send streams with chunked encoding (default) or, if false, close-delimited
+
+Verification prompts are recognised by the agent's own wording ("Command(s) from right LLM" /
+"Retry command(s)"), so one stub can serve both hemispheres; agreeing echoes every command.
+
+Run standalone with:
+    python stub_llm_server.py --port 8080 --latency 0.2 --left-mode disagree_n --disagree-n 2
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BEHAVIOR = {
+    "latency": 0.0,
+    "jitter": 0.0,
+    "probe_latency": 0.0,
+    "error_rate": 0.0,
+    "left_mode": "agree",
+    "disagree_n": 2,
+    "malformed_rate": 0.0,
+    "right_batch": 1,
+    "chatter": "",
+    "stream_delay": 0.0,
+    "chunked": True,
+    "right_commands": [
+        "{{#listmemoryfiles#}all[END_CMD]",
+        "{{#getfilecontent#}notes.txt[END_CMD]",
+        "{{#searchmemory#}ALL|friendship[END_CMD]",
+        "{{#creatememoryentry#}bench|stub turn note[END_CMD]",
+    ],
+}
+
+VERIFY_LABEL = re.compile(r"(?:Commands? from right LLM|Retry commands?)")
+VERIFIED_COMMAND = re.compile(r"\{#(.+?)#\}(.*?)\{END_CMD\}")
+
+
+class StubLLMServer:
+    def __init__(self, behavior: dict = None, host: str = "127.0.0.1", port: int = 0, seed: int = None):
+        self.behavior = dict(DEFAULT_BEHAVIOR, **(behavior or {}))
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.right_turn = 0
+        self.disagreements = {}  # command text -> disagreements so far
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def api_config(self, **extra) -> dict:
+        """hemisphere_api.json content pointing both hemispheres at this server."""
+        return {
+            "left": dict({"provider": "openrouter", "model": "stub-left", "api_url": f"{self.url}/v1", "api_token": "stub"}, **extra),
+            "right": dict({"provider": "openrouter", "model": "stub-right", "api_url": f"{self.url}/v1", "api_token": "stub"}, **extra),
+        }
+
+    def reply_for(self, prompt: str) -> str:
+        behavior = self.behavior
+        with self.lock:
+            self.requests += 1
+            label = VERIFY_LABEL.search(prompt)
+            if label:
+                command = "\n".join("{{#%s#}%s[END_CMD]" % c for c in VERIFIED_COMMAND.findall(prompt[label.end():]))
+                mode = behavior["left_mode"]
+                if mode == "disagree":
+                    return "Disagree: stub always disagrees."
+                if mode == "disagree_n":
+                    seen = self.disagreements.get(command, 0)
+                    if seen < behavior["disagree_n"]:
+                        self.disagreements[command] = seen + 1
+                        return "Disagree: stub wants another look."
+                    self.disagreements.pop(command, None)
+                return command
+            if self.random.random() < behavior["malformed_rate"]:
+                return "Sure! I think the next step is to write the book."
+            commands = behavior["right_commands"]
+            reply = []
+            for _ in range(behavior["right_batch"]):
+                reply.append(commands[self.right_turn % len(commands)])
+                self.right_turn += 1
+            return "\n".join(reply) + behavior["chatter"]
+
+    def delay(self):
+        behavior = self.behavior
+        with self.lock:
+            delay = behavior["latency"] + self.random.uniform(-behavior["jitter"], behavior["jitter"])
+            fail = self.random.random() < behavior["error_rate"]
+        if delay > 0:
+            time.sleep(delay)
+        return fail
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    import gzip
+                    raw = gzip.decompress(raw)
+                body = json.loads(raw or b"{}")
+                chat = self.path.endswith("/chat/completions")
+                prompt = body["messages"][-1]["content"] if chat else body.get("inputs", "")
+                if server.delay():
+                    return self.send_json({"error": "stub overloaded"}, 503)
+                text = server.reply_for(prompt)
+                sent = "".join(m.get("content", "") for m in body["messages"]) if chat else prompt
+                usage = {"prompt_tokens": len(sent) // 4, "completion_tokens": len(text) // 4}
+                if body.get("stream"):
+                    return self.send_stream(text, chat, usage)
+                if chat:
+                    return self.send_json({"choices": [{"message": {"content": text}}], "usage": usage})
+                return self.send_json([{"generated_text": text}])
+
+            def do_GET(self):
+                # Cheap metadata probe (models list / model card)
+                if server.behavior["probe_latency"] > 0:
+                    time.sleep(server.behavior["probe_latency"])
+                return self.send_json({"data": [{"id": "stub-left"}, {"id": "stub-right"}]})
+
+            def send_json(self, data, status=200):
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_stream(self, text, chat, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                chunked = server.behavior["chunked"]
+                if chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                else:
+                    self.send_header("Connection", "close")  # The body ends when the connection does
+                self.end_headers()
+                pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+                delay = server.behavior["stream_delay"]
+                cancelled = False
+                try:
+                    for piece in pieces:
+                        if chat:
+                            event = {"choices": [{"delta": {"content": piece}}]}
+                        else:
+                            event = {"token": {"text": piece, "special": False}}
+                        self.send_chunk(f"data: {json.dumps(event)}\n\n", chunked)
+                        if delay > 0:
+                            time.sleep(delay)
+                    if chat:
+                        self.send_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n", chunked)
+                    self.send_chunk("data: [DONE]\n\n", chunked)
+                    if chunked:
+                        self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    cancelled = True  # Client cancelled the generation
+                self.close_connection = cancelled or not chunked
+
+            def send_chunk(self, text, chunked):
+                data = text.encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data) if chunked else data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub LLM server (Hugging Face + OpenRouter shapes)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--behavior", help="JSON file with behaviour overrides")
+    parser.add_argument("--latency", type=float)
+    parser.add_argument("--jitter", type=float)
+    parser.add_argument("--probe-latency", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--left-mode", choices=["agree", "disagree", "disagree_n"])
+    parser.add_argument("--disagree-n", type=int)
+    parser.add_argument("--malformed-rate", type=float)
+    parser.add_argument("--chatter", help="text the right hemisphere sends after its commands")
+    parser.add_argument("--stream-delay", type=float)
+    parser.add_argument("--close-delimited", dest="chunked", action="store_false", default=None,
+                        help="send streams without chunked encoding")
+    options = parser.parse_args()
+
+    behavior = {}
+    if options.behavior:
+        with open(options.behavior) as f:
+            behavior.update(json.load(f))
+    for key in ("latency", "jitter", "probe_latency", "error_rate", "left_mode", "disagree_n", "malformed_rate",
+                "chatter", "stream_delay", "chunked"):
+        if getattr(options, key) is not None:
+            behavior[key] = getattr(options, key)
+    server = StubLLMServer(behavior, options.host, options.port)
+    print(f"Stub LLM server on {server.url} (OpenRouter api_url: {server.url}/v1)", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
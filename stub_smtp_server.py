@@ -0,0 +1,168 @@
+"""
+Local stub SMTP server for tests and offline runs of the mail outbox.
+
+Speaks enough SMTP for smtplib: EHLO/HELO, AUTH PLAIN/LOGIN (any credentials), MAIL, RCPT,
+DATA, RSET, NOOP, QUIT. No STARTTLS, so point the agent at it with "starttls": false in the
+"email" section of hemisphere.json. Received messages are kept in .messages as
+(from, [to...], raw message bytes).
+
+Behaviour is scriptable (programmatically or from the command line):
+  latency          seconds added before every DATA reply
+  fail_rate        fraction of messages answered with 451 (temporary failure)
+  reject           recipient addresses answered with 550 (permanent failure)
+  drop_after       close the connection after this many messages (0 = never)
+
+Run standalone with:
+    python stub_smtp_server.py --port 2525 --fail-rate 0.2
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+import socketserver
+
+DEFAULT_BEHAVIOR = {
+    "latency": 0.0,
+    "fail_rate": 0.0,
+    "reject": [],
+    "drop_after": 0,
+}
+
+
+class ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True  # Restart on the same port in tests
+
+
+class StubSMTPServer:
+    def __init__(self, behavior: dict = None, host: str = "127.0.0.1", port: int = 0, seed: int = None):
+        self.behavior = dict(DEFAULT_BEHAVIOR, **(behavior or {}))
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.server = ThreadingSMTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def email_config(self, **extra) -> dict:
+        """"email" section of hemisphere.json for this server."""
+        return dict({"starttls": False}, **extra)
+
+    def accept(self, sender: str, recipients: list, data: bytes) -> str:
+        """Returns: the reply to the end of DATA."""
+        behavior = self.behavior
+        if behavior["latency"] > 0:
+            time.sleep(behavior["latency"])
+        with self.lock:
+            if self.random.random() < behavior["fail_rate"]:
+                return "451 4.3.0 stub temporary failure"
+            self.messages.append((sender, recipients, data))
+            return f"250 2.0.0 queued as {len(self.messages)}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode("utf-8") + b"\r\n")
+
+            def handle(self):
+                with server.lock:
+                    server.connections += 1
+                self.reply("220 stub-smtp ESMTP ready")
+                sender, recipients, sent = None, [], 0
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    verb, _, arg = line.decode("utf-8", "replace").strip().partition(" ")
+                    verb = verb.upper()
+                    if verb == "EHLO":
+                        self.reply("250-stub-smtp")
+                        self.reply("250-AUTH PLAIN LOGIN")
+                        self.reply("250 8BITMIME")
+                    elif verb == "HELO":
+                        self.reply("250 stub-smtp")
+                    elif verb == "AUTH":
+                        mechanism, _, initial = arg.partition(" ")
+                        if mechanism.upper() == "LOGIN":
+                            if not initial:
+                                self.reply("334 VXNlcm5hbWU6")
+                                self.rfile.readline()
+                            self.reply("334 UGFzc3dvcmQ6")
+                            self.rfile.readline()
+                        elif not initial:
+                            self.reply("334 ")
+                            self.rfile.readline()
+                        self.reply("235 2.7.0 authenticated")
+                    elif verb == "MAIL":
+                        sender, recipients = arg.partition(":")[2].strip().strip("<>"), []
+                        self.reply("250 2.1.0 ok")
+                    elif verb == "RCPT":
+                        recipient = arg.partition(":")[2].strip().strip("<>")
+                        if recipient in server.behavior["reject"]:
+                            self.reply("550 5.1.1 no such user")
+                        else:
+                            recipients.append(recipient)
+                            self.reply("250 2.1.5 ok")
+                    elif verb == "DATA":
+                        self.reply("354 end data with <CR><LF>.<CR><LF>")
+                        data = []
+                        for raw in iter(self.rfile.readline, b""):
+                            if raw in (b".\r\n", b".\n"):
+                                break
+                            data.append(raw[1:] if raw.startswith(b"..") else raw)
+                        self.reply(server.accept(sender, recipients, b"".join(data)))
+                        sender, recipients, sent = None, [], sent + 1
+                        if server.behavior["drop_after"] and sent >= server.behavior["drop_after"]:
+                            return  # Drop the connection without QUIT
+                    elif verb == "RSET":
+                        sender, recipients = None, []
+                        self.reply("250 2.0.0 ok")
+                    elif verb == "NOOP":
+                        self.reply("250 2.0.0 ok")
+                    elif verb == "QUIT":
+                        self.reply("221 2.0.0 bye")
+                        return
+                    else:
+                        self.reply("502 5.5.2 command not recognized")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub SMTP server (no TLS, accepts any login)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float)
+    parser.add_argument("--fail-rate", type=float)
+    parser.add_argument("--reject", action="append", help="recipient to refuse with 550 (repeatable)")
+    parser.add_argument("--drop-after", type=int)
+    options = parser.parse_args()
+
+    behavior = {key: getattr(options, key) for key in DEFAULT_BEHAVIOR if getattr(options, key) is not None}
+    server = StubSMTPServer(behavior, options.host, options.port)
+    host, port = server.address
+    print(f"Stub SMTP server on {host}:{port} (use \"starttls\": false)", file=sys.stderr)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
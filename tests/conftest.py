@@ -0,0 +1,74 @@
+"""Shared fixtures: the repo root on sys.path, throwaway agent directories, stub servers and agents."""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import Aiden_API  # noqa: E402
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+
+def poll(condition, timeout=5.0, interval=0.01):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(interval)
+
+
+@pytest.fixture
+def wait_for():
+    """wait_for(condition, timeout=5.0): poll until condition() is true, failing the test on timeout."""
+    return poll
+
+
+@pytest.fixture
+def start_llm_server():
+    """start_llm_server(behavior=None, **options): a StubLLMServer stopped at teardown."""
+    servers = []
+
+    def start(behavior=None, **options):
+        server = StubLLMServer(behavior, **options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def llm_server(start_llm_server):
+    return start_llm_server({"right_commands": ["{{#listmemoryfiles#}all[END_CMD]"]}, seed=1)
+
+
+@pytest.fixture
+def agent_dir(tmp_path):
+    base_dir = tmp_path / "agent"
+    for name in ("memory", "scripts", "logs"):
+        (base_dir / name).mkdir(parents=True)
+    (base_dir / "memory" / "agent_init.txt").write_text("Test agent. Reply with one command.", encoding="utf-8")
+    (base_dir / "memory" / "agent2.txt").write_text("Echo the command if you agree.", encoding="utf-8")
+    return base_dir
+
+
+@pytest.fixture
+def make_agent(agent_dir):
+    """
+    make_agent(api_config, level="ERROR", scheduler=None, **config): an Agent on agent_dir, closed at
+    teardown. config is merged into hemisphere.json's content (e.g. logging={...}).
+    """
+    agents = []
+
+    def make(api_config, level="ERROR", scheduler=None, **config):
+        config.setdefault("logging", {})
+        config["logging"].setdefault("level", level)
+        agent = Aiden_API.Agent(agent_dir, config, api_config, scheduler=scheduler)
+        agents.append(agent)
+        return agent
+
+    yield make
+    for agent in agents:
+        agent.close()
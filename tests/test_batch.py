@@ -0,0 +1,75 @@
+import pytest
+
+import Aiden_API
+from Aiden_API import LLMError, plan_waves, process_commands
+
+LIST = ("listmemoryfiles", "all")
+NOTE = ("creatememoryentry", "t|note")
+READ = ("getfilecontent", "notes.txt")
+
+
+@pytest.fixture
+def batch_agent(make_agent):
+    """batch_agent(server): an agent whose right hemisphere may send up to 4 commands."""
+    def make(server):
+        api_config = server.api_config()
+        api_config["right"]["max_batch"] = 4
+        return make_agent(api_config)
+    return make
+
+
+def cmd(command, args):
+    return "{{#%s#}%s[END_CMD]" % (command, args)
+
+
+def test_process_commands_reads_every_command_in_order(batch_agent, llm_server):
+    agent = batch_agent(llm_server)
+    # Both bracket styles the agent accepts
+    response = "First " + cmd(*LIST) + " then {#getfilecontent#}notes.txt{END_CMD} and " + cmd(*NOTE)
+    assert process_commands(agent, response, 4) == [LIST, READ, NOTE]
+    assert process_commands(agent, response, 2) == [LIST, READ]
+    assert process_commands(agent, "No command here", 4) == []
+    assert process_commands(agent, LLMError("Error: down"), 4) == []
+
+
+def test_plan_waves_keeps_conflicting_commands_in_order():
+    resources = [
+        ({"listing"}, set()),               # 0 listmemoryfiles
+        (set(), {"file:a", "listing"}),     # 1 write a
+        ({"file:a"}, set()),                # 2 read a
+        ({"file:b"}, set()),                # 3 read b
+        (set(), {"db"}),                    # 4 creatememoryentry
+        (set(), {"*"}),                     # 5 runcommand
+        ({"db"}, set()),                    # 6 searchmemory ALL
+    ]
+    assert plan_waves(resources) == [[0, 3, 4], [1], [2], [5], [6]]
+
+
+def test_verify_batch_agrees_on_echoed_commands(batch_agent, start_llm_server):
+    server = start_llm_server({"left_mode": "disagree_n", "disagree_n": 1})
+    agent = batch_agent(server)
+    agreed, left_response = agent.loop.verify_batch([LIST, READ])
+    assert agreed == [True, True]
+    assert process_commands(agent, left_response, 4) == [LIST, READ]
+    assert server.requests == 2  # One disagreement round, then both echoed
+
+
+def test_unanswered_round_leaves_commands_unverified(batch_agent, llm_server, monkeypatch):
+    agent = batch_agent(llm_server)
+    left_replies = [cmd(*LIST), LLMError("Error: left LLM down", "left")]
+    sent_to_right = []
+    real_interact = Aiden_API.interact_with_llm
+
+    def interact(agent, hemisphere, user_input, *args, **kwargs):
+        if hemisphere == "left":
+            return left_replies.pop(0)
+        sent_to_right.append(user_input)
+        return real_interact(agent, hemisphere, user_input, *args, **kwargs)
+
+    monkeypatch.setattr(Aiden_API, "interact_with_llm", interact)
+    agent.loop.run_batch([LIST, NOTE], cmd(*LIST) + cmd(*NOTE))
+    report = sent_to_right[0]
+    assert "Commands executed (1 of 2)" in report
+    assert "Left LLM unreachable, not verified or run: {#creatememoryentry#}t|note{END_CMD}" in report
+    assert "Not agreed" not in report
+    assert "left LLM down" not in report  # Error text never reaches the other hemisphere
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+import Aiden_API
+
+
+@pytest.fixture
+def logged_agent(make_agent):
+    """Agents whose log keeps the prompts sent, so tests can read them back."""
+    return lambda api_config: make_agent(api_config, logging={"level": "INFO", "max_payload": 2000})
+
+
+def save_executing(make, api_config, started, done):
+    agent = make(api_config)
+    state = agent.loop.executing("{{#creatememoryentry#}t|note[END_CMD]", [("creatememoryentry", "t|note")])
+    state["started"], state["done"] = started, done
+    agent.loop.checkpoint("executing", state)
+    agent.close()
+
+
+def run_one_turn(agent):
+    """Resume the agent and stop it after its first turn. Returns: (turn record, 't' memories at that point)"""
+    finished = threading.Event()
+    seen = {}
+
+    def on_turn(record):
+        if not finished.is_set():
+            seen["record"] = record
+            seen["memories"] = count_memories(agent)
+            agent.set_paused(True)
+            finished.set()
+
+    agent.loop.turn_listeners.append(on_turn)
+    agent.loop.start()
+    agent.set_paused(False)
+    assert finished.wait(10)
+    return seen["record"], seen["memories"]
+
+
+def count_memories(agent):
+    with agent.db_lock:
+        return agent.conn.execute("SELECT COUNT(*) FROM memories WHERE category = 't'").fetchone()[0]
+
+
+def sent_to_right(agent):
+    return [line for line in agent.log_lines if "Sending to right" in line]
+
+
+def test_started_but_unsaved_command_is_not_rerun(logged_agent, llm_server):
+    api_config = llm_server.api_config()
+    save_executing(logged_agent, api_config, started=["0"], done={})
+
+    agent = logged_agent(api_config)
+    assert agent.initial_prompt_sent  # agent_init.txt is not sent again
+    record, memories = run_one_turn(agent)
+    assert record["outcome"] == "executed"
+    assert memories == 0
+    assert Aiden_API.INTERRUPTED_RESULT in sent_to_right(agent)[0]
+
+
+def test_saved_result_is_reported_without_running_again(logged_agent, llm_server):
+    api_config = llm_server.api_config()
+    save_executing(logged_agent, api_config, started=["0"], done={"0": "Memory entry created: saved-id"})
+    requests_before = llm_server.requests
+
+    agent = logged_agent(api_config)
+    record, memories = run_one_turn(agent)
+    assert memories == 0
+    first = sent_to_right(agent)[0]
+    assert "Result: Memory entry created: saved-id" in first
+    assert llm_server.requests - requests_before == 1  # Only the report; no right or left call is repeated
+
+
+def test_awaiting_right_resends_the_saved_prompt(logged_agent, llm_server):
+    api_config = llm_server.api_config()
+    agent = logged_agent(api_config)
+    agent.loop.checkpoint("awaiting_right", {"prompt": "Saved prompt from the last run."})
+    agent.close()
+
+    agent = logged_agent(api_config)
+    assert agent.checkpoints.load()["phase"] == "awaiting_right"
+    run_one_turn(agent)
+    assert "Saved prompt from the last run." in sent_to_right(agent)[0]
+
+
+def test_checkpoints_are_synced_to_disk(make_agent, llm_server):
+    agent = make_agent(llm_server.api_config())
+    assert agent.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert agent.conn.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
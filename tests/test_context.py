@@ -0,0 +1,53 @@
+import Aiden_API
+from Aiden_API import (CONTEXT_LOW_WATER, CONTEXT_PRIORITY_LOW, CONTEXT_SUMMARY_CATEGORY, ConversationContext)
+
+
+def test_system_prompt_leads_and_prefix_is_stable():
+    context = ConversationContext("You are the right hemisphere.", max_tokens=10000)
+    sent = []
+    for turn in range(4):
+        messages = context.build(f"prompt {turn}")
+        sent.append(messages)
+        context.record(f"prompt {turn}", f"reply {turn}")
+    for turn, (earlier, later) in enumerate(zip(sent, sent[1:])):
+        assert later[0] == {"role": "system", "content": "You are the right hemisphere."}
+        # Everything sent before is resent unchanged, followed by the reply to it
+        assert later[:len(earlier)] == earlier
+        assert later[len(earlier)] == {"role": "assistant", "content": f"reply {turn}"}
+
+
+def test_low_priority_turns_are_evicted_first_down_to_low_water():
+    evicted = []
+    context = ConversationContext("system", max_tokens=10000, keep_recent=1, on_evict=evicted.extend)
+    for i, priority in enumerate([1, CONTEXT_PRIORITY_LOW, 1, CONTEXT_PRIORITY_LOW, 1]):
+        context.record(f"prompt {i} " + "x" * 80, f"reply {i} " + "y" * 80, priority)
+    turn = context.exchanges[0]["tokens"]
+    prompt = "next"
+    prompt_tokens = context.estimate_tokens(prompt)
+    # Room for three turns under the low-water mark, but not for four
+    budget = int((3 * turn + prompt_tokens) / CONTEXT_LOW_WATER) + 1
+    assert budget < 5 * turn + prompt_tokens and budget * CONTEXT_LOW_WATER < 4 * turn + prompt_tokens
+    context.max_tokens = budget + context.estimate_tokens("system")
+
+    messages = context.build(prompt)
+
+    assert [ex["prompt"].split(" x")[0] for ex in evicted] == ["prompt 1", "prompt 3"]
+    assert [ex["prompt"].split(" x")[0] for ex in context.exchanges] == ["prompt 0", "prompt 2", "prompt 4"]
+    assert context.history_tokens() <= budget * CONTEXT_LOW_WATER - prompt_tokens
+    assert messages[0]["role"] == "system" and messages[-1]["content"] == prompt
+
+
+def test_evicted_turns_are_summarized_into_the_memory_db(make_agent, llm_server):
+    api_config = llm_server.api_config()
+    api_config["right"].update(context_tokens=600, context_keep_recent=1)
+    agent = make_agent(api_config)
+    for turn in range(8):
+        reply = Aiden_API.interact_with_llm(agent, "right", f"Turn {turn}: " + "note " * 60)
+        assert not isinstance(reply, Aiden_API.LLMError)
+    with agent.db_lock:
+        summaries = [row[0] for row in agent.conn.execute(
+            "SELECT content FROM memories WHERE category = ?", (CONTEXT_SUMMARY_CATEGORY,))]
+    assert summaries
+    assert all(summary.startswith("[right] ") for summary in summaries)
+    assert "Turn 0:" in summaries[0]
+    assert len(agent.contexts["right"].exchanges) < 8
@@ -0,0 +1,122 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import Aiden_API
+from Aiden_API import EndpointHealth, EndpointRouter, ResponseCache, StreamCancelled
+
+
+def dead_url():
+    """A local URL nothing listens on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}/v1"
+
+
+def recording_slot(calls):
+    @contextmanager
+    def slot(provider):
+        calls.append(provider)
+        yield
+    return slot
+
+
+def test_breaker_opens_then_half_open_trial():
+    health = EndpointHealth("m@host")
+    assert not health.failure(3, 60, counts=False)  # Bad request: not the endpoint's fault
+    assert not health.failure(3, 60)
+    assert not health.failure(3, 60)
+    assert health.failure(3, 60)
+    assert not health.available(time.time())
+    health.open_until = time.time() - 1  # Cooldown over
+    assert health.available(time.time())
+    health.begin(time.time())
+    assert not health.available(time.time())  # One trial at a time
+    assert health.failure(3, 60)  # A failed trial re-opens at once
+    health.open_until = time.time() - 1
+    health.begin(time.time())
+    assert health.success(0.1)
+    assert health.stats() == {"ewma_ms": 100.0, "failures": 0, "open": False, "requests": 2, "errors": 4}
+
+
+def test_rank_prefers_healthy_then_fast():
+    router = EndpointRouter()
+    slow, fast, broken = ({"model": name, "api_url": "http://h/v1"} for name in ("slow", "fast", "broken"))
+    router.health(slow).success(0.5)
+    router.health(fast).success(0.1)
+    for _ in range(3):
+        router.health(broken).failure(3, 60)
+    assert [e["model"] for e in router.rank([broken, slow, fast])] == ["fast", "slow", "broken"]
+
+
+def test_failover_charges_the_provider_actually_called(llm_server):
+    router = EndpointRouter()
+    model_info = {"api_token": "stub", "retries": 2, "backoff": 0.01, "endpoints": [
+        {"provider": "openrouter", "model": "down", "api_url": dead_url()},
+        {"provider": "huggingface", "model": "stub-hf", "api_url": f"{llm_server.url}/models/stub-hf"},
+    ]}
+    calls = []
+    response = router.call("right", model_info, "Write the first chapter.", slot=recording_slot(calls))
+    assert response.startswith("{{#listmemoryfiles#}")
+    assert calls == ["openrouter", "huggingface"]
+    assert router.stats()["down@" + model_info["endpoints"][0]["api_url"].split("/")[2]]["errors"] == 1
+
+
+def test_gives_up_after_retries():
+    router = EndpointRouter()
+    model_info = {"provider": "openrouter", "model": "down", "api_url": dead_url(), "api_token": "x",
+                  "retries": 2, "backoff": 0.01}
+    calls = []
+    with pytest.raises(Exception):
+        router.call("right", model_info, "hello", slot=recording_slot(calls))
+    assert calls == ["openrouter"] * 3
+
+
+class RecordingCancel:
+    """A cancel event that records backoff waits and cancels at the first one."""
+    def __init__(self):
+        self.waits = []
+
+    def is_set(self):
+        return bool(self.waits)
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        return True
+
+
+def test_retry_after_is_not_cut_to_backoff_max(monkeypatch):
+    monkeypatch.setattr(Aiden_API, "retry_after", lambda error: 30.0)
+    router = EndpointRouter()
+    model_info = {"provider": "openrouter", "model": "down", "api_url": dead_url(), "api_token": "x",
+                  "retries": 2, "backoff": 0.01, "backoff_max": 8}
+    cancel = RecordingCancel()
+    with pytest.raises(StreamCancelled):
+        router.call("right", model_info, "hello", cancel=cancel)
+    assert cancel.waits == [30.0]
+
+
+def test_cancel_stops_both_hedged_attempts(start_llm_server):
+    server = start_llm_server({"latency": 0.3, "chatter": " more" * 200, "stream_delay": 0.02})
+    router = EndpointRouter()
+    endpoint = {"provider": "openrouter", "api_url": f"{server.url}/v1", "api_token": "stub", "stream": True,
+                "stop_on_command": False}
+    model_info = {"hedge_after": 0.05, "retries": 0,
+                  "endpoints": [dict(endpoint, model="primary"), dict(endpoint, model="backup")]}
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    start = time.perf_counter()
+    with pytest.raises(StreamCancelled):
+        router.call("left", model_info, "Write the book.", cancel=cancel)
+    assert time.perf_counter() - start < 1.5  # Neither stream (about 4 s long) is waited for
+
+
+def test_cache_key_covers_endpoint_models():
+    base = {"provider": "openrouter", "api_token": "x"}
+    left = dict(base, endpoints=[{"model": "model-a", "api_url": "https://a/v1"}])
+    left_b = dict(base, endpoints=[{"model": "model-b", "api_url": "https://b/v1"}])
+    assert ResponseCache.make_key(left, "prompt") != ResponseCache.make_key(left_b, "prompt")
+    assert ResponseCache.make_key(left, "prompt") == ResponseCache.make_key(dict(left, api_token="y"), "prompt")
@@ -0,0 +1,89 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import Aiden_API
+from Aiden_API import CommandExecutor, OutputCapture
+
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor(max_workers=2, timeout=10)
+    yield executor
+    executor.close()
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_output_and_exit_code(executor):
+    result = executor.run(python("import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"))
+    assert (result.returncode, result.stdout, result.stderr, result.stopped) == (3, "out\n", "err\n", None)
+    assert result.summary().startswith("[exit code 3; wall ")
+    assert result.summary().endswith("]\nout\n\nstderr:\nerr\n")
+
+
+def test_output_keeps_head_and_tail():
+    capture = OutputCapture(head_bytes=4, tail_bytes=3)
+    for piece in (b"abc", b"defgh", b"ijk"):
+        capture.write(piece)
+    assert capture.text() == "abcd\n... [4 bytes truncated] ...\nijk"
+
+
+def test_large_output_is_capped():
+    executor = CommandExecutor(output_head=10, output_tail=10)
+    try:
+        result = executor.run(python("print('x' * 1000000, end='')"))
+    finally:
+        executor.close()
+    assert result.stdout == "x" * 10 + "\n... [999980 bytes truncated] ...\n" + "x" * 10
+
+
+def test_wall_clock_timeout(executor):
+    start = time.perf_counter()
+    result = executor.run(python("import time; time.sleep(30)"), timeout=0.3)
+    assert result.stopped == "timeout"
+    assert time.perf_counter() - start < 5
+    assert result.summary().startswith("[killed: wall-clock timeout")
+
+
+def test_cancel_all_kills_running_and_queued():
+    executor = CommandExecutor(max_workers=1, timeout=30)
+    try:
+        running = executor.submit(python("import time; time.sleep(30)"))
+        queued = executor.submit(python("print('never')"))
+        time.sleep(0.3)
+        threading.Timer(0.1, executor.cancel_all).start()
+        assert running.result(10).stopped == "cancelled"
+        assert queued.result(10).stopped == "cancelled"
+    finally:
+        executor.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="RLIMIT_CPU through prlimit")
+def test_cpu_limit(executor):
+    result = executor.run(python("while True: pass"), cpu_seconds=1)
+    assert result.stopped == "cpu_limit"
+
+
+def test_missing_program(executor):
+    result = executor.run(["/nonexistent/tool"])
+    assert result.error and result.summary().startswith("Command error: ")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="runs the script through its #! line")
+def test_runcommand_with_relative_agent_dir(agent_dir, llm_server, monkeypatch):
+    script = agent_dir / "scripts" / "hello.py"
+    script.write_text("#!" + sys.executable + "\nimport os, sys\nprint('hi', sys.argv[1], os.getcwd())\n")
+    script.chmod(0o755)
+    monkeypatch.chdir(agent_dir.parent)
+    agent = Aiden_API.Agent(Aiden_API.Path(agent_dir.name), {}, llm_server.api_config())
+    try:
+        result = Aiden_API.run_command(agent, "runcommand", "scripts|hello.py|there")
+    finally:
+        agent.close()
+    assert result.startswith("[exit code 0")
+    assert f"hi there {agent_dir / 'scripts'}" in result
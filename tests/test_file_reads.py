@@ -0,0 +1,73 @@
+import pytest
+
+import Aiden_API
+from Aiden_API import read_memory_file, search_file
+
+USAGE = "Error: use filename|lines|start[-end] or filename|bytes|offset[|length]"
+
+
+@pytest.fixture
+def chapter(tmp_path):
+    path = tmp_path / "chapter.txt"
+    path.write_text("".join(f"line {n}\n" for n in range(1, 11)), encoding="utf-8")
+    return path
+
+
+def test_whole_file(chapter):
+    assert read_memory_file(chapter) == chapter.read_text(encoding="utf-8")
+
+
+def test_large_file_is_truncated_on_a_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(Aiden_API, "MAX_FILE_READ_BYTES", 20)
+    path = tmp_path / "big.txt"
+    path.write_text("".join(f"line {n}\n" for n in range(1, 11)), encoding="utf-8")
+    text = read_memory_file(path)
+    assert text.startswith("line 1\nline 2\n[... truncated: showing lines 1-2 of 10")
+
+
+def test_line_window(chapter):
+    assert read_memory_file(chapter, "lines|3-4") == "[chapter.txt lines 3-4 of 10]\nline 3\nline 4\n"
+    assert read_memory_file(chapter, "lines|9-99") == "[chapter.txt lines 9-10 of 10]\nline 9\nline 10\n"
+    assert read_memory_file(chapter, "lines|x") == USAGE
+
+
+def test_line_window_past_the_end(chapter):
+    assert read_memory_file(chapter, "lines|11") == "Error: line 11 is out of range (chapter.txt has 10 lines)"
+    assert read_memory_file(chapter, "lines|50-60").startswith("Error: line 50 is out of range")
+
+
+def test_byte_window(chapter):
+    assert read_memory_file(chapter, "bytes|7|7") == "[chapter.txt bytes 7-14 of 71]\nline 2\n"
+    assert read_memory_file(chapter, "bytes|63") == "[chapter.txt bytes 63-71 of 71]\nline 10\n"
+    assert read_memory_file(chapter, "bytes|100|5") == "[chapter.txt bytes 100-100 of 71]\n"
+
+
+def test_byte_window_is_capped(chapter, monkeypatch):
+    monkeypatch.setattr(Aiden_API, "MAX_FILE_READ_BYTES", 4)
+    assert read_memory_file(chapter, "bytes|0|1000") == "[chapter.txt bytes 0-4 of 71]\nline"
+
+
+@pytest.mark.parametrize("spec", ["bytes|0|-1", "bytes|0|0", "bytes|-5", "bytes|-5|3", "bytes|a"])
+def test_bad_byte_window(chapter, spec):
+    assert read_memory_file(chapter, spec) == USAGE
+
+
+def test_unknown_mode(chapter):
+    assert read_memory_file(chapter, "words|3") == "Error: unknown read mode 'words' (use lines or bytes)"
+
+
+def test_search_returns_matching_lines_with_context(chapter):
+    assert search_file(chapter, "line 5") == "lines 4-6, match at byte 28:\n4  line 4\n5> line 5\n6  line 6"
+    assert search_file(chapter, "chapter") == "No matches found"
+
+
+def test_search_merges_windows_and_stops_at_limit(chapter):
+    lines = search_file(chapter, "line", context=0, limit=3).splitlines()
+    assert lines[0] == "lines 1-3, matches at bytes 0, 7, 14:"
+    assert lines[-1] == "[more than 3 matching lines; narrow the search]"
+
+
+def test_line_index_follows_file_changes(chapter):
+    read_memory_file(chapter, "lines|1")
+    chapter.write_text("first\nsecond\n", encoding="utf-8")
+    assert read_memory_file(chapter, "lines|2") == "[chapter.txt lines 2-2 of 2]\nsecond\n"
@@ -0,0 +1,90 @@
+import queue
+import threading
+
+from Aiden_API import AgentUI, Frontend
+
+
+class RecordingFrontend(Frontend):
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def record(self, *call):
+        with self._lock:
+            self.calls.append(call)
+            self.threads.add(threading.current_thread().name)
+
+    def show_request(self, hemisphere, text, request=0):
+        self.record("request", hemisphere, request)
+
+    def append_response(self, hemisphere, chunk, request=0):
+        self.record("chunk", hemisphere, request)
+
+    def show_response(self, hemisphere, text, request=0):
+        self.record("response", hemisphere, request)
+
+
+class FakeText:
+    """Just enough of tk.Text to record what a pane shows."""
+    def __init__(self):
+        self.text = ""
+
+    def delete(self, start, end):
+        self.text = ""
+
+    def insert(self, index, text):
+        self.text += text
+
+    def see(self, index):
+        pass
+
+
+def headless_ui():
+    """An AgentUI without a window: fake panes, and updates left queued for drain()."""
+    ui = AgentUI.__new__(AgentUI)
+    ui.updates = queue.Queue()
+    ui.pane_requests = {}
+    ui.left_request_text, ui.left_response_text = FakeText(), FakeText()
+    ui.right_request_text, ui.right_response_text = FakeText(), FakeText()
+    ui.root = type("Root", (), {"after": lambda self, ms, callback: None})()
+    return ui
+
+
+def test_parallel_votes_are_tagged_per_request(make_agent, start_llm_server):
+    server = start_llm_server({"chatter": " more" * 5}, seed=1)
+    api_config = server.api_config(stream=True)
+    api_config["left"].update(verify_mode="parallel", verify_fanout=3, verify_quorum=3)
+    agent = make_agent(api_config)
+    frontend = agent.frontend = RecordingFrontend()
+    agent.loop.verify("listmemoryfiles", "all")
+
+    requests = [request for kind, _, request in frontend.calls if kind == "request"]
+    assert len(set(requests)) == 3
+    chunks = [request for kind, _, request in frontend.calls if kind == "chunk"]
+    assert chunks and set(chunks) <= set(requests)
+    assert "MainThread" not in frontend.threads  # Hooks run on worker threads; the UI must marshal them
+
+
+def test_ui_renders_only_the_latest_request_per_pane():
+    ui = headless_ui()
+
+    def stream():  # Two parallel votes share the left pane
+        ui.show_request("left", "vote 1", 1)
+        ui.show_request("left_node", "vote 2", 2)
+        for chunk in ("one ", "one"):
+            ui.append_response("left", chunk, 1)
+            ui.append_response("left_node", chunk.replace("one", "two"), 2)
+        ui.show_request("right", "prompt", 3)
+        ui.show_response("left", "one one", 1)
+
+    worker = threading.Thread(target=stream)
+    worker.start()
+    worker.join()
+    assert ui.left_request_text.text == ""  # Nothing rendered off the main thread
+
+    ui.drain()
+    assert ui.left_request_text.text == "vote 2"
+    assert ui.left_response_text.text == "two two"
+    assert ui.right_request_text.text == "prompt"
+    assert ui.updates.empty()
@@ -0,0 +1,47 @@
+import io
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from Aiden_API import HeadlessFrontend, handle_control
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def test_control_commands(make_agent, llm_server):
+    agent = make_agent(llm_server.api_config(), level="INFO")
+
+    assert handle_control(agent, "status")[1]["paused"] is True
+    assert handle_control(agent, "say ")[1] == {"ok": False, "error": "empty input"}
+    reply = handle_control(agent, "say What next?")[1]
+    assert reply["ok"] and reply["response"].startswith("{{#listmemoryfiles#}")
+    assert "Received from right (openrouter) LLM" in handle_control(agent, "tail 1")[1]["log"][0]
+    assert "aiden_turns_total" in handle_control(agent, "metrics")[1]["metrics"]
+    assert handle_control(agent, "bogus")[1]["ok"] is False
+
+    assert handle_control(agent, "resume") == (True, {"ok": True, "paused": False})
+    assert handle_control(agent, "say too late")[1]["ok"] is False  # Input only while paused
+    assert handle_control(agent, "pause")[1]["paused"] is True
+    assert handle_control(agent, "quit") == (False, {"ok": True})
+
+
+def test_frontend_echoes_log_lines(make_agent, llm_server):
+    stream = io.StringIO()
+    agent = make_agent(llm_server.api_config(), level="INFO")
+    agent.frontend = HeadlessFrontend(stream)
+    agent.log("Agent initialized (headless)")
+    assert stream.getvalue().endswith("] Agent initialized (headless)\n")
+
+
+def test_runs_without_a_gui_over_stdin(agent_dir, llm_server):
+    (agent_dir / "hemisphere_api.json").write_text(json.dumps(llm_server.api_config()), encoding="utf-8")
+    env = {k: v for k, v in os.environ.items() if k != "DISPLAY"}  # Tk could not start here
+    result = subprocess.run([sys.executable, str(REPO / "Aiden_API.py"), str(agent_dir), "--headless"],
+                            input="status\n\nquit\n", capture_output=True, text=True, timeout=60, env=env)
+    assert result.returncode == 0, result.stderr
+    replies = [json.loads(line) for line in result.stdout.splitlines()]
+    assert replies[0]["ok"] and replies[0]["base_dir"] == str(agent_dir)
+    assert replies[1] == {"ok": True}
+    assert "Agent initialized (headless)" in result.stderr
@@ -0,0 +1,48 @@
+import json
+import threading
+
+from Aiden_API import AgentLogger, metrics
+
+
+def dropped_total():
+    series = metrics.snapshot()["aiden_log_dropped_total"]["series"]
+    return sum(s["value"] for s in series)
+
+
+def test_records_are_written_in_order(tmp_path):
+    logger = AgentLogger(tmp_path, json_lines=True, flush_interval=0.01)
+    for i in range(3):
+        logger.log(f"record {i}", "WARNING" if i == 1 else "INFO")
+    logger.log("not written", "DEBUG")
+    logger.close()
+    assert [line.split("] ", 1)[1] for line in (tmp_path / "agent.log").read_text(encoding="utf-8").splitlines()] \
+        == ["record 0", "WARNING: record 1", "record 2"]
+    lines = (tmp_path / "agent.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["message"] for line in lines] == ["record 0", "record 1", "record 2"]
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking(tmp_path, wait_for):
+    logger = AgentLogger(tmp_path, queue_size=5, flush_interval=0.01)
+    stalled, release = threading.Event(), threading.Event()
+    real_write = logger._write
+
+    def stalled_write(records):  # A disk that stops answering
+        stalled.set()
+        release.wait(5)
+        real_write(records)
+
+    logger._write = stalled_write
+    logger.log("first")
+    wait_for(stalled.is_set)
+    before = dropped_total()
+    for i in range(20):
+        logger.log(f"record {i}")
+    assert logger.dropped == 15
+    assert dropped_total() - before == 15
+
+    release.set()
+    logger.close()
+    text = (tmp_path / "agent.log").read_text(encoding="utf-8")
+    assert "record 4" in text and "record 5" not in text
+    assert "WARNING: 15 log records dropped: log queue full" in text
+    assert logger.dropped == 0
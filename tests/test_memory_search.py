@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from Aiden_API import MAX_LIKE_SCAN_ROWS, init_memory_fts, pin_memory_rowids, search_memories
+
+ROWS = [
+    ("a", "notes", "A long day. We talked about the weather, the garden and, briefly, friendship.", "2024-01-01"),
+    ("b", "notes", "Friendship, friendship, friendship: the whole entry is about friendship.", "2024-01-02"),
+    ("c", "diary", "A note on friendship in the diary.", "2024-01-03"),
+    ("d", "notes", "Nothing relevant here.", "2024-01-04"),
+]
+
+
+@pytest.fixture
+def conn():
+    """A memories table filled before the full-text index and the seq key existed."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE memories (id TEXT PRIMARY KEY, category TEXT, content TEXT, timestamp TEXT)")
+    conn.executemany("INSERT INTO memories VALUES (?, ?, ?, ?)", ROWS)
+    conn.commit()
+    if not init_memory_fts(conn, rebuild=pin_memory_rowids(conn)):
+        pytest.skip("SQLite built without FTS5")
+    yield conn
+    conn.close()
+
+
+def ids(results):
+    return [result.split(" ", 1)[0] for result in results]
+
+
+def test_existing_rows_are_backfilled(conn):
+    assert sorted(ids(search_memories(conn, "friendship"))) == ["a", "b", "c"]
+
+
+def test_new_rows_are_indexed(conn):
+    conn.execute("INSERT INTO memories (id, category, content, timestamp) "
+                 "VALUES ('e', 'notes', 'Gardening tips', '2024-01-05')")
+    assert ids(search_memories(conn, "gardening")) == ["e"]
+    conn.execute("DELETE FROM memories WHERE id = 'e'")
+    assert search_memories(conn, "gardening") == []
+
+
+def test_ranked_by_bm25(conn):
+    assert ids(search_memories(conn, "friendship", "notes")) == ["b", "a"]
+
+
+def test_category_filter(conn):
+    assert ids(search_memories(conn, "friendship", "diary")) == ["c"]
+
+
+def test_partial_words_still_match(conn):
+    assert sorted(ids(search_memories(conn, "friend"))) == ["a", "b", "c"]  # Prefix of a word
+    assert ids(search_memories(conn, "ather")) == ["a"]  # Mid-word: LIKE fallback
+
+
+def test_query_syntax_is_quoted(conn):
+    assert search_memories(conn, 'friendship" OR "nothing') == []
+    assert search_memories(conn, "NEAR(friendship") == []
+
+
+def test_rowids_are_pinned_across_vacuum(conn):
+    assert not pin_memory_rowids(conn)  # Already migrated
+    conn.execute("DELETE FROM memories WHERE id = 'a'")
+    conn.commit()
+    conn.execute("VACUUM")
+    assert sorted(ids(search_memories(conn, "friendship"))) == ["b", "c"]
+    # Raises if the index no longer matches the rows it points at
+    conn.execute("INSERT INTO memories_fts(memories_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_substring_fallback_scans_only_the_newest_rows(conn):
+    conn.executemany("INSERT INTO memories (id, category, content, timestamp) VALUES (?, 'bulk', 'filler', ?)",
+                     [(f"bulk{i}", f"2025-{i:06d}") for i in range(MAX_LIKE_SCAN_ROWS)])
+    assert search_memories(conn, "ather") == []  # Row 'a' is older than the scan window
+    assert ids(search_memories(conn, "ather", "notes")) == ["a"]
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+import Aiden_API
+from Aiden_API import Metrics, MetricsExporter, metrics
+
+requests = pytest.importorskip("requests")
+
+
+def value(name, **labels):
+    """Current value of one series of the process-wide registry (count for histograms)."""
+    for series in metrics.snapshot()[name]["series"]:
+        if series["labels"] == labels:
+            return series.get("count", series.get("value"))
+    return 0
+
+
+@pytest.fixture
+def registry():
+    registry = Metrics()
+    registry.describe("calls_total", "counter", "Calls.")
+    registry.describe("call_seconds", "histogram", "Call latency.", (0.1, 1))
+    return registry
+
+
+def test_counters_and_histograms(registry):
+    registry.inc("calls_total", model="a")
+    registry.inc("calls_total", 2, model="a")
+    registry.inc("calls_total", model="b")
+    for seconds in (0.05, 0.5, 5):
+        registry.observe("call_seconds", seconds)
+    snapshot = registry.snapshot()
+    assert {s["labels"]["model"]: s["value"] for s in snapshot["calls_total"]["series"]} == {"a": 3, "b": 1}
+    histogram = snapshot["call_seconds"]["series"][0]
+    assert histogram["buckets"] == {"0.1": 1, "1": 2}  # Cumulative, as Prometheus expects
+    assert histogram["count"] == 3 and histogram["sum"] == pytest.approx(5.55)
+
+
+def test_prometheus_text(registry):
+    registry.inc("calls_total", model='say "hi"\n')
+    registry.observe("call_seconds", 0.5)
+    text = registry.render_prometheus()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{model="say \\"hi\\"\\n"} 1' in text
+    assert 'call_seconds_bucket{le="0.1"} 0' in text
+    assert 'call_seconds_bucket{le="+Inf"} 1' in text
+    assert "call_seconds_count 1" in text
+
+
+def test_exporter_serves_text_and_json_and_writes_snapshots(registry, tmp_path):
+    registry.inc("calls_total")
+    exporter = MetricsExporter.from_config(registry, {"port": 0, "snapshot_path": "metrics.json",
+                                                      "snapshot_interval": 60}, tmp_path)
+    try:
+        url = "http://%s:%d" % exporter.httpd.server_address[:2]
+        assert "calls_total 1" in requests.get(f"{url}/metrics", timeout=5).text
+        assert requests.get(f"{url}/metrics.json", timeout=5).json()["calls_total"]["series"][0]["value"] == 1
+        assert requests.get(f"{url}/other", timeout=5).status_code == 404
+    finally:
+        exporter.close()
+    snapshot = json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    assert snapshot["metrics"]["calls_total"]["series"][0]["value"] == 1
+    assert MetricsExporter.from_config(registry, {}, tmp_path) is None
+
+
+def test_turn_records_latency_tokens_and_phases(make_agent, llm_server):
+    agent = make_agent(llm_server.api_config())
+    labels = {"hemisphere": "right", "model": "stub-right"}
+    before = {name: value(name, **labels) for name in (
+        "aiden_llm_request_seconds", "aiden_llm_prompt_tokens_total", "aiden_llm_completion_tokens_total")}
+    executed = value("aiden_turns_total", outcome="executed")
+    commands = value("aiden_command_seconds", verb="listmemoryfiles")
+    rounds = value("aiden_agreement_rounds", mode="sequential")
+
+    response = Aiden_API.interact_with_llm(agent, "right", agent.init_prompt)
+    agent.loop.turn(response)
+
+    assert value("aiden_llm_request_seconds", **labels) - before["aiden_llm_request_seconds"] == 2
+    assert value("aiden_llm_prompt_tokens_total", **labels) > before["aiden_llm_prompt_tokens_total"]
+    assert value("aiden_llm_completion_tokens_total", **labels) > before["aiden_llm_completion_tokens_total"]
+    assert value("aiden_turns_total", outcome="executed") == executed + 1
+    assert value("aiden_command_seconds", verb="listmemoryfiles") == commands + 1
+    assert value("aiden_agreement_rounds", mode="sequential") == rounds + 1
+    assert value("aiden_turn_phase_seconds", phase="verify") > 0
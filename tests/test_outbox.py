@@ -0,0 +1,100 @@
+import sqlite3
+import time
+
+import pytest
+
+from Aiden_API import MailOutbox
+from stub_smtp_server import StubSMTPServer
+
+FAST_RETRY = {"starttls": False, "retry_base": 0.05, "poll_interval": 0.05, "timeout": 2}
+
+
+def rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT to_addr, status, attempts FROM outbox ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def smtp_server():
+    server = StubSMTPServer(seed=1).start()
+    yield server
+    server.stop()
+
+
+def open_outbox(db_path, server, **config):
+    host, port = server.address
+    return MailOutbox.from_config(db_path, host, port, "user", "secret", dict(FAST_RETRY, **config))
+
+
+def test_batch_is_sent_over_one_connection(tmp_path, smtp_server, wait_for):
+    outbox = open_outbox(tmp_path / "outbox.db", smtp_server)
+    try:
+        for i in range(5):
+            outbox.enqueue("aiden@example.com", f"reader{i}@example.com", "Book 1", "Once upon a time")
+        wait_for(lambda: outbox.stats() == {"sent": 5})
+    finally:
+        outbox.close()
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 5
+
+
+def test_temporary_failure_is_retried(tmp_path, smtp_server, wait_for):
+    smtp_server.behavior["fail_rate"] = 1.0
+    outbox = open_outbox(tmp_path / "outbox.db", smtp_server)
+    try:
+        outbox.enqueue("aiden@example.com", "reader@example.com", "Book 1", "text")
+        wait_for(lambda: rows(tmp_path / "outbox.db")[0][2] >= 1)
+        assert outbox.stats() == {"queued": 1}
+        smtp_server.behavior["fail_rate"] = 0.0
+        wait_for(lambda: outbox.stats() == {"sent": 1})
+    finally:
+        outbox.close()
+    assert rows(tmp_path / "outbox.db")[0][2] >= 2
+
+
+def test_refused_recipient_fails_without_retry(tmp_path, smtp_server, wait_for):
+    smtp_server.behavior["reject"] = ["nobody@example.com"]
+    outbox = open_outbox(tmp_path / "outbox.db", smtp_server)
+    try:
+        outbox.enqueue("aiden@example.com", "nobody@example.com", "Book 1", "text")
+        wait_for(lambda: outbox.stats() == {"failed": 1})
+        time.sleep(0.2)
+    finally:
+        outbox.close()
+    assert rows(tmp_path / "outbox.db") == [("nobody@example.com", "failed", 1)]
+
+
+def test_dropped_connections_are_reopened(tmp_path, smtp_server, wait_for):
+    smtp_server.behavior["drop_after"] = 1
+    outbox = open_outbox(tmp_path / "outbox.db", smtp_server)
+    try:
+        for i in range(3):
+            outbox.enqueue("aiden@example.com", f"reader{i}@example.com", "Book 1", "text")
+        wait_for(lambda: outbox.stats() == {"sent": 3})
+    finally:
+        outbox.close()
+    assert smtp_server.connections == 3
+
+
+def test_queue_survives_restart(tmp_path, wait_for):
+    server = StubSMTPServer().start()
+    host, port = server.address
+    server.stop()  # Nothing listening: the first attempt fails
+    outbox = MailOutbox.from_config(tmp_path / "outbox.db", host, port, "user", "secret", FAST_RETRY)
+    try:
+        outbox.enqueue("aiden@example.com", "reader@example.com", "Book 1", "text")
+        wait_for(lambda: rows(tmp_path / "outbox.db")[0][2] >= 1)
+    finally:
+        outbox.close()
+
+    server = StubSMTPServer(port=port).start()
+    outbox = MailOutbox.from_config(tmp_path / "outbox.db", host, port, "user", "secret", FAST_RETRY)
+    try:
+        wait_for(lambda: outbox.stats() == {"sent": 1})
+    finally:
+        outbox.close()
+        server.stop()
+    assert len(server.messages) == 1
@@ -0,0 +1,54 @@
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from Aiden_API import ProviderClient, openrouter_infer  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    client = ProviderClient(pool_size=4)
+    yield client
+    client.close()
+
+
+def chat(server, **model):
+    model_info = dict(server.api_config()["right"], **model)
+    return model_info, f"{model_info['api_url']}/chat/completions"
+
+
+def test_one_session_per_endpoint_and_pool_size(client):
+    session = client.session_for("https://api.example.com/v1/chat")
+    assert client.session_for("https://api.example.com/v2/other") is session
+    assert client.session_for("https://other.example.com/v1") is not session
+    assert client.session_for("https://api.example.com/v1", pool_size=16) is not session
+    assert client.session_for("https://api.example.com/v1", pool_size=4) is session  # The client default
+    adapter = client.session_for("https://api.example.com/v1", pool_size=16).get_adapter("https://api.example.com")
+    assert adapter._pool_maxsize == 16
+
+
+def test_calls_reuse_one_connection(client, llm_server):
+    model_info, url = chat(llm_server)
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "ping"}]}
+    for _ in range(5):
+        assert client.post(model_info, url, {}, payload).status_code == 200
+    pools = client.session_for(url).get_adapter(url).poolmanager.pools
+    assert sum(pools[key].num_connections for key in pools.keys()) == 1
+
+
+def test_gzip_request_body(client, llm_server):
+    model_info, url = chat(llm_server, gzip=True)
+    response = client.post(model_info, url, {}, {"messages": [{"role": "user", "content": "ping"}]})
+    assert response.request.headers["Content-Encoding"] == "gzip"
+    assert response.json()["choices"][0]["message"]["content"].startswith("{{#listmemoryfiles#}")
+
+
+def test_read_timeout_comes_from_the_model(client, start_llm_server):
+    model_info, url = chat(start_llm_server({"latency": 0.5}), read_timeout=0.1)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.post(model_info, url, {}, {"messages": [{"role": "user", "content": "ping"}]})
+
+
+def test_providers_use_the_shared_client(llm_server):
+    model_info = llm_server.api_config()["right"]
+    assert openrouter_infer(model_info, "ping").startswith("{{#listmemoryfiles#}")
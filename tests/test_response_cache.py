@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+import Aiden_API
+from Aiden_API import ResponseCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResponseCache()
+    monkeypatch.setattr(Aiden_API, "response_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def start_agent(make_agent, start_llm_server):
+    """start_agent(behavior, **model): a stub server and an agent using it, with model settings applied."""
+    def start(behavior, **model):
+        server = start_llm_server(behavior, seed=1)
+        return server, make_agent(server.api_config(**model))
+    return start
+
+
+def test_key_covers_model_and_prompt():
+    info = {"provider": "openrouter", "model": "a", "parameters": {"temperature": 0}}
+    key = ResponseCache.make_key(info, "hello")
+    assert key == ResponseCache.make_key(dict(info), "hello")
+    assert key != ResponseCache.make_key(info, "hello!")
+    assert key != ResponseCache.make_key(dict(info, model="b"), "hello")
+
+
+def test_expiry_and_lru_bound():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1", ttl=0.05)
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    cache.put("c", "3")
+    cache.put("d", "4")
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    cache = ResponseCache()
+    cache.open_db(tmp_path / "llm_cache.db")
+    cache.put("key", "reply")
+    cache.conn.close()
+    reopened = ResponseCache()
+    reopened.open_db(tmp_path / "llm_cache.db")
+    assert reopened.get("key") == "reply"
+
+
+def test_repeated_prompt_is_answered_from_cache(start_agent, cache):
+    server, agent = start_agent({}, cache=True)
+    first = Aiden_API.interact_with_llm(agent, "right", agent.init_prompt)
+    assert Aiden_API.interact_with_llm(agent, "right", agent.init_prompt) == first
+    assert server.requests == 1
+
+
+def test_bad_command_correction_is_never_cached(start_agent, cache):
+    server, agent = start_agent({"malformed_rate": 1.0}, cache=True)
+    response = Aiden_API.interact_with_llm(agent, "right", agent.init_prompt)
+    for turn in range(1, 6):
+        response = agent.loop.turn(response)
+        assert agent.loop.last_turn["outcome"] == "bad_command"
+        assert server.requests == 1 + turn  # Every correction reaches the LLM
+
+
+def test_disagreement_retries_are_never_cached(start_agent, cache):
+    behavior = {"left_mode": "disagree", "right_commands": ["{{#listmemoryfiles#}all[END_CMD]"]}
+    server, agent = start_agent(behavior, parameters={"temperature": 0})
+    response = Aiden_API.interact_with_llm(agent, "right", agent.init_prompt)
+    before = server.requests
+    agent.loop.turn(response)
+    assert server.requests - before == 6  # 5 left rounds and the right correction
+    before = server.requests
+    agent.loop.turn(response)
+    assert agent.loop.last_turn["outcome"] == "no_agreement"
+    assert server.requests - before == 5  # Only the first left prompt is a cache hit
+
+
+def test_cancelled_stream_is_not_cached(start_agent, cache):
+    server, agent = start_agent({}, cache=True, stream=True)
+    cancel = threading.Event()
+    cancel.set()
+    response = Aiden_API.interact_with_llm(agent, "left", "Say something long", cancel, use_context=False)
+    assert isinstance(response, Aiden_API.LLMError)
+    assert cache.stats()["entries"] == 0
+
+
+def test_parallel_votes_are_never_cached(start_agent, cache):
+    server, agent = start_agent({}, cache=True, parameters={"temperature": 0})
+    agent.api_config["left"].update(verify_mode="parallel", verify_fanout=3, verify_quorum=3)
+    for _ in range(2):
+        before = server.requests
+        assert agent.loop.verify("listmemoryfiles", "all")[0]
+        assert server.requests - before == 3  # Each vote is a separate LLM answer
+    assert cache.stats()["hits"] == 0
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from Aiden_API import LLMScheduler
+
+
+def test_global_concurrency_limit():
+    scheduler = LLMScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    active = [0, 0]  # current, peak
+
+    def call():
+        with scheduler.slot("s1", "openrouter"):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert active[1] == 2
+    assert scheduler.stats() == {"active": 0, "active_by_provider": {"openrouter": 0}, "waiting": 0}
+
+
+def test_waiting_calls_are_granted_round_robin(wait_for):
+    scheduler = LLMScheduler(max_concurrency=1)
+    release = threading.Event()
+    order = []
+
+    def holder():
+        with scheduler.slot("holder", "p"):
+            release.wait()
+
+    def call(session):
+        with scheduler.slot(session, "p"):
+            order.append(session)
+
+    threading.Thread(target=holder).start()
+    wait_for(lambda: scheduler.stats()["active"] == 1)
+    threads = []
+    for session in ("busy", "busy", "busy", "quiet"):
+        threads.append(threading.Thread(target=call, args=(session,)))
+        threads[-1].start()
+        wait_for(lambda: scheduler.stats()["waiting"] == len(threads))
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert order == ["busy", "quiet", "busy", "busy"]
+
+
+def test_provider_rate_limit():
+    scheduler = LLMScheduler(provider_limits={"p": {"rate": 50, "burst": 1}})
+    start = time.monotonic()
+    for _ in range(6):
+        with scheduler.slot("s1", "p"):
+            pass
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+    with scheduler.slot("s1", "other"):  # Unlimited provider is not held back
+        pass
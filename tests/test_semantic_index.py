@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import Aiden_API  # noqa: E402
+from Aiden_API import SemanticIndex, recall_memories  # noqa: E402
+
+ROWS = [
+    ("garden", "notes", "Planted tomatoes and basil in the garden beds today."),
+    ("email", "notes", "Sent the quarterly report by email to the finance team."),
+    ("music", "diary", "Practised the piano sonata for an hour after dinner."),
+]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE memories (id TEXT PRIMARY KEY, category TEXT, content TEXT, timestamp TEXT)")
+    conn.executemany("INSERT INTO memories VALUES (?, ?, ?, '2024-01-01')", ROWS)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_sync_indexes_existing_memories(conn, tmp_path):
+    path = tmp_path / "memory_vectors.f32"
+    index = SemanticIndex(conn, path)
+    assert conn.execute("SELECT COUNT(*) FROM memory_vectors").fetchone()[0] == len(ROWS)
+    assert path.stat().st_size == len(ROWS) * index.dim * 4
+
+    conn.execute("INSERT INTO memories VALUES ('late', 'notes', 'Added while the agent was down.', '2024-01-02')")
+    index = SemanticIndex(conn, path)
+    assert path.stat().st_size == (len(ROWS) + 1) * index.dim * 4
+
+
+def test_damaged_matrix_is_rebuilt_from_the_db(conn, tmp_path):
+    path = tmp_path / "memory_vectors.f32"
+    SemanticIndex(conn, path)
+    expected = path.read_bytes()
+    path.write_bytes(expected[:100])  # Truncated by a crash mid-append
+    index = SemanticIndex(conn, path)
+    assert path.read_bytes() == expected
+    assert index.search("tomatoes in the garden", 1)[0][0] == "garden"
+
+
+def test_top_k_is_ranked_by_similarity(conn, tmp_path):
+    index = SemanticIndex(conn, tmp_path / "memory_vectors.f32")
+    hits = index.search("piano practice", 2)
+    assert len(hits) == 2
+    assert hits[0][0] == "music"
+    assert hits[0][1] >= hits[1][1]
+    results = recall_memories(conn, index, "emailed the report", 1)
+    assert len(results) == 1 and results[0].startswith("email [notes]")
+
+
+def test_matrix_file_stays_out_of_memory_dir(agent_dir, make_agent, llm_server):
+    agent = make_agent(llm_server.api_config())
+    agent.add_memory("notes", "Something to index")
+    assert (agent_dir / "memory_vectors.f32").exists()
+    assert "memory_vectors.f32" not in Aiden_API.run_command(agent, "listmemoryfiles", "all")
@@ -0,0 +1,83 @@
+import json
+import shutil
+import threading
+
+import pytest
+
+import Aiden_API
+from Aiden_API import LLMScheduler, SessionManager
+
+
+@pytest.fixture
+def session_dir(agent_dir, llm_server):
+    (agent_dir / "hemisphere_api.json").write_text(json.dumps(llm_server.api_config()), encoding="utf-8")
+    (agent_dir / "hemisphere.json").write_text(json.dumps({"logging": {"level": "ERROR"}}), encoding="utf-8")
+    return agent_dir
+
+
+@pytest.fixture
+def manager():
+    manager = SessionManager(LLMScheduler(max_concurrency=4))
+    yield manager
+    manager.close()
+
+
+def test_racing_adds_start_one_agent(manager, session_dir, monkeypatch):
+    real_read = Aiden_API.read_configs
+    both_reading = threading.Barrier(2, timeout=1)
+
+    def read_configs(base_dir):
+        try:
+            both_reading.wait()  # Only reached by both if the name was not reserved
+        except threading.BrokenBarrierError:
+            pass
+        return real_read(base_dir)
+
+    monkeypatch.setattr(Aiden_API, "read_configs", read_configs)
+    results = []
+
+    def add():
+        try:
+            results.append(manager.add("book1", session_dir))
+        except ValueError as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=add) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(type(r).__name__ for r in results) == ["Agent", "ValueError"]
+    assert list(manager.sessions) == ["book1"]
+
+
+def test_failed_add_frees_the_name(manager, session_dir, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        manager.add("book1", tmp_path / "missing")
+    assert manager.add("book1", session_dir).session_id == "book1"
+
+
+def test_bad_session_configs_are_skipped(session_dir, tmp_path, monkeypatch, capsys):
+    broken = tmp_path / "broken"
+    shutil.copytree(session_dir, broken)
+    (broken / "hemisphere_api.json").write_text("{not json", encoding="utf-8")
+    no_prompts = tmp_path / "no_prompts"
+    shutil.copytree(session_dir, no_prompts)
+    (no_prompts / "memory" / "agent_init.txt").unlink()
+    manifest = tmp_path / "sessions.json"
+    manifest.write_text(json.dumps({"sessions": {
+        "good": {"dir": str(session_dir)},
+        "broken": {"dir": str(broken)},
+        "missing": {"dir": str(tmp_path / "missing")},
+        "no_dir": {},
+        "no_prompts": {"dir": str(no_prompts)},
+    }}), encoding="utf-8")
+    replies = []
+    monkeypatch.setattr(Aiden_API, "serve_control_stdin", lambda handle: replies.append(handle("sessions")[1]))
+
+    Aiden_API.run_sessions(manifest)
+
+    assert list(replies[0]["sessions"]) == ["good"]
+    errors = capsys.readouterr().err
+    for name in ("broken", "missing", "no_dir", "no_prompts"):
+        assert f"Skipping session '{name}'" in errors
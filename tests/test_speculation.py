@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import Aiden_API
+
+LIST_RESPONSE = "{{#listmemoryfiles#}all[END_CMD]"
+
+
+@pytest.fixture
+def start_agent(make_agent, start_llm_server):
+    """start_agent(behavior, max_batch=1): an agent logging at INFO on its own stub server."""
+    def start(behavior, max_batch=1):
+        api_config = start_llm_server(behavior).api_config()
+        api_config["right"]["max_batch"] = max_batch
+        return make_agent(api_config, level="INFO")
+    return start
+
+
+def count_runs(monkeypatch):
+    """Count run_command calls per verb."""
+    runs = {}
+    lock = threading.Lock()
+    real_run = Aiden_API.run_command
+
+    def run(agent, command, args):
+        with lock:
+            runs[command] = runs.get(command, 0) + 1
+        return real_run(agent, command, args)
+
+    monkeypatch.setattr(Aiden_API, "run_command", run)
+    return runs
+
+
+def test_agreed_speculation_is_committed_without_running_again(start_agent, monkeypatch):
+    runs = count_runs(monkeypatch)
+    agent = start_agent({"latency": 0.05})
+    agent.loop.turn(LIST_RESPONSE)
+    assert agent.loop.last_turn["outcome"] == "executed"
+    assert runs == {"listmemoryfiles": 1}
+    assert any("Using speculative result for listmemoryfiles" in line for line in agent.log_lines)
+
+
+def test_disagreed_speculation_is_discarded(start_agent, monkeypatch):
+    agent = start_agent({"left_mode": "disagree"})
+    discarded = []
+    real_discard = agent.loop.discard
+    monkeypatch.setattr(agent.loop, "discard", lambda speculation: (discarded.append(speculation),
+                                                                    real_discard(speculation)))
+    agent.loop.turn(LIST_RESPONSE)
+    assert agent.loop.last_turn["outcome"] == "no_agreement"
+    assert [list(speculation) for speculation in discarded] == [[0]]
+    assert not any("Using speculative result" in line for line in agent.log_lines)
+
+
+def test_read_after_a_write_in_the_same_batch_is_not_speculated(start_agent):
+    agent = start_agent({}, max_batch=4)
+    commands = [("getfilecontent", "notes.txt"), ("writeflatfile", "notes.txt|new text|false"),
+                ("getfilecontent", "notes.txt"), ("getfilecontent", "other.txt"), ("listmemoryfiles", "all")]
+    speculation = agent.loop.speculate(commands)
+    agent.loop.discard(speculation)
+    # The write touches the file listing too, so only the reads it cannot affect start early
+    assert sorted(speculation) == [0, 3]
+
+
+def test_read_after_runcommand_is_not_speculated(start_agent):
+    agent = start_agent({}, max_batch=4)
+    commands = [("listmemoryfiles", "all"), ("runcommand", "script.py"), ("searchmemory", "ALL|note"),
+                ("getfilecontent", "notes.txt")]
+    speculation = agent.loop.speculate(commands)
+    agent.loop.discard(speculation)
+    assert sorted(speculation) == [0]
+
+
+def test_speculation_cancelled_by_stop_runs_the_command_instead(start_agent, monkeypatch):
+    runs = count_runs(monkeypatch)
+    agent = start_agent({})
+    speculated = Future()
+    speculated.cancel()  # What stop() leaves behind for a speculation that had not started
+    result = agent.loop.execute("listmemoryfiles", "all", speculated)
+    assert "agent_init.txt" in result
+    assert runs == {"listmemoryfiles": 1}
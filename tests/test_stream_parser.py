@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+import Aiden_API
+from Aiden_API import CommandStreamParser
+from stub_llm_server import StubLLMServer
+
+
+def feed_all(parser, chunks):
+    return [parser.feed(chunk) for chunk in chunks]
+
+
+def test_detects_command_split_across_chunks():
+    parser = CommandStreamParser()
+    done = feed_all(parser, ["{{#file", "write#}memory|a.txt|hi[END", "_CM", "D", "]", " trailing chatter"])
+    assert done == [False, False, False, False, True, True]
+    assert parser.text == "{{#filewrite#}memory|a.txt|hi[END_CMD]"
+    assert parser.match.group(1) == "filewrite"
+
+
+def test_waits_for_closing_bracket():
+    parser = CommandStreamParser()
+    assert not parser.feed("{{#listmemoryfiles#}all[END_CMD")
+    assert parser.feed("]")
+
+
+def test_text_without_command():
+    parser = CommandStreamParser()
+    assert not any(feed_all(parser, ["Sure, ", "END_CMD is ", "how commands end."]))
+    assert parser.match is None
+    assert parser.text == "Sure, END_CMD is how commands end."
+
+
+def test_keeps_whole_batch_when_not_stopping():
+    parser = CommandStreamParser(stop_at_command=False)
+    chunks = ["{{#listmemoryfiles#}all[END_CMD]\n", "{{#getfilecontent#}a.txt", "[END_CMD]"]
+    assert feed_all(parser, chunks) == [True, True, True]
+    assert parser.text == "".join(chunks)
+
+
+@pytest.mark.parametrize("chunked", [True, False])
+@pytest.mark.parametrize("provider", ["openrouter", "huggingface"])
+def test_stream_stops_as_soon_as_the_command_arrives(provider, chunked):
+    # 8 pieces of command, then 12 of chatter, 0.1 s apart: well under the 512 bytes a buffered read waits for.
+    # The command is complete after the 8th piece (~0.7 s); allow one more piece at most
+    behavior = {"right_commands": ["{{#listmemoryfiles#}all[END_CMD]"], "chatter": " and more" * 5,
+                "stream_delay": 0.1, "chunked": chunked}
+    server = StubLLMServer(behavior).start()
+    try:
+        model_info = server.api_config(stream=True)["right"]
+        if provider == "huggingface":
+            model_info.update(provider="huggingface", api_url=f"{server.url}/models/stub-right")
+        infer = Aiden_API.openrouter_infer if provider == "openrouter" else Aiden_API.hf_infer
+        start = time.perf_counter()
+        text = infer(model_info, "Write the book.")
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+    assert text == "{{#listmemoryfiles#}all[END_CMD]"
+    assert elapsed < 0.85
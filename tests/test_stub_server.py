@@ -0,0 +1,57 @@
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import bench_turns  # noqa: E402
+from Aiden_API import hf_infer  # noqa: E402
+
+VERIFY = "Echo the command if you agree.\nCommand from right LLM: {#listmemoryfiles#}all{END_CMD}"
+
+
+def chat(server, prompt):
+    response = requests.post(f"{server.url}/v1/chat/completions", timeout=10,
+                             json={"messages": [{"role": "user", "content": prompt}]})
+    return response.status_code, response.json()
+
+
+def test_response_shapes(start_llm_server):
+    server = start_llm_server({"right_batch": 2}, seed=1)
+    status, body = chat(server, "Start.")
+    assert status == 200
+    assert body["choices"][0]["message"]["content"] == (
+        "{{#listmemoryfiles#}all[END_CMD]\n{{#getfilecontent#}notes.txt[END_CMD]")
+    assert set(body["usage"]) == {"prompt_tokens", "completion_tokens"}
+    hf = requests.post(f"{server.url}/models/stub", json={"inputs": "Start."}, timeout=10).json()
+    assert hf[0]["generated_text"].startswith("{{#searchmemory#}")
+    hf_model = {"provider": "huggingface", "api_url": f"{server.url}/models/stub", "api_token": "stub"}
+    assert hf_infer(dict(hf_model, stream=True), "Start.").startswith("{{#listmemoryfiles#}")
+
+
+def test_left_modes(start_llm_server):
+    server = start_llm_server({"left_mode": "disagree_n", "disagree_n": 2})
+    replies = [chat(server, VERIFY)[1]["choices"][0]["message"]["content"] for _ in range(3)]
+    assert replies[:2] == ["Disagree: stub wants another look."] * 2
+    assert replies[2] == "{{#listmemoryfiles#}all[END_CMD]"
+
+
+def test_errors_and_malformed_replies(start_llm_server):
+    assert chat(start_llm_server({"error_rate": 1.0}), "Start.")[0] == 503
+    reply = chat(start_llm_server({"malformed_rate": 1.0}), "Start.")[1]["choices"][0]["message"]["content"]
+    assert "END_CMD" not in reply
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert bench_turns.percentile(values, 50) == 50
+    assert bench_turns.percentile(values, 99) == 99
+    assert bench_turns.percentile([], 99) == 0.0
+
+
+def test_scenarios_report_turns_and_phases():
+    agree = bench_turns.run_scenario("always_agree", bench_turns.SCENARIOS["always_agree"], 5, 0, 0, 0)
+    assert agree["turns"] == 5 and agree["outcomes"] == {"executed": 5}
+    assert agree["turns_per_sec"] > 0 and agree["p99_ms"] >= agree["p50_ms"] > 0
+    assert {"verify", "execute"} <= set(agree["phases_ms"])
+    disagree = bench_turns.run_scenario("disagree_5_loops", bench_turns.SCENARIOS["disagree_5_loops"], 2, 0, 0, 0)
+    assert disagree["outcomes"] == {"no_agreement": 2}
+    assert disagree["commands"] == 0
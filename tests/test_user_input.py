@@ -0,0 +1,35 @@
+import threading
+import time
+
+import Aiden_API
+
+
+def test_user_inputs_are_sent_one_at_a_time_in_order(make_agent, llm_server, monkeypatch, wait_for):
+    agent = make_agent(llm_server.api_config())
+    sent, threads = [], set()
+    active = []
+
+    def interact(agent, hemisphere, user_input, *args, **kwargs):
+        active.append(user_input)
+        assert len(active) == 1  # Never two inputs in flight
+        threads.add(threading.current_thread())
+        time.sleep(0.05 if user_input == "first" else 0)  # A slow first call must not be overtaken
+        sent.append(user_input)
+        active.remove(user_input)
+        return f"reply to {user_input}"
+
+    monkeypatch.setattr(Aiden_API, "interact_with_llm", interact)
+    for text in ("first", "second", "  ", "third"):
+        agent.post_user_input(text)
+    wait_for(lambda: len(sent) == 3)
+    assert sent == ["first", "second", "third"]
+    assert len(threads) == 1 and threading.main_thread() not in threads
+    responses = [agent.loop.inbox.get_nowait() for _ in range(agent.loop.inbox.qsize())]
+    assert responses == [("response", f"reply to {text}") for text in sent]
+
+
+def test_input_is_ignored_while_running(make_agent, llm_server):
+    agent = make_agent(llm_server.api_config())
+    agent.paused = False
+    agent.post_user_input("hello")
+    assert agent.user_inputs.empty()
@@ -0,0 +1,29 @@
+import time
+
+from Aiden_API import LLMError, LLMScheduler
+
+
+def test_parallel_stragglers_are_not_sent_once_decided(make_agent, start_llm_server):
+    server = start_llm_server({"latency": 0.2})
+    api_config = server.api_config()
+    api_config["left"].update(verify_mode="parallel", verify_fanout=4, verify_quorum=1)
+    agent = make_agent(api_config, scheduler=LLMScheduler(max_concurrency=1))
+    agreed, _ = agent.loop.verify("listmemoryfiles", "all")
+    assert agreed
+    time.sleep(1.5)
+    # The slot frees just before the quorum is seen, so at most one queued call slips through
+    assert server.requests <= 2
+
+
+def test_unreachable_nodes_cast_no_vote(make_agent, llm_server):
+    api_config = llm_server.api_config()
+    api_config["left_down"] = dict(api_config["left"], api_url="http://127.0.0.1:1/v1", retries=0)
+    api_config["left"].update(verify_mode="parallel", verify_fanout=3, verify_quorum=2,
+                              verify_nodes=["left_down", "left", "left"])
+    agent = make_agent(api_config)
+    assert agent.loop.verify("listmemoryfiles", "all")[0]
+
+    api_config["left"]["verify_nodes"] = ["left_down"]
+    agreed, left_response = agent.loop.verify("listmemoryfiles", "all")
+    assert not agreed
+    assert isinstance(left_response, LLMError)  # Reported as unreachable, not as a disagreement